@@ -1,10 +1,14 @@
 """
 Stores content shared across agent classes + files.
 """
+from collections import deque
+
 import mesa
 import numpy as np
 from scipy.optimize import leastsq
 
+from peripherals.radio import makeSerializeable
+
 def try_getting(obj, *keys, default=None):
     """Helper that tries to get a value from a nested dict."""
     for key in keys:
@@ -15,6 +19,42 @@ def try_getting(obj, *keys, default=None):
     return obj
 
 
+class AgentHistory:
+    """
+    Ring buffer holding the recent history of an agent, for the visualization + rssi_find_router_target().
+
+    Each step only stores raw values:  the agent's position, its neighborhood (the list returned by
+    model.get_neighbors(), which is never modified) and a dict of counts.  The serialized history is only built
+    when get_state() is called, i.e. by the visualization.  If the history is disabled, nothing is stored.
+    """
+    def __init__(self, max_length, enabled=True):
+        self.entries = deque(maxlen=max_length)  # (pos, neighborhood, counts) of each step, oldest first
+        self.enabled = enabled
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, pos, neighborhood, counts=None):
+        if self.enabled:
+            self.entries.append((pos, neighborhood, counts))
+
+    def get_state(self):
+        """Returns the history as a list of dicts, oldest first, in the format used by the visualization"""
+        state = []
+        for pos, neighborhood, counts in self.entries:
+            entry = {
+                "pos": pos,
+                "radio": {"neighborhood": makeSerializeable(neighborhood)},
+            }
+            if counts is not None:
+                entry.update(counts)
+            state.append(entry)
+        return state
+
+
 def rssi_find_router_target(agent: mesa.Agent):
     target = agent.special_behavior["options"]["target_id"]
 
@@ -25,17 +65,16 @@ def rssi_find_router_target(agent: mesa.Agent):
     # 1. Create a matrix with previous data
     positions = []
     rssis = []
-    for h in agent.history:
-        if "neighborhood" in h["radio"]:
-            for n in h["radio"]["neighborhood"]:
-                # if desired_target_agent_type is not None + n is not of desired_target_agent_type,
-                # skip n.
-                if n["id"] not in agent.model.router_agents.keys():
-                    continue
-
-                if n["id"] == target or target == "all":
-                    positions.append(h["pos"])
-                    rssis.append(n["rssi"])
+    for pos, neighborhood, _ in agent.history:
+        for n in neighborhood:
+            # if desired_target_agent_type is not None + n is not of desired_target_agent_type,
+            # skip n.
+            if n["id"] not in agent.model.router_agents.keys():
+                continue
+
+            if n["id"] == target or target == "all":
+                positions.append(pos)
+                rssis.append(n["rssi"])
 
     positions = np.array(positions[-100:])
     rssis = np.array(rssis[-100:])
@@ -10,7 +10,7 @@ from enum import Enum
 
 import mesa
 
-from agent.agent_common import try_getting, rssi_find_router_target
+from agent.agent_common import AgentHistory, try_getting, rssi_find_router_target
 from payload import ClientBeaconPayload
 from peripherals.movement import Movement
 from peripherals.radio import Radio
@@ -37,7 +37,9 @@ class ClientAgent(mesa.Agent):
     def __init__(self, model, node_options):
         super().__init__(node_options["id"], model)
         self.name = try_getting(node_options, "name", default=None)
-        self.history = []
+        # always recorded (even without record_history), since rssi_find_router_target() steers by it.  only raw
+        # entries are stored, so this is cheap unless the visualization asks for the serialized history.
+        self.history = AgentHistory(self.MAX_HISTORY_LENGTH)
         self.mode = ClientAgentMode.WORKING
         self.working_steps_remaining = self.RECONNECTION_INTERVAL
         self.special_behavior = try_getting(node_options, "special_behavior", default=None)
@@ -48,11 +50,7 @@ class ClientAgent(mesa.Agent):
         self.payload_handler = ClientClientPayloadHandler(self.unique_id, model)
 
     def update_history(self):
-        self.history.append({
-            "pos": self.pos,
-            "radio": self.radio.get_state()
-        })
-        self.history = self.history[-self.MAX_HISTORY_LENGTH:]
+        self.history.append(self.pos, self.radio.neighborhood)
 
     def step(self):
         # update the history.
@@ -201,14 +199,13 @@ class ClientAgent(mesa.Agent):
             }
             return
 
-    def get_state(self):
+    def get_state(self, include_history=True):
         curr_stored_payloads = []
         for p in self.payload_handler.payloads_to_send:
             curr_stored_payloads.append(p.serialize())
         state = {
             "id": self.unique_id,
             "pos": self.pos,
-            "history": self.history,
             "radio": self.radio.get_state(),
             "total_pay_recv":  self.payload_handler.num_payloads_received,
             "pay_recv_latencies":  self.payload_handler.received_payload_latencies,
@@ -220,4 +217,6 @@ class ClientAgent(mesa.Agent):
         }
         if self.name:
             state["name"] = self.name
+        if include_history:
+            state["history"] = self.history.get_state()
         return state
\ No newline at end of file
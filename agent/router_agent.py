@@ -2,9 +2,8 @@ from enum import Enum
 
 import mesa
 
-from agent.agent_common import try_getting, rssi_find_router_target
+from agent.agent_common import AgentHistory, try_getting, rssi_find_router_target
 from agent.client_agent import ClientAgent
-from payload import ClientMappingDictPayload
 from peripherals.routing_protocol.alt_algos.epidemic import Epidemic
 from peripherals.routing_protocol.alt_algos.spray_and_wait import SprayAndWait
 from peripherals.routing_protocol.cgr.cgr import Cgr
@@ -32,7 +31,7 @@ class RouterAgent(mesa.Agent):
         super().__init__(node_options["id"], model)
         self.routing_protocol_type = RoutingProtocol(protocol_type) # protocol_type is an int corresponding to enum
         self.name = try_getting(node_options, "name", default=None)
-        self.history = []
+        self.history = AgentHistory(self.MAX_HISTORY_LENGTH, enabled=model.model_params.get("record_history", True))
         self.special_behavior = try_getting(node_options, "special_behavior", default=None)
         self.contact_plan_filepath = try_getting(node_options, "cp_file", default=None)
 
@@ -43,15 +42,13 @@ class RouterAgent(mesa.Agent):
         self.payload_handler = RouterClientPayloadHandler(self.unique_id, model, self.routing_protocol)
 
     def update_history(self):
-        self.history.append({
-            "pos": self.pos,
-            "routing_protocol": self.routing_protocol.get_state(),
-            "radio": self.radio.get_state(),
-            "payloads_awaiting_dtn_transmission": len(self.payload_handler.outgoing_payloads_to_send),
+        if not self.history.enabled:
+            return
+        self.history.append(self.pos, self.radio.neighborhood, {
+            "curr_num_stored_bundles": self.routing_protocol.get_num_stored_bundles(),
+            "payloads_awaiting_dtn_transmission": self.payload_handler.get_num_outgoing_payloads(),
             "curr_payloads_received_for_client": self.__get_curr_num_payloads_received_for_client(),
-            "router_client_mappings": self.payload_handler.client_router_mapping_dict
         })
-        self.history = self.history[-self.MAX_HISTORY_LENGTH:]
 
     def step(self):
         # update our peripherals.
@@ -79,10 +76,12 @@ class RouterAgent(mesa.Agent):
 
             # if we've reached this point, the neighbor is a connected RouterAgent.
             #
-            # send out client mapping data to the other RouterAgent.
-            # (the other RouterAgent should send their client mapping data to us as well.)
-            neighbor_agent.payload_handler\
-                .handle_mapping_dict(ClientMappingDictPayload(self.payload_handler.client_router_mapping_dict))
+            # send out the client mappings which changed since we last sent them to the other RouterAgent.
+            # (the other RouterAgent should send their client mapping changes to us as well.)
+            mapping_updates = self.payload_handler.get_mapping_updates(neighbor_data["id"])
+            if mapping_updates is not None:
+                neighbor_agent.payload_handler.handle_mapping_dict(mapping_updates)
+            self.payload_handler.mark_mappings_synced(neighbor_data["id"])
 
     def __step_movement(self):
         self.movement.step()
@@ -95,7 +94,7 @@ class RouterAgent(mesa.Agent):
         elif self.routing_protocol_type == RoutingProtocol.SPRAY_AND_WAIT:
             return SprayAndWait(self.unique_id, self.model, self)
 
-    def get_state(self):
+    def get_state(self, include_history=True):
         curr_outgoing_payloads_to_send = []
         for payload in self.payload_handler.outgoing_payloads_to_send:
             curr_outgoing_payloads_to_send.append(payload.serialize())
@@ -108,9 +107,8 @@ class RouterAgent(mesa.Agent):
         state = {
             "id": self.unique_id,
             "pos": self.pos,
-            "history": self.history,
             "routing_protocol": self.routing_protocol.get_state(),
-            "curr_num_outgoing_payloads_to_send": len(self.payload_handler.outgoing_payloads_to_send),
+            "curr_num_outgoing_payloads_to_send": self.payload_handler.get_num_outgoing_payloads(),
             "curr_outgoing_payloads_to_send": curr_outgoing_payloads_to_send,
             "curr_num_payloads_received_for_client": self.__get_curr_num_payloads_received_for_client(),
             "curr_payloads_received_for_client": curr_payloads_received_for_client,
@@ -118,6 +116,8 @@ class RouterAgent(mesa.Agent):
             "type": "router",
             "name": self.name
         }
+        if include_history:
+            state["history"] = self.history.get_state()
         return state
     
     def __get_curr_num_payloads_received_for_client(self):
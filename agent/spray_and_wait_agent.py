@@ -1,6 +1,6 @@
 import mesa
 
-from agent.agent_common import try_getting
+from agent.agent_common import AgentHistory, try_getting
 
 from peripherals.radio import Radio
 from peripherals.movement import Movement
@@ -19,7 +19,7 @@ class SprayAndWaitAgent(mesa.Agent):
     def __init__(self, model, node_options):
         super().__init__(node_options["id"], model)
         self.name = try_getting(node_options, "name", default=None)
-        self.history = []
+        self.history = AgentHistory(self.MAX_HISTORY_LENGTH, enabled=model.model_params.get("record_history", True))
         self.special_behavior = try_getting(node_options, "special_behavior", default=None)
 
         # Peripherals
@@ -29,12 +29,11 @@ class SprayAndWaitAgent(mesa.Agent):
         self.payload_handler = SprayAndWaitPayloadHandler(self.unique_id, model, self.routing_protocol)
 
     def update_history(self):
-        self.history.append({
-            "pos": self.pos,
-            "routing_protocol": self.routing_protocol.get_state(),
-            "radio": self.radio.get_state()
+        if not self.history.enabled:
+            return
+        self.history.append(self.pos, self.radio.neighborhood, {
+            "curr_num_stored_bundles": self.routing_protocol.get_num_stored_bundles(),
         })
-        self.history = self.history[-self.MAX_HISTORY_LENGTH:]
 
     def step(self):
         # update our peripherals.
@@ -47,11 +46,10 @@ class SprayAndWaitAgent(mesa.Agent):
     def __step_movement(self):
         self.movement.step()
 
-    def get_state(self):
+    def get_state(self, include_history=True):
         state = {
             "id": self.unique_id,
             "pos": self.pos,
-            "history": self.history,
             "routing_protocol": self.routing_protocol.get_state(),
             "curr_num_outgoing_payloads_to_send": 0, # spray-and-wait only stores bundles, not payloads. must be 0 for metrics
             "curr_outgoing_payloads_to_send": [],
@@ -66,4 +64,6 @@ class SprayAndWaitAgent(mesa.Agent):
         }
         if self.name:
             state["name"] = self.name
+        if include_history:
+            state["history"] = self.history.get_state()
         return state
\ No newline at end of file
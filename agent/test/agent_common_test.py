@@ -0,0 +1,29 @@
+"""
+Tests for the content shared across the agent classes.
+"""
+from agent.agent_common import AgentHistory
+
+
+def test_agent_history_keeps_last_steps():
+    history = AgentHistory(3)
+    for step in range(5):
+        history.append((step, 0), [{"id": 1, "rssi": -float(step), "connected": True}], {"curr_num_stored_bundles": step})
+
+    # only the last 3 steps are kept, oldest first.
+    assert len(history) == 3
+    assert [pos for pos, _, _ in history] == [(2, 0), (3, 0), (4, 0)]
+
+    state = history.get_state()
+    assert state[0] == {
+        "pos": (2, 0),
+        "radio": {"neighborhood": [{"id": 1, "rssi": -2., "connected": True}]},
+        "curr_num_stored_bundles": 2,
+    }
+    assert state[-1]["pos"] == (4, 0)
+
+
+def test_agent_history_disabled():
+    history = AgentHistory(3, enabled=False)
+    history.append((0, 0), [])
+    assert len(history) == 0
+    assert history.get_state() == []
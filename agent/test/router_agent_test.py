@@ -88,6 +88,10 @@ def test_step_exchanges_router_client_mappings(setup):
     ]
     when(mocked_model).get_neighbors(router_agent).thenReturn(neighbor_data)
 
+    # set up Router 0's payload handler to have client mapping changes to send to Router 2.
+    mapping_updates = ClientMappingDictPayload({CLIENT_ID_1: {ROUTER_ID_0: 2500}})
+    when(router_agent.payload_handler).get_mapping_updates(ROUTER_ID_2).thenReturn(mapping_updates)
+
     # move the router_agent forward one step, causing
     router_agent.step()
 
@@ -95,15 +99,9 @@ def test_step_exchanges_router_client_mappings(setup):
     # - Router 0 was not interacted with (since it was not connected).
     # - Router 1 did a handshake (since it was connected).
     # - Client 1 was not interacted with (since it is not a router).
-    # due to issues with mockito, we need to use a custom function here to match the ClientMappingDictPayload fed to the
-    # handle_mapping_dict() call.
-    def payload_match(other_payload: ClientMappingDictPayload):
-        if other_payload.client_mappings == router_agent.payload_handler.client_router_mapping_dict:
-            return True
-        else:
-            return False
-
-    expected_payload = ClientMappingDictPayload(router_agent.payload_handler.client_router_mapping_dict)
     verify(mocked_router_1_payload_handler, times=0).handle_mapping_dict(...)
-    verify(mocked_router_2_payload_handler, times=1).handle_mapping_dict(arg_that(lambda payload: payload_match(payload)))
+    verify(mocked_router_2_payload_handler, times=1).handle_mapping_dict(mapping_updates)
     verify(mocked_client_0_payload_handler, times=0).handle_mapping_dict(...)
+    # Router 2 is only marked as synced once it has applied the mappings.
+    verify(router_agent.payload_handler, times=1).mark_mappings_synced(ROUTER_ID_2)
+    verify(router_agent.payload_handler, times=0).mark_mappings_synced(ROUTER_ID_1)
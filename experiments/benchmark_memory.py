@@ -0,0 +1,108 @@
+"""
+Measures the memory used by the objects created in large numbers during a simulation run (Bundles, ClientPayloads
+and Contacts), which declare __slots__ instead of having a __dict__.
+
+Runs a scenario 1 epidemic simulation under tracemalloc, then compares the size of each live object with the size
+of a dict-backed copy holding the same attribute values.
+
+Run from the root of the repo:  python experiments/benchmark_memory.py [--steps N]
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import LunarModel
+from payload import ClientPayload
+from peripherals.routing_protocol.external_dependencies.py_cgr_lib import Contact
+from peripherals.routing_protocol.routing_protocol_common import Bundle
+from run_model_vis import SIM_WIDTH, SIM_HEIGHT
+
+MODEL_PATH = "experiments/scenario1/model_s1.json"
+AGENT_PATH = "experiments/scenario1/epidemic_stable_clients_s1.json"
+
+
+class DictBacked:
+    """Holds the same attributes as a slotted object, in a __dict__"""
+    pass
+
+
+def get_slot_names(cls):
+    return [name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ())]
+
+
+def make_dict_backed(obj):
+    dict_backed = DictBacked()
+    for name in get_slot_names(type(obj)):
+        if hasattr(obj, name):
+            setattr(dict_backed, name, getattr(obj, name))
+    return dict_backed
+
+
+def measure_bytes_per_object(objs, make_copy):
+    """
+    Returns the average number of bytes allocated by make_copy() for each of the objects.
+    The copies share their attribute values with the originals, so only the objects themselves are measured.
+    """
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    copies = [make_copy(obj) for obj in objs]
+    after, _ = tracemalloc.get_traced_memory()
+    # don't count the list holding the copies.
+    return (after - before - sys.getsizeof(copies)) / len(objs)
+
+
+def run_simulation(num_steps):
+    with open(MODEL_PATH, "r") as model_file:
+        model_params = json.load(model_file)
+    with open(AGENT_PATH, "r") as agent_file:
+        initial_state = json.load(agent_file)
+    model = LunarModel(size=(SIM_WIDTH, SIM_HEIGHT), model_params=model_params, initial_state=initial_state)
+    for _ in range(num_steps):
+        model.step()
+    return model
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--steps", type=int, default=2000, help="number of steps to simulate [default=2000]")
+    argParser.add_argument("--sample", type=int, default=100000, help="max number of objects to measure per class")
+    args = argParser.parse_args()
+
+    tracemalloc.start()
+    model = run_simulation(args.steps)
+    current, peak = tracemalloc.get_traced_memory()
+    print("scenario 1 epidemic run, {} steps:  {:.1f} MiB in use, {:.1f} MiB peak".format(
+        args.steps, current / 2 ** 20, peak / 2 ** 20))
+
+    # epidemic runs don't build Contacts, so measure a plan's worth of them.
+    contacts = [Contact(i % 10, (i + 1) % 10, i, i + 10, 1000, i) for i in range(args.sample)]
+    live_objects = {cls: [] for cls in (Bundle, ClientPayload)}
+    for obj in gc.get_objects():
+        if type(obj) in live_objects:
+            live_objects[type(obj)].append(obj)
+    live_objects[Contact] = contacts
+
+    print("{:<15} {:>10} {:>15} {:>15} {:>15}".format("class", "live", "slotted (B)", "dict (B)", "saved (KiB)"))
+    for cls, objs in live_objects.items():
+        if not objs:
+            print("{:<15} {:>10}".format(cls.__name__, 0))
+            continue
+        sample = objs[:args.sample]
+        slotted_bytes = measure_bytes_per_object(sample, copy.copy)
+        dict_bytes = measure_bytes_per_object(sample, make_dict_backed)
+        saved = (dict_bytes - slotted_bytes) * len(objs)
+        print("{:<15} {:>10} {:>15.1f} {:>15.1f} {:>15.1f}".format(
+            cls.__name__, len(objs), slotted_bytes, dict_bytes, saved / 2 ** 10))
+
+    tracemalloc.stop()
+    return model
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import numpy as np
+
+
+class LinkState():
+    """
+    Holds the RSSI between every pair of agents in a LunarModel as a NumPy matrix.
+
+    Every step the matrix is recomputed in one batched pass from the (N,2) array of agent positions:
+        rssi[i, j] = 25 * log10(1 / distance(i, j)) + gaussian noise
+    where rssi[i, j] is the signal agent i sees from agent j. Agents at the same position have an RSSI of 0.
+    Neighbor lists are then built lazily from the rows of the matrix.
+
+    How it is used:
+    - LunarModel.step() calls invalidate() so the matrix is recomputed with fresh noise on the next query
+    - LunarModel.move_agent() / teleport_agent() call update_position(), which recomputes only the
+      row and column of the moved agent
+    - LunarModel.get_neighbors() calls get_neighbors()
+    - LunarModel.step() calls update_links() at the start of every step, which diffs the connection matrix
+      against the previous step's and publishes link-up / link-down events to every registered listener
+
+    If a spatial index is given, RSSI is only computed for pairs of agents within the index's radius
+    (see spatial_index.py). Every other pair is treated as out of detection range.
+    """
+
+    def __init__(self, agents, rssi_noise_stdev, random, spatial_index=None):
+        self.agents = list(agents)
+        self.ids = [agent.unique_id for agent in self.agents]
+        self.index_of = {agent_id: i for i, agent_id in enumerate(self.ids)}
+        self.rssi_noise_stdev = rssi_noise_stdev
+
+        num_agents = len(self.agents)
+        self.positions = np.array([agent.pos for agent in self.agents], dtype=float).reshape(num_agents, 2)
+        self.detection_thresh = np.array([agent.radio.detection_thresh for agent in self.agents], dtype=float)
+        self.connection_thresh = np.array([agent.radio.connection_thresh for agent in self.agents], dtype=float)
+
+        # rssi[i, j] is the RSSI agent i sees from agent j. The diagonal is always -inf.
+        self.rssi = np.full((num_agents, num_agents), -np.inf)
+
+        # The model's random instance seeds the noise generator on first use,
+        # so seeding the model also makes the link state reproducible.
+        self.random = random
+        self.rng = None
+
+        # True when the matrix must be recomputed before it can be read
+        self.stale = True
+
+        # Maps agent index -> list of neighbor entries built from the matrix
+        self.neighbor_rows = {}
+
+        # connected[i, j] is True if agent i was connected to agent j at the start of the step
+        self.connected = np.zeros((num_agents, num_agents), dtype=bool)
+        # Listeners are (on_link_up, on_link_down) pairs of callables taking (agent_id, other_id)
+        self.link_listeners = []
+
+        self.spatial_index = spatial_index
+        if self.spatial_index is not None:
+            self.spatial_index.rebuild(self.positions)
+
+    def invalidate(self):
+        """Marks the matrix as stale so the next query recomputes it with fresh noise"""
+        self.stale = True
+        self.neighbor_rows.clear()
+
+    def add_link_listener(self, on_link_up, on_link_down):
+        """
+        Registers callbacks for link events. Links are directional:
+        on_link_up(agent_id, other_id) is called when agent_id becomes connected to other_id.
+        """
+        self.link_listeners.append((on_link_up, on_link_down))
+
+    def update_links(self):
+        """
+        Snapshots which agents are connected to each other and publishes the links that changed
+        since the previous snapshot. Link-down events are published before link-up events.
+        """
+        self.__refresh()
+        connected = (self.rssi >= self.detection_thresh[:, np.newaxis]) & \
+                    (self.rssi >= self.connection_thresh[:, np.newaxis])
+        changed = connected != self.connected
+        links_down = np.argwhere(changed & self.connected).tolist()
+        links_up = np.argwhere(changed & connected).tolist()
+        self.connected = connected
+
+        ids = self.ids
+        for on_link_up, on_link_down in self.link_listeners:
+            for i, j in links_down:
+                on_link_down(ids[i], ids[j])
+            for i, j in links_up:
+                on_link_up(ids[i], ids[j])
+
+    def update_position(self, agent, pos):
+        """Records a new position for the agent and refreshes every RSSI involving it"""
+        i = self.index_of[agent.unique_id]
+        self.positions[i] = pos
+        self.neighbor_rows.clear()
+        if self.spatial_index is not None:
+            self.spatial_index.move(i, pos)
+        if self.stale:
+            # the whole matrix will be recomputed anyway
+            return
+        if self.spatial_index is not None:
+            self.__update_nearby_rssi(i)
+            return
+        # The distance is symmetric, but each direction draws its own noise
+        both_directions = self.__compute_rssi(self.positions[i], self.positions[np.newaxis, :, :].repeat(2, axis=0))
+        self.rssi[i, :] = both_directions[0]
+        self.rssi[:, i] = both_directions[1]
+        self.rssi[i, i] = -np.inf
+
+    def get_rssi(self, agent, other):
+        """Returns the RSSI of the agent to the other agent in dBm"""
+        self.__refresh()
+        return float(self.rssi[self.index_of[agent.unique_id], self.index_of[other.unique_id]])
+
+    def get_neighbors(self, agent):
+        """
+        Returns the neighbor entries (id, rssi, connected) of every agent the agent can detect.
+        The returned list is shared between callers and must not be modified.
+        """
+        self.__refresh()
+        i = self.index_of[agent.unique_id]
+        neighbors = self.neighbor_rows.get(i)
+        if neighbors is None:
+            neighbors = self.__build_neighbor_row(i)
+            self.neighbor_rows[i] = neighbors
+        return neighbors
+
+    def __refresh(self):
+        if not self.stale:
+            return
+        if self.spatial_index is None:
+            self.rssi = self.__compute_rssi(self.positions[:, np.newaxis, :], self.positions[np.newaxis, :, :])
+            np.fill_diagonal(self.rssi, -np.inf)
+        else:
+            from_indices, to_indices = self.spatial_index.pairs()
+            self.rssi.fill(-np.inf)
+            self.rssi[from_indices, to_indices] = self.__compute_rssi(self.positions[from_indices], self.positions[to_indices])
+        self.stale = False
+
+    def __update_nearby_rssi(self, i):
+        """Recomputes the row and column of agent i for the agents the spatial index puts near it"""
+        self.rssi[i, :] = -np.inf
+        self.rssi[:, i] = -np.inf
+        nearby = self.spatial_index.neighbors_of(i)
+        self.rssi[i, nearby] = self.__compute_rssi(self.positions[i], self.positions[nearby])
+        self.rssi[nearby, i] = self.__compute_rssi(self.positions[nearby], self.positions[i])
+
+    def __compute_rssi(self, from_pos, to_pos):
+        """Computes the noisy RSSI between broadcastable arrays of positions"""
+        if self.rng is None:
+            self.rng = np.random.default_rng(self.random.getrandbits(64))
+        delta = to_pos - from_pos
+        distance = np.hypot(delta[..., 0], delta[..., 1])
+        with np.errstate(divide="ignore"):
+            clean_rssi = -25 * np.log10(distance)
+        noise = self.rng.normal(0, self.rssi_noise_stdev, distance.shape)
+        return np.where(distance == 0, 0., clean_rssi + noise)
+
+    def __build_neighbor_row(self, i):
+        row = self.rssi[i]
+        detected = np.flatnonzero(row >= self.detection_thresh[i])
+        detected_rssi = row[detected]
+        connected = detected_rssi >= self.connection_thresh[i]
+        ids = self.ids
+        return [{
+            "id": ids[j],
+            "rssi": rssi,
+            "connected": is_connected,
+        } for j, rssi, is_connected in zip(detected.tolist(), detected_rssi.tolist(), connected.tolist())]
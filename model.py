@@ -1,10 +1,12 @@
 import math
 import logging
 import mesa
-import itertools
-import json
 
+from link_state import LinkState
 from metrics_parser import summary_statistics
+from spatial_index import make_spatial_index
+from peripherals.routing_protocol.routing_protocol_common import IdAllocator
+from peripherals.routing_protocol.external_dependencies.cp_file_tools import ContactPlanJsonWriter
 from peripherals.movement import generate_pattern
 from payload import ClientPayload
 from agent.client_agent import ClientAgent
@@ -38,25 +40,39 @@ class LunarModel(mesa.Model):
 
         # To track contact plan generation
         if "make_contact_plan" in model_params:
-            self.contacts = dict()
+            self.open_contacts = dict()
             """
-            self.contacts is a dictionary that contains mappings of pairs to timestamps in which a contact exists
+            self.open_contacts maps each pair currently in contact to the step number at which the contact started
                 - The dict keys are stored as python frozensets for efficiency reasons.
                     For example (2,1) and (1,2) will map to equivalent frozensets
                     This are the same because we always have bidirectional contacts in our simulation
-                - The dict values are lists of step numbers
             Example:
-                [(1,2)] -> [step1,step2,step3,step4,step92,step93,step94] # node 1 & 2 are in contact at steps...
-                [(1,3)] -> [step1,step2,step3,step4,step92,step93,step94] # node 1 & 3 are in contact at steps...
-                [(2,3)] -> [step1,step2,step3,step4,step92,step93,step94] # node 2 & 3 are in contact at steps...
+                [(1,2)] -> step92 # node 1 & 2 have been in contact since step 92
             How it is used:
-            - self.__track_contacts() updates this dictionary on every step to add new contacts
-            - self.__generate_contact_plan() is called when the simulation is over to convert this data into a contact plan json file
+            - self.__track_contacts() opens a contact when a pair comes into contact, and closes it when the pair
+              is no longer in contact. Closed contacts are written to the contact plan file right away
+            - self.__finish_contact_plan() is called when the simulation is over to close the contacts which are
+              still open and finish the contact plan json file
             """
+            self.contact_link_counts = dict()
+            """
+            self.contact_link_counts maps each pair currently in contact to the number of directions (1 or 2)
+            in which the pair is connected. It is kept up to date by link events.
+            """
+            self.changed_contacts = set()
+            """
+            self.changed_contacts holds the pairs which came into contact or went out of contact (in some direction)
+            since the last step, so self.__track_contacts() only has to look at those pairs.
+            """
+            self.contact_plan_writer = ContactPlanJsonWriter("./cp.json")
 
         # Set up an array of data drops
         self.data_drops = []
 
+        # Give the ClientPayloads + Bundles created in this model small int ids
+        self.payload_ids = IdAllocator()
+        self.bundle_ids = IdAllocator()
+
         # Set up the space and schedule
         self.space = mesa.space.ContinuousSpace(
             size[0], size[1], False)
@@ -120,7 +136,42 @@ class LunarModel(mesa.Model):
             # Stash the agent in a map for easy lookup later.
             self.agents[options["id"]] = a
 
+        # Tracks the RSSI between every pair of agents.
+        # Recomputed once per step and patched whenever an agent moves, so every caller
+        # of get_neighbors() during a step sees one consistent neighborhood per agent.
+        self.link_state = LinkState(self.schedule.agents, self.model_params["rssi_noise_stdev"], self.random,
+                                    self.__make_spatial_index())
+
+        if "make_contact_plan" in self.model_params:
+            self.add_link_listener(self.__on_contact_link_up, self.__on_contact_link_down)
+
+    def __make_spatial_index(self):
+        """
+        Creates the spatial index requested by the "spatial_index" model param, if any ("dense" means none).
+        Its radius is the largest distance at which any agent could still detect another,
+        allowing for "spatial_index_noise_margin" (default 4) standard deviations of RSSI noise.
+        """
+        if self.model_params.get("spatial_index") in (None, "dense"):
+            return None
+        if len(self.schedule.agents) == 0:
+            return None
+        noise_margin = self.model_params.get("spatial_index_noise_margin", 4)
+        min_det_thresh = min(agent.radio.detection_thresh for agent in self.schedule.agents)
+        radius = self.get_distance(min_det_thresh - noise_margin * self.model_params["rssi_noise_stdev"])
+        # get_distance() rounds the RSSI formula's constant, so pad the radius slightly to keep
+        # agents right at the detection threshold (which the RSSI formula still detects) in range.
+        radius *= 1 + 1e-6
+        return make_spatial_index(self.model_params["spatial_index"], radius)
+
     def step(self):
+        # Links from the previous step are stale
+        self.link_state.invalidate()
+        self.link_state.update_links()
+
+        # Forget the ids of expired ClientPayloads + Bundles
+        self.payload_ids.remove_expired(self.schedule.time)
+        self.bundle_ids.remove_expired(self.schedule.time)
+
         # Check if there are any data drops
         if "data_drop_schedule" in self.model_params:
             self.update_data_drops()
@@ -139,16 +190,15 @@ class LunarModel(mesa.Model):
     def __finish_simulation(self):
         self.running = False
         if "make_contact_plan" in self.model_params:
-            self.__generate_contact_plan()
+            self.__finish_contact_plan()
         
         if "log_metrics" in self.model_params:
             # Log metrics for the last step
             agent_list = []
             for agent in self.schedule.agents:
-                metrics = agent.get_state()
+                metrics = agent.get_state(include_history=False)
                 del metrics["pos"]
                 del metrics["radio"]
-                del metrics["history"]
                 agent_list.append(metrics)
             final_metric_entry = {
                 "step": self.schedule.steps,
@@ -171,84 +221,66 @@ class LunarModel(mesa.Model):
         # All nodes are routers, so mode 0 & mode 1 are the same behavior
         # All nodes are also in the router_agents dict
 
-        # For Roaming DTN agents, the mode matters
-        if mode == 0:
-            # Loop through only routers
-            for curr_router_id in self.router_agents:
-                curr_router_agent = self.router_agents[curr_router_id]
-                neighbor_data = self.get_neighbors(curr_router_agent)
-                # Loop through all neighbors of this router
-                for neighbor in neighbor_data:
-                    if neighbor["connected"] and neighbor["id"] in self.router_agents:
-                        # Found a connected pair of router agents
-                        pair = frozenset((curr_router_id, neighbor["id"]))
-                        # Add the current step number for this pair
-                        curr_step = self.schedule.steps
-                        if pair not in self.contacts:
-                            self.contacts[pair] = [curr_step]
-                        elif self.contacts[pair][-1] != curr_step:
-                            # avoid adding duplicate step numbers
-                            self.contacts[pair].append(curr_step)
-        elif mode == 1:
-            for curr_agent_id in self.agents:
-                curr_agent = self.agents[curr_agent_id]
-                neighbor_data = self.get_neighbors(curr_agent)
-                # Loop through all neighbors of this agent
-                for neighbor in neighbor_data:
-                    if neighbor["connected"]:
-                        # Found a connected pair of agents
-                        pair = frozenset((curr_agent_id, neighbor["id"]))
-                        # Add the current step number for this pair
-                        curr_step = self.schedule.steps
-                        if pair not in self.contacts:
-                            self.contacts[pair] = [curr_step]
-                        elif self.contacts[pair][-1] != curr_step:
-                            # avoid adding duplicate step numbers
-                            self.contacts[pair].append(curr_step)
-        else:
+        # For Roaming DTN agents, the mode matters.
+        # The mode is applied when link events are received, see self.__is_tracked_contact()
+        if mode not in (0, 1):
             print("error contact plan")
+            return
+
+        # Open a contact for every pair which came into contact this step,
+        # and close the contact of every pair which is no longer in contact (it was last in contact at the previous step)
+        curr_step = self.schedule.steps
+        for pair in self.changed_contacts:
+            if pair in self.contact_link_counts:
+                if pair not in self.open_contacts:
+                    self.open_contacts[pair] = curr_step
+            elif pair in self.open_contacts:
+                self.__write_contact(pair, self.open_contacts.pop(pair), curr_step - 1)
+        self.changed_contacts.clear()
+
+    def __is_tracked_contact(self, agent_id, other_id):
+        if int(self.model_params["make_contact_plan"]) == 0:
+            # Only contacts between a pair of routers are tracked
+            return agent_id in self.router_agents and other_id in self.router_agents
+        return True
+
+    def __on_contact_link_up(self, agent_id, other_id):
+        if self.__is_tracked_contact(agent_id, other_id):
+            pair = frozenset((agent_id, other_id))
+            self.contact_link_counts[pair] = self.contact_link_counts.get(pair, 0) + 1
+            self.changed_contacts.add(pair)
+
+    def __on_contact_link_down(self, agent_id, other_id):
+        if self.__is_tracked_contact(agent_id, other_id):
+            pair = frozenset((agent_id, other_id))
+            self.contact_link_counts[pair] -= 1
+            if self.contact_link_counts[pair] == 0:
+                del self.contact_link_counts[pair]
+                self.changed_contacts.add(pair)
+
+    def __finish_contact_plan(self):
+        # The last tracked step was the step before this one
+        last_step = self.schedule.steps - 1
+        for pair, start in self.open_contacts.items():
+            self.__write_contact(pair, start, last_step)
+        self.open_contacts.clear()
+        self.contact_plan_writer.close()
+
+    def __write_contact(self, pair, start, end):
+        """Writes the contact between the pair from step start to step end (inclusive) to the contact plan file"""
+        node1, node2 = pair
+        for source, dest in ((node1, node2), (node2, node1)): # a contact in each direction
+            self.contact_plan_writer.write_contact({
+                "contact": self.contact_plan_writer.num_contacts,
+                "source": source,
+                "dest": dest,
+                "startTime": start,
+                "endTime": end,
+                "rate": 1000,
+                "owlt": 0,
+                "confidence": 1.,
+                })
 
-    def __generate_contact_plan(self):
-        def ranges(i):
-            # helper function from: https://stackoverflow.com/a/43091576
-            # condenses [0,1,2,3,4,5,6,9,10,11,12] into [(0,6),(9,12)]
-            for a, b in itertools.groupby(enumerate(i), lambda pair: pair[1] - pair[0]):
-                b = list(b)
-                yield b[0][1], b[-1][1]
-        contact_list = []
-        curr_contact_id = 0
-        for pair in self.contacts:
-            node1, node2 = pair
-            contact_times = list(ranges(self.contacts[pair]))
-            for time_range in contact_times:
-                start, end = time_range
-                contact_list.append({
-                    "contact": curr_contact_id,
-                    "source": node1,
-                    "dest": node2,
-                    "startTime": start,
-                    "endTime": end,
-                    "rate": 1000,
-                    "owlt": 0,
-                    "confidence": 1.,
-                    })
-                curr_contact_id += 1
-                contact_list.append({
-                    "contact": curr_contact_id,
-                    "source": node2, # switch the source & dest
-                    "dest": node1,
-                    "startTime": start,
-                    "endTime": end,
-                    "rate": 1000,
-                    "owlt": 0,
-                    "confidence": 1.,
-                    })
-                curr_contact_id += 1
-    
-        final_cp = {"contacts": contact_list}
-        with open("./cp.json", "w") as outfile:
-            outfile.write(json.dumps(final_cp, indent=4))
-    
     def update_data_drops(self):
         DROP_PICKUP_RANGE = 5
         
@@ -280,17 +312,12 @@ class LunarModel(mesa.Model):
                         # Added this condition check bc I witnessed a client taking 2000 steps to get a bundle delivered to itself.
                         if drop["target_id"] != agent.unique_id and drop["drop_id"] not in already_picked_up:
                             already_picked_up.add(drop["drop_id"])
-                            agent.payload_handler.store_payload(ClientPayload(drop["drop_id"], agent.unique_id, drop["target_id"], self.schedule.steps, self.model_params["payload_lifespan"]))
+                            agent.payload_handler.store_payload(ClientPayload(drop["drop_id"], agent.unique_id, drop["target_id"], self.schedule.steps, self.model_params["payload_lifespan"], self.payload_ids))
                             self.data_drops.remove(drop)
 
     def get_rssi(self, agent, other):
         """Returns the RSSI of the agent to the other agent in dBm"""
-        distance = self.space.get_distance(agent.pos, other.pos)
-        if distance == 0:
-            return 0
-        clean_rssi = 10 * 2.5 * math.log10(1/distance)
-        noise = self.random.gauss(0, self.model_params["rssi_noise_stdev"])
-        return clean_rssi + noise
+        return self.link_state.get_rssi(agent, other)
 
     def get_distance(self, rssi):
         """
@@ -300,29 +327,28 @@ class LunarModel(mesa.Model):
         distance = math.exp(-0.0921034 * rssi)
         return distance
 
+    def add_link_listener(self, on_link_up, on_link_down):
+        """
+        Subscribes to link events, which are published at the start of every step
+        for the links that changed since the previous step.
+        Both callbacks take (agent_id, other_id) and describe the link as seen by agent_id.
+
+        Events describe the links at the start of the step.  Agents moving during the step can make or break
+        links before the next step, so code which acts on the current links (like the routing protocols)
+        should read get_neighbors() instead.
+        """
+        self.link_state.add_link_listener(on_link_up, on_link_down)
+
     def get_neighbors(self, agent):
         """
         Returns a list of all agents within the detection range of the agent
         Each entry includes the agent's unique id, RSSI, and whether or not
         the agent is connected.
-        """
-
-        det_thresh = agent.radio.detection_thresh
-        con_thresh = agent.radio.connection_thresh
 
-        neighbors = []
-        for other in self.schedule.agents:
-            if other is not agent:
-                rssi = self.get_rssi(agent, other)
-                if rssi >= det_thresh:
-                    connected = rssi >= con_thresh
-                    neighbors.append({
-                        "id": other.unique_id,
-                        "rssi": rssi,
-                        "connected": connected,
-                    })
-
-        return neighbors
+        The result is shared until the next step or until an agent moves,
+        so the returned list must not be modified by callers.
+        """
+        return self.link_state.get_neighbors(agent)
 
     def move_agent(self, agent, dx, dy):
         """Moves the agent by the given delta x and delta y"""
@@ -341,7 +367,7 @@ class LunarModel(mesa.Model):
                 "Agent {} tried to move out of bounds".format(agent.unique_id))
             return
 
-        self.space.move_agent(agent, (agent.pos[0] + dx, agent.pos[1] + dy))
+        self.__place_agent(agent, new_pos)
 
     def teleport_agent(self, agent, pos):
         """Teleports the agent to the given position"""
@@ -350,12 +376,20 @@ class LunarModel(mesa.Model):
                 "Agent {} tried to teleport out of bounds".format(agent.unique_id))
             return
 
+        self.__place_agent(agent, pos)
+
+    def __place_agent(self, agent, pos):
+        """Moves the agent on the space, updating the link state if it actually moved"""
+        moved = tuple(agent.pos) != tuple(pos)
         self.space.move_agent(agent, pos)
+        if moved:
+            self.link_state.update_position(agent, pos)
 
     def __update_metrics(self):
         """Logs the metrics for the current step"""
         for agent in self.schedule.agents:
-            agent_state = agent.get_state()
+            # the metrics don't use the history, which is costly to serialize at every step.
+            agent_state = agent.get_state(include_history=False)
                     
             if isinstance(agent, ClientAgent):
                 if "correctness" in self.model_params and self.model_params["correctness"]:
@@ -2,6 +2,7 @@
 Contains the various payload types which are stored in Bundles and sent over the DTN network.
 
 These payloads should store application-level data, not DTN-network-level data.
+Payloads are created in large numbers, so every payload class declares __slots__ instead of having a __dict__.
 """
 
 
@@ -9,7 +10,7 @@ These payloads should store application-level data, not DTN-network-level data.
 Base class.
 """
 class Payload:
-    pass
+    __slots__ = ()
 
 
 """
@@ -17,6 +18,8 @@ Payload class containing a dict used to specify the client-router mappings for t
 The mappings should be client_id->(dict of router_id->(expiration timestamp)).
 """
 class ClientMappingDictPayload(Payload):
+    __slots__ = ("client_mappings",)
+
     def __init__(self, client_mappings:  dict):
         self.client_mappings = client_mappings
 
@@ -25,35 +28,57 @@ class ClientMappingDictPayload(Payload):
 Payload class containing the payloads sent between the clients on the network.
 """
 class ClientPayload(Payload):
+    __slots__ = ("payload_id", "drop_id", "source_client_id", "dest_client_id", "expiration_timestamp",
+                 "creation_timestamp", "_serialized")
 
-    def __init__(self, drop_id, source_client_id, dest_client_id, creation_timestamp, lifespan):
+    """
+    payload_ids = the IdAllocator of the model (model.payload_ids), which gives the payload its id.
+    """
+    def __init__(self, drop_id, source_client_id, dest_client_id, creation_timestamp, lifespan, payload_ids):
         self.drop_id = drop_id
         self.source_client_id = source_client_id
         self.dest_client_id = dest_client_id
         self.expiration_timestamp = creation_timestamp + lifespan
+        # payloads with the same contents get the same id, so they are deduped as the same payload.
+        self.payload_id = payload_ids.get_id((drop_id, source_client_id, dest_client_id, self.expiration_timestamp),
+                                             self.expiration_timestamp)
         self.creation_timestamp = creation_timestamp # used for metrics, to calculate the total latency
+        self._serialized = None  # cached output of serialize()
 
     """
-    Returns a string which can be used to identify this payload. 
+    Returns a small int which can be used to identify this payload.
     """
     def get_identifier(self):
+        return self.payload_id
+
+    """
+    Returns a human-readable string which can be used to identify this payload.  Only built for serialization.
+    """
+    def get_readable_identifier(self):
         id_str = "payload(drop[{}],src[{}],dst[{}],exp[{}])".format(self.drop_id, self.source_client_id, self.dest_client_id, self.expiration_timestamp)
         return id_str
-    
+
+    """
+    Returns the payload as a dict.  Payloads never change, so the dict is only built once + must not be modified.
+    """
     def serialize(self):
-        return {
-                "payload_id": self.get_identifier(),
+        if self._serialized is None:
+            self._serialized = {
+                "payload_id": self.get_readable_identifier(),
                 "drop_id": self.drop_id,
                 "source_id": self.source_client_id,
                 "dest_client_id": self.dest_client_id,
                 "expiration_timestamp": self.expiration_timestamp,
                 "creation_timestamp": self.creation_timestamp,
             }
+        return self._serialized
 
 
 """
 Payload class for Bundles sent as Client beacons.
 """
 class ClientBeaconPayload(Payload):
+    __slots__ = ("client_id",)
+
     def __init__(self, client_id):
         self.client_id = client_id
\ No newline at end of file
@@ -6,14 +6,14 @@ Contains the peripheral used by an Epidemic agent to exchange
 
 from payload import ClientPayload
 
-from peripherals.routing_protocol.routing_protocol_common import Bundle
+from peripherals.routing_protocol.routing_protocol_common import Bundle, ExpiringIdSet
 
 
 class EpidemicPayloadHandler:
     def __init__(self, agent_id, model, epidemic_router):
         self.agent_id = agent_id
         self.model = model
-        self.seen_payload_ids = set() # for deduping
+        self.seen_payload_ids = ExpiringIdSet() # for deduping.  payloads are forgotten once they have expired.
 
         self.epidemic_router = epidemic_router  # the Epidemic router used to handle bundles
 
@@ -29,15 +29,17 @@ class EpidemicPayloadHandler:
     - Hands these bundles over to the Epidemic protocol
     """
     def store_payload(self, payload: ClientPayload):
-        if payload.get_identifier() in self.seen_payload_ids:
-            return # ignore payloads we've already seen
-        else:
-            self.seen_payload_ids.add(payload.get_identifier())
+        # ignore expired payloads (which may have been forgotten already) + payloads we've already seen
+        if payload.expiration_timestamp <= self.model.schedule.time or payload.get_identifier() in self.seen_payload_ids:
+            return
+        self.seen_payload_ids.add(payload.get_identifier(), payload.expiration_timestamp)
 
         self.num_drops_picked_up += 1
         # Make a bundle targeted to the payload's target
-        bundle_id = "bundle(routerdst[{}]creationtime[{}],{})".format(payload.dest_client_id, self.model.schedule.time, payload.get_identifier())
-        bundle = Bundle(bundle_id, payload.dest_client_id, payload, self.model.schedule.time, self.model.model_params["bundle_lifespan"])
+        bundle_lifespan = self.model.model_params["bundle_lifespan"]
+        bundle_id = self.model.bundle_ids.get_id((payload.dest_client_id, self.model.schedule.time, payload.get_identifier()),
+                                                 self.model.schedule.time + bundle_lifespan)
+        bundle = Bundle(bundle_id, payload.dest_client_id, payload, self.model.schedule.time, bundle_lifespan)
         self.epidemic_router.handle_bundle(bundle) # epidemic will store-and-forward
    
     """
@@ -45,10 +47,10 @@ class EpidemicPayloadHandler:
     which was meant for itself.
     """
     def handle_payload(self, payload: ClientPayload):
-        if payload.get_identifier() in self.seen_payload_ids:
-            return # ignore payloads we've already seen
-        else:
-            self.seen_payload_ids.add(payload.get_identifier())
+        # ignore expired payloads (which may have been forgotten already) + payloads we've already seen
+        if payload.expiration_timestamp <= self.model.schedule.time or payload.get_identifier() in self.seen_payload_ids:
+            return
+        self.seen_payload_ids.add(payload.get_identifier(), payload.expiration_timestamp)
 
         self.num_payloads_received += 1
         latency = self.model.schedule.time - payload.creation_timestamp
@@ -68,4 +70,5 @@ class EpidemicPayloadHandler:
     Refreshes the state of the EpidemicPayloadHandler.
     """
     def refresh(self):
-        pass
\ No newline at end of file
+        # forget about expired payloads
+        self.seen_payload_ids.remove_expired(self.model.schedule.time)
\ No newline at end of file
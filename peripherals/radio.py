@@ -17,6 +17,11 @@ def makeSerializeable(obj):
         return obj.__name__
     elif hasattr(obj, "__dict__"):
         return makeSerializeable(obj.__dict__)
+    elif hasattr(obj, "__slots__"):
+        # slotted objects (e.g. Bundles + payloads) have no __dict__.  private slots only hold caches.
+        return makeSerializeable({name: getattr(obj, name) for cls in type(obj).__mro__
+                                  for name in getattr(cls, "__slots__", ())
+                                  if not name.startswith("_") and hasattr(obj, name)})
     else:
         return obj
 
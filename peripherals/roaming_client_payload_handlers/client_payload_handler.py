@@ -3,9 +3,11 @@ Contains the peripheral used by the client to exchange ClientPayload data with a
 
 For high-level details on this handshake process, look at the README in this directory.
 """
-from copy import copy
+import heapq
+import itertools
 
 from payload import ClientPayload
+from peripherals.routing_protocol.routing_protocol_common import ExpiringIdSet
 
 
 class ClientClientPayloadHandler:
@@ -13,8 +15,15 @@ class ClientClientPayloadHandler:
     def __init__(self, client_id, model):
         self.client_id = client_id
         self.model = model
-        self.payloads_to_send = []  # elements are ClientPayloads.
-        self.already_received_payload_ids = set()  # elements are tuples of ('id', 'expiration timestamp').
+        self.stored_payloads = {}  # dict of payload id->ClientPayload for the payloads to send, in the order stored.
+        self.stored_payloads_by_dest = {}  # dict of dest client_id->(dict of payload id->ClientPayload), indexing
+                                           # stored_payloads.  implementation invariant: there are no empty dicts.
+        # (expiration timestamp, insertion number, payload) for every stored payload, as a min-heap.
+        # payloads which were already sent are skipped when they reach the top of the heap.
+        self.expiration_heap = []
+        self.insertion_counter = itertools.count()  # breaks ties between payloads expiring at the same time
+        self.already_received_payload_ids = ExpiringIdSet()  # elements are tuples of ('id', 'expiration timestamp').
+                                                             # forgotten once the expiration timestamp has passed.
 
         # vars used to record stats for measurements + evaluation
         self.num_payloads_received = 0
@@ -22,6 +31,22 @@ class ClientClientPayloadHandler:
         self.received_payloads = []
         self.num_drops_picked_up = 0
 
+    """
+    Returns a list of the ClientPayloads to be sent later over the network, in the order they were stored.
+    """
+    @property
+    def payloads_to_send(self):
+        return list(self.stored_payloads.values())
+
+    """
+    Replaces the ClientPayloads to be sent later over the network.
+    """
+    @payloads_to_send.setter
+    def payloads_to_send(self, payloads):
+        self.__clear_payloads_to_send()
+        for payload in payloads:
+            self.__store_payload_to_send(payload)
+
     """
     Stores a ClientPayload to be sent later over the network.
     """
@@ -31,8 +56,8 @@ class ClientClientPayloadHandler:
         if unique_tuple in self.already_received_payload_ids:
             print("INVARIANT VIOLATION: client had store_payload() called with a payload it already saw")
         else:
-            self.payloads_to_send.append(payload)
-            self.already_received_payload_ids.add(unique_tuple)
+            self.__store_payload_to_send(payload)
+            self.already_received_payload_ids.add(unique_tuple, payload.expiration_timestamp)
             self.num_drops_picked_up += 1
 
     """
@@ -91,7 +116,7 @@ class ClientClientPayloadHandler:
             if unique_tuple in self.already_received_payload_ids:
                 print("INVARIANT VIOLATION: handshake_5 found a dupe")
             else:
-                self.already_received_payload_ids.add(unique_tuple)
+                self.already_received_payload_ids.add(unique_tuple, payload.expiration_timestamp)
                 self.num_payloads_received += 1
                 latency = self.model.schedule.time - payload.creation_timestamp
                 received_payload_serialized = {
@@ -110,19 +135,19 @@ class ClientClientPayloadHandler:
 
         # send the stored outgoing payloads to the router.
         # note: if false, this if statement ends the handshake early
-        if len(self.payloads_to_send) > 0:
-            router_handler.handshake_6(copy(self.payloads_to_send))
+        if len(self.stored_payloads) > 0:
+            router_handler.handshake_6(self.payloads_to_send)
             if "debug" in self.model.model_params:
-                print("client", self.client_id, "is sending", len(self.payloads_to_send), "payload(s) to router", router_handler.router_id)
-            # clear the list of payloads to send (since we've now sent them into the DTN network).
-            self.payloads_to_send.clear()
+                print("client", self.client_id, "is sending", len(self.stored_payloads), "payload(s) to router", router_handler.router_id)
+            # clear the payloads to send (since we've now sent them into the DTN network).
+            self.__clear_payloads_to_send()
 
     def receive_payload_from_neighbor_client(self, payload):
         unique_tuple = (payload.get_identifier(), payload.expiration_timestamp)
         if unique_tuple in self.already_received_payload_ids:
             print("INVARIANT VIOLATION: receive_payload_from_neighbor_client() found a dupe")
         else:
-            self.already_received_payload_ids.add(unique_tuple)
+            self.already_received_payload_ids.add(unique_tuple, payload.expiration_timestamp)
             self.num_payloads_received += 1
             latency = self.model.schedule.time - payload.creation_timestamp
             received_payload_serialized = {
@@ -141,19 +166,40 @@ class ClientClientPayloadHandler:
 
     def send_payloads_to_neighbor_client(self, other_client_agent):
         other_client_id = other_client_agent.unique_id
-        for payload in self.payloads_to_send:
-            if payload.dest_client_id == other_client_id:
-                other_client_agent.payload_handler.receive_payload_from_neighbor_client(payload)
-                self.payloads_to_send.remove(payload)
+        for payload in self.stored_payloads_by_dest.pop(other_client_id, {}).values():
+            other_client_agent.payload_handler.receive_payload_from_neighbor_client(payload)
+            del self.stored_payloads[payload.get_identifier()]
 
     """
     Refreshes the state of the ClientClientPayloadHandler.
     
     In this case, it means going thru and removing all records we have for expired ClientPayloads.
+    Only looks at the records which expired.
     """
 
     def refresh(self):
-        self.payloads_to_send = [payload for payload in
-                                 self.payloads_to_send if payload.expiration_timestamp > self.model.schedule.time]
-        self.already_received_payload_ids = set([(payload, expiration_timestamp) for (payload, expiration_timestamp) in
-                                             self.already_received_payload_ids if expiration_timestamp > self.model.schedule.time])
+        curr_timestamp = self.model.schedule.time
+        while self.expiration_heap and self.expiration_heap[0][0] <= curr_timestamp:
+            _, _, payload = heapq.heappop(self.expiration_heap)
+            if self.stored_payloads.get(payload.get_identifier()) is payload:
+                self.__remove_payload_to_send(payload)
+        self.already_received_payload_ids.remove_expired(curr_timestamp)
+
+    def __store_payload_to_send(self, payload):
+        self.stored_payloads[payload.get_identifier()] = payload
+        if payload.dest_client_id not in self.stored_payloads_by_dest:
+            self.stored_payloads_by_dest[payload.dest_client_id] = {}
+        self.stored_payloads_by_dest[payload.dest_client_id][payload.get_identifier()] = payload
+        heapq.heappush(self.expiration_heap, (payload.expiration_timestamp, next(self.insertion_counter), payload))
+
+    def __remove_payload_to_send(self, payload):
+        del self.stored_payloads[payload.get_identifier()]
+        dest_payloads = self.stored_payloads_by_dest[payload.dest_client_id]
+        del dest_payloads[payload.get_identifier()]
+        if not dest_payloads:
+            del self.stored_payloads_by_dest[payload.dest_client_id]
+
+    def __clear_payloads_to_send(self):
+        self.stored_payloads = {}
+        self.stored_payloads_by_dest = {}
+        self.expiration_heap = []
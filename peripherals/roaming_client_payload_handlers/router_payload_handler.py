@@ -5,24 +5,58 @@ routers.
 For high-level details on the client-router data transfer handshake process, look at the README in this directory.
 """
 
+import heapq
+import itertools
+
 from payload import ClientPayload, ClientMappingDictPayload, ClientBeaconPayload
 
-from peripherals.routing_protocol.routing_protocol_common import Bundle
+from peripherals.routing_protocol.routing_protocol_common import Bundle, ExpiringIdSet
 
 
 class RouterClientPayloadHandler:
+    # kinds of entries in the expiration heap
+    RECEIVED_PAYLOAD = 0
+    OUTGOING_PAYLOAD = 1
+    CLIENT_MAPPING = 2
+
     def __init__(self, router_id, model, routing_protocol):
         self.CLIENT_MAPPING_TIMEOUT = model.model_params["host_router_mapping_timeout"]
         self.router_id = router_id
         self.model = model
-        self.seen_payload_ids = set() # for deduping
+        self.seen_payload_ids = ExpiringIdSet() # for deduping.  payloads are forgotten once they have expired.
         self.payloads_received_for_client = {}  # map of client_ids->[set of ClientPayloads]
-        self.outgoing_payloads_to_send = []  # stores payloads for us to attempt to send with each `refresh()`
+        self.outgoing_payloads_by_dest = {}  # map of dest client_id->(dict of payload id->ClientPayload) for the
+                                             # payloads waiting for a router associated with their dest client.
+                                             # implementation invariant: there are no empty dicts.
+        self.clients_to_send_to = set()  # dest client_ids whose outgoing payloads should be sent at the next `refresh()`
         self.client_router_mapping_dict = {}  # dict of client_id->(dict of router_id->(expiration timestamp))
                                               # which represents DTN router(s) known to be associated with the specified
-                                              # client.
+                                              # client.  clients without any routers have no entry.
+        self.mapping_version = 0  # incremented whenever an entry of client_router_mapping_dict is added or updated
+        self.mapping_changes = {}  # dict of (client_id, router_id)->(mapping_version when the entry last changed),
+                                   # ordered from least to most recently changed.  only holds unexpired entries.
+        self.peer_sync_versions = {}  # dict of router_id->(mapping_version, timestamp) of when that router last
+                                      # applied our changes, ordered from least to most recently synced.
+        # (expiration timestamp, insertion number, kind, client_id, payload or router_id) for the received payloads,
+        # outgoing payloads + client mappings, as a min-heap.  entries which are out of date when they reach the top
+        # of the heap (e.g. the payload was already sent, or the mapping was renewed) are skipped.
+        self.expiration_heap = []
+        self.insertion_counter = itertools.count()  # breaks ties between entries expiring at the same time
         self.routing_protocol = routing_protocol  # the routing protocol object we can use to send out Bundles over the DTN network.
 
+    """
+    Returns a list of the payloads waiting to be sent out over the DTN network.
+    """
+    @property
+    def outgoing_payloads_to_send(self):
+        return [payload for payloads in self.outgoing_payloads_by_dest.values() for payload in payloads.values()]
+
+    """
+    Returns the number of payloads waiting to be sent out over the DTN network, without building their list.
+    """
+    def get_num_outgoing_payloads(self):
+        return sum(len(payloads) for payloads in self.outgoing_payloads_by_dest.values())
+
     """
     Updates that this router can connect to a particular client.
     
@@ -30,13 +64,9 @@ class RouterClientPayloadHandler:
     """
 
     def update_client_mapping(self, client_beacon_payload:  ClientBeaconPayload):
-        # if we don't have _any_ entry for the client_id in our local map, add one with an empty list.
-        if client_beacon_payload.client_id not in self.client_router_mapping_dict.keys():
-            self.client_router_mapping_dict[client_beacon_payload.client_id] = {}
-
         # store a mapping of client->this router locally.
-        self.client_router_mapping_dict.get(client_beacon_payload.client_id)[self.router_id] \
-            = self.model.schedule.time + self.CLIENT_MAPPING_TIMEOUT
+        self.__store_client_mapping(client_beacon_payload.client_id, self.router_id,
+                                    self.model.schedule.time + self.CLIENT_MAPPING_TIMEOUT)
 
     """
     Handles mapping dicts received from other routers on the network.
@@ -48,18 +78,66 @@ class RouterClientPayloadHandler:
 
     def handle_mapping_dict(self, mapping_dict_payload:  ClientMappingDictPayload):
         for client_id in mapping_dict_payload.client_mappings.keys():
-            # if we don't have _any_ dict entry for the client_id in our local dict, add one with an empty dict.
-            if client_id not in self.client_router_mapping_dict.keys():
-                self.client_router_mapping_dict[client_id] = {}
-
             for router_id in mapping_dict_payload.client_mappings.get(client_id).keys():
                 payload_map_expiration = mapping_dict_payload.client_mappings.get(client_id).get(router_id)
-                current_expiration = self.client_router_mapping_dict.get(client_id).get(router_id)
+                current_expiration = self.client_router_mapping_dict.get(client_id, {}).get(router_id)
 
                 # if no such entry for the router_id is currently stored locally OR the locally stored entry has a
                 # less-recent expiration timestamp, store the data from the payload dict.
                 if not current_expiration or payload_map_expiration > current_expiration:
-                    self.client_router_mapping_dict.get(client_id)[router_id] = payload_map_expiration
+                    self.__store_client_mapping(client_id, router_id, payload_map_expiration)
+
+    """
+    Returns a ClientMappingDictPayload with the client mappings which changed since the given router last applied our
+    changes.  Call `mark_mappings_synced()` once the router has applied them.
+
+    Returns None if nothing changed.
+    """
+    def get_mapping_updates(self, peer_router_id):
+        last_synced_version = self.peer_sync_versions.get(peer_router_id, (0, None))[0]
+        if last_synced_version == self.mapping_version:
+            return None
+
+        # walk back from the most recent change until we reach the changes the router already has.
+        client_mappings = {}
+        for (client_id, router_id), version in reversed(self.mapping_changes.items()):
+            if version <= last_synced_version:
+                break
+            if client_id not in client_mappings:
+                client_mappings[client_id] = {}
+            client_mappings[client_id][router_id] = self.client_router_mapping_dict[client_id][router_id]
+        if not client_mappings:
+            return None
+        return ClientMappingDictPayload(client_mappings)
+
+    """
+    Records that the given router is up-to-date with our client mappings, e.g. after it applied the
+    `get_mapping_updates()` for it.
+    """
+    def mark_mappings_synced(self, peer_router_id):
+        # move the entry to the end of the peers.
+        self.peer_sync_versions.pop(peer_router_id, None)
+        self.peer_sync_versions[peer_router_id] = (self.mapping_version, self.model.schedule.time)
+
+    """
+    Stores that the client is associated with the router until the expiration timestamp.
+    Outgoing payloads for the client get sent at the next `refresh()`.
+    """
+    def __store_client_mapping(self, client_id, router_id, expiration_timestamp):
+        if client_id not in self.client_router_mapping_dict:
+            self.client_router_mapping_dict[client_id] = {}
+        self.client_router_mapping_dict[client_id][router_id] = expiration_timestamp
+        # move the entry to the end of the changes.
+        self.mapping_version += 1
+        self.mapping_changes.pop((client_id, router_id), None)
+        self.mapping_changes[(client_id, router_id)] = self.mapping_version
+        self.__push_expiration(expiration_timestamp, self.CLIENT_MAPPING, client_id, router_id)
+        if client_id in self.outgoing_payloads_by_dest:
+            self.clients_to_send_to.add(client_id)
+
+    def __push_expiration(self, expiration_timestamp, kind, client_id, item):
+        heapq.heappush(self.expiration_heap,
+                       (expiration_timestamp, next(self.insertion_counter), kind, client_id, item))
 
     """
     Stores a payload to be sent to a client later over the network.
@@ -68,14 +146,18 @@ class RouterClientPayloadHandler:
     def handle_payload(self, payload: ClientPayload):
         if "debug" in self.model.model_params:
             print("router", self.router_id, "got a payload for a client. Need to wait for client", payload.dest_client_id, "to pick it up...")
+        # expired payloads are dropped (and may have been forgotten already)
+        if payload.expiration_timestamp <= self.model.schedule.time:
+            return
         # if no list exists in the dict for the client, add one.
         if payload.dest_client_id not in self.payloads_received_for_client.keys():
             self.payloads_received_for_client[payload.dest_client_id] = set()
 
         # store the payload in the dict for the client.
         if payload.get_identifier() not in self.seen_payload_ids:
-            self.seen_payload_ids.add(payload.get_identifier())
+            self.seen_payload_ids.add(payload.get_identifier(), payload.expiration_timestamp)
             self.payloads_received_for_client[payload.dest_client_id].add(payload)
+            self.__push_expiration(payload.expiration_timestamp, self.RECEIVED_PAYLOAD, payload.dest_client_id, payload)
 
     """
     Executes "step 2" of the handshake process described in README.md.
@@ -137,79 +219,94 @@ class RouterClientPayloadHandler:
 
     def handshake_6(self, payloads_from_client: list):
         # store the payloads so that they can be sent out at the next refresh.
-        self.outgoing_payloads_to_send.extend(payloads_from_client)
+        for payload in payloads_from_client:
+            if payload.dest_client_id not in self.outgoing_payloads_by_dest:
+                self.outgoing_payloads_by_dest[payload.dest_client_id] = {}
+            self.outgoing_payloads_by_dest[payload.dest_client_id][payload.get_identifier()] = payload
+            self.clients_to_send_to.add(payload.dest_client_id)
+            self.__push_expiration(payload.expiration_timestamp, self.OUTGOING_PAYLOAD, payload.dest_client_id, payload)
 
     """
     Refreshes the state of the RouterClientPayloadHandler.
 
-    In this case, it means going thru and removing all records we have for expired ClientPayloads.
+    In this case, it means going thru and removing all records we have for expired ClientPayloads + client mappings,
+    then sending out the outgoing payloads whose dest clients we've found routers for.
+    Only looks at the records which expired, in order of expiration.
     """
     def refresh(self):
-        # remove expired payloads from payloads_received_for_client
-        for client_payload_list in self.payloads_received_for_client.values():
-            payloads_to_remove = [] # to avoid removing items from set while looping over it
-            for payload in client_payload_list:
-                if payload.expiration_timestamp <= self.model.schedule.time:
+        # forget about expired payloads
+        self.seen_payload_ids.remove_expired(self.model.schedule.time)
+
+        # remove expired payloads + router-client mappings.
+        while self.expiration_heap and self.expiration_heap[0][0] <= self.model.schedule.time:
+            expiration_timestamp, _, kind, client_id, item = heapq.heappop(self.expiration_heap)
+            if kind == self.RECEIVED_PAYLOAD:
+                client_payloads = self.payloads_received_for_client.get(client_id)
+                if client_payloads is not None and item in client_payloads:
                     if "debug" in self.model.model_params:
-                        print(self.router_id, "dropping expired client payload", payload.drop_id)
-                    payloads_to_remove.append(payload)
-            for payload in payloads_to_remove:
-                client_payload_list.remove(payload)
-
-        # remove expired router-client mappings.
-        for client_dict in self.client_router_mapping_dict.values():
-
-            # stores what we need to delete from the dict.
-            expired_router_ids_to_delete = []
-
-            # figure out what values we need to delete.
-            for router_id in client_dict.keys():
-                if client_dict.get(router_id) <= self.model.schedule.time:
-                    expired_router_ids_to_delete.append(router_id)
-
-            # delete the values.
-            for expired_router_id in expired_router_ids_to_delete:
-                del(client_dict[expired_router_id])
-
-        # attempt to send all stored outgoing payloads.
+                        print(self.router_id, "dropping expired client payload", item.drop_id)
+                    client_payloads.remove(item)
+            elif kind == self.OUTGOING_PAYLOAD:
+                outgoing_payloads = self.outgoing_payloads_by_dest.get(client_id)
+                if outgoing_payloads is not None and outgoing_payloads.get(item.get_identifier()) is item:
+                    if "debug" in self.model.model_params:
+                        print("dropping expired client payload...")
+                    del outgoing_payloads[item.get_identifier()]
+                    if not outgoing_payloads:
+                        del self.outgoing_payloads_by_dest[client_id]
+            else:
+                # skip mappings which were renewed since this entry was pushed.
+                client_dict = self.client_router_mapping_dict.get(client_id)
+                if client_dict is not None and client_dict.get(item) == expiration_timestamp:
+                    del client_dict[item]
+                    self.mapping_changes.pop((client_id, item), None)
+                    if not client_dict:
+                        del self.client_router_mapping_dict[client_id]
+
+        # forget the routers we haven't synced with for a mapping timeout.  every mapping they got from us has expired
+        # since, so they'd get the same updates as a router we've never synced with.
+        while self.peer_sync_versions:
+            peer_router_id, (_, last_synced_timestamp) = next(iter(self.peer_sync_versions.items()))
+            if last_synced_timestamp + self.CLIENT_MAPPING_TIMEOUT > self.model.schedule.time:
+                break
+            del self.peer_sync_versions[peer_router_id]
+
+        # attempt to send the stored outgoing payloads which may have become sendable.
         self.__try_send_stored_outgoing_payloads()
 
     """
-    Attempts to send each currently-stored payload.
-    
-    If the payload cannot be sent, it's kept locally as long as it hasn't expired.
+    Attempts to send the stored payloads for each dest client which got new payloads or a new router mapping since
+    the last refresh.
+
+    If a payload cannot be sent, it's kept locally (until it expires) + sent once a router is found for its client.
     """
     def __try_send_stored_outgoing_payloads(self):
-        unhandled_payloads = []
-        for payload in self.outgoing_payloads_to_send:
-            # if payload has expired, do not process it.
-            if payload.expiration_timestamp <= self.model.schedule.time:
+        clients_to_send_to = self.clients_to_send_to
+        self.clients_to_send_to = set()
+        for client_id in clients_to_send_to:
+            # see if we can get any router_id for a router associated with the payloads' client
+            router_ids_map = self.client_router_mapping_dict.get(client_id)
+            if "debug" in self.model.model_params:
+                print("router id map for destination client", client_id, ":", router_ids_map)
+
+            # if we were unable to send out the payloads, keep them for later.
+            if not router_ids_map:
                 if "debug" in self.model.model_params:
-                    print("dropping expired client payload...")
+                    print("router", self.router_id, "couldn't find a host router for outgoing payload")
                 continue
 
-            # see if we can get any router_id for a router associated with the payload's client
-            router_ids_map = self.client_router_mapping_dict.get(payload.dest_client_id)
-            if "debug" in self.model.model_params:
-                print("router id map for destination client", payload.dest_client_id, ":", router_ids_map)
-
             # if we have any router_id we can send to, send to them.
-            if router_ids_map is not None:
+            outgoing_payloads = self.outgoing_payloads_by_dest.pop(client_id, {})
+            for payload in outgoing_payloads.values():
                 for router_id in router_ids_map.keys():
                     # create the Bundle.
                     if "debug" in self.model.model_params:
                         print("creating bundle destined to host router:", router_id)
-                    bundle_id = "bundle(routerdst[{}]creationtime[{}],{})".format(router_id, self.model.schedule.time, payload.get_identifier())
-                    bundle = Bundle(bundle_id, router_id, payload, self.model.schedule.time, self.model.model_params["bundle_lifespan"])
+                    bundle_lifespan = self.model.model_params["bundle_lifespan"]
+                    bundle_id = self.model.bundle_ids.get_id((router_id, self.model.schedule.time, payload.get_identifier()),
+                                                             self.model.schedule.time + bundle_lifespan)
+                    bundle = Bundle(bundle_id, router_id, payload, self.model.schedule.time, bundle_lifespan,
+                                    self.model.model_params.get("bundle_size", 1))
 
                     # send the Bundle.
                     self.routing_protocol.handle_bundle(bundle)
-
-            # if we were unable to send out the payload, store it for later.
-            else:
-                unhandled_payloads.append(payload)
-                if "debug" in self.model.model_params:
-                    print("router", self.router_id, "couldn't find a host router for outgoing payload")
-
-        # update the locally-stored payloads.
-        self.outgoing_payloads_to_send = unhandled_payloads
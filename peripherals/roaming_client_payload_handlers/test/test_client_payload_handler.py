@@ -6,6 +6,7 @@ from mockito import mock
 import mesa
 
 from payload import ClientPayload
+from peripherals.routing_protocol.routing_protocol_common import IdAllocator
 from peripherals.roaming_client_payload_handlers.client_payload_handler import ClientClientPayloadHandler
 
 """
@@ -22,13 +23,13 @@ Tests that payloads stored-to-be-sent can expire.
 def test_store_payload_refresh_payload_expires():
     # set up a dummy model object used by the ClientClientPayloadHandler object.
     schedule = mesa.time.RandomActivation(mesa.Model())
-    dummy_model = mock({"schedule": schedule})
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator()})
 
     # create the client_handler
     client_handler = ClientClientPayloadHandler(CLIENT_ID_0, dummy_model)
 
     # create a payload object.
-    payload = ClientPayload(DROP_ID_0, CLIENT_ID_1, CLIENT_ID_0, dummy_model.schedule.time, PAYLOAD_LIFESPAN)
+    payload = ClientPayload(DROP_ID_0, CLIENT_ID_1, CLIENT_ID_0, dummy_model.schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
 
     # store the payload object.
     client_handler.store_payload(payload)
@@ -63,7 +64,7 @@ def test_already_received_payload_ids_expiration():
     already_received_entry = (CLIENT_ID_0, schedule.time)
 
     # store the entry in already_received_payload_ids
-    client_handler.already_received_payload_ids.add(already_received_entry)
+    client_handler.already_received_payload_ids.add(already_received_entry, schedule.time)
 
     # assert that the entry has been stored.
     assert already_received_entry in client_handler.already_received_payload_ids
@@ -76,3 +77,27 @@ def test_already_received_payload_ids_expiration():
 
     # assert that the entry is no longer present in the client_handler.
     assert already_received_entry not in client_handler.already_received_payload_ids
+
+
+"""
+Tests that every payload for a neighbor client is sent to it (and only those payloads).
+"""
+def test_send_payloads_to_neighbor_client():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator(), "model_params": {}})
+
+    client_handler = ClientClientPayloadHandler(CLIENT_ID_0, dummy_model)
+    other_client_handler = ClientClientPayloadHandler(CLIENT_ID_1, dummy_model)
+    other_client_agent = mock({"unique_id": CLIENT_ID_1, "payload_handler": other_client_handler})
+
+    # store two consecutive payloads for the neighbor + one for another client.
+    payloads_for_neighbor = [ClientPayload(drop_id, CLIENT_ID_0, CLIENT_ID_1, schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+                             for drop_id in range(0, 2)]
+    other_payload = ClientPayload(2, CLIENT_ID_0, "c2", schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    for payload in payloads_for_neighbor + [other_payload]:
+        client_handler.store_payload(payload)
+
+    client_handler.send_payloads_to_neighbor_client(other_client_agent)
+
+    assert other_client_handler.num_payloads_received == 2
+    assert client_handler.payloads_to_send == [other_payload]
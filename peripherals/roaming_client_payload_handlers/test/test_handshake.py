@@ -2,6 +2,7 @@
 Used to test the handshake process between the RouterClientPayloadHandler and ClientClientPayloadHandler
 """
 from payload import ClientPayload
+from peripherals.routing_protocol.routing_protocol_common import IdAllocator
 from peripherals.roaming_client_payload_handlers.client_payload_handler import ClientClientPayloadHandler
 from peripherals.roaming_client_payload_handlers.router_payload_handler import RouterClientPayloadHandler
 from mockito import mock, spy2, verify
@@ -28,7 +29,7 @@ and asserts that only the never-seen-before payloads are transferred.
 def test_handshake():
     # set up the router_handler and client_handler such that we can spy upon their handshake method calls.
     schedule = mesa.time.RandomActivation(mesa.Model())
-    dummy_model = mock({"schedule": schedule, "model_params": {"host_router_mapping_timeout": 2500}})
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator(), "bundle_ids": IdAllocator(), "model_params": {"host_router_mapping_timeout": 2500}})
     router_handler = RouterClientPayloadHandler(ROUTER_ID, dummy_model, mock())
     client_handler = ClientClientPayloadHandler(CLIENT_0_ID, dummy_model)
     spy2(router_handler.handshake_2)
@@ -41,18 +42,18 @@ def test_handshake():
     # set up the payloads used for testing.
     # c0 = the test client_handler
     # c1 = some other client_handler (we won't be initializing it though)
-    c0_to_c1_payload_0 = ClientPayload(DROP_ID_0, CLIENT_0_ID, CLIENT_1_ID, 0, PAYLOAD_LIFESPAN)
-    c0_to_c1_payload_1 = ClientPayload(DROP_ID_1, CLIENT_0_ID, CLIENT_1_ID, 1, PAYLOAD_LIFESPAN)
-    c1_to_c0_payload_0 = ClientPayload(DROP_ID_2, CLIENT_1_ID, CLIENT_0_ID, 0, PAYLOAD_LIFESPAN)
-    c1_to_c0_payload_1 = ClientPayload(DROP_ID_3, CLIENT_1_ID, CLIENT_0_ID, 1, PAYLOAD_LIFESPAN)
+    c0_to_c1_payload_0 = ClientPayload(DROP_ID_0, CLIENT_0_ID, CLIENT_1_ID, 0, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    c0_to_c1_payload_1 = ClientPayload(DROP_ID_1, CLIENT_0_ID, CLIENT_1_ID, 1, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    c1_to_c0_payload_0 = ClientPayload(DROP_ID_2, CLIENT_1_ID, CLIENT_0_ID, 0, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    c1_to_c0_payload_1 = ClientPayload(DROP_ID_3, CLIENT_1_ID, CLIENT_0_ID, 1, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
 
     # store the payloads stored in the router_handler which are meant for the client.
     router_handler.handle_payload(c1_to_c0_payload_0)
     router_handler.handle_payload(c1_to_c0_payload_1)
 
     # set up the set of payloads stored in the client_handler as already seen.
-    client_already_received_payload_ids = set([(c1_to_c0_payload_0.get_identifier(), c1_to_c0_payload_0.expiration_timestamp)])
-    client_handler.already_received_payload_ids = client_already_received_payload_ids
+    client_handler.already_received_payload_ids.add((c1_to_c0_payload_0.get_identifier(), c1_to_c0_payload_0.expiration_timestamp),
+                                                    c1_to_c0_payload_0.expiration_timestamp)
 
     # set up the payloads_to_send field in the client_handler.
     client_payloads_to_send = [c0_to_c1_payload_0, c0_to_c1_payload_1]
@@ -9,7 +9,7 @@ import mesa
 
 from payload import ClientPayload, ClientBeaconPayload, ClientMappingDictPayload
 from peripherals.routing_protocol.cgr.cgr import Cgr
-from peripherals.routing_protocol.routing_protocol_common import Bundle
+from peripherals.routing_protocol.routing_protocol_common import Bundle, IdAllocator
 from peripherals.roaming_client_payload_handlers.router_payload_handler import RouterClientPayloadHandler
 
 """
@@ -31,13 +31,13 @@ Tests that payloads stored-to-be-sent-to-a-client can expire.
 def test_handle_payload_refresh_payload_expires():
     # set up a dummy model object used by the RouterClientPayloadHandler object.
     schedule = mesa.time.RandomActivation(mesa.Model())
-    dummy_model = mock({"schedule": schedule, "model_params": {"host_router_mapping_timeout": 2500}})
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator(), "bundle_ids": IdAllocator(), "model_params": {"host_router_mapping_timeout": 2500}})
 
     # create the router_handler
     router_handler = RouterClientPayloadHandler(ROUTER_ID_0, dummy_model, Cgr(0, dummy_model))
 
     # create a payload object.
-    payload = ClientPayload(DROP_ID_0, CLIENT_ID_1, CLIENT_ID_0, dummy_model.schedule.time, PAYLOAD_LIFESPAN)
+    payload = ClientPayload(DROP_ID_0, CLIENT_ID_1, CLIENT_ID_0, dummy_model.schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
 
     # make the router handle the payload.
     router_handler.handle_payload(payload)
@@ -85,8 +85,9 @@ def test_update_client_mapping_refresh_mapping_expires():
     # refresh the router_handler.
     router_handler.refresh()
 
-    # assert that the router stored a record connecting this handler to the client.
-    assert ROUTER_ID_0 not in router_handler.client_router_mapping_dict.get(CLIENT_ID_0)
+    # assert that the router no longer stores a record connecting this handler to the client.
+    # (clients without any routers have no entry at all)
+    assert CLIENT_ID_0 not in router_handler.client_router_mapping_dict
 
 
 """
@@ -98,7 +99,7 @@ Tests that with each refresh...
 def test_send_stored_outgoing_payloads():
     # set up a dummy model object used by the RouterClientPayloadHandler object.
     schedule = mesa.time.RandomActivation(mesa.Model())
-    dummy_model = mock({"schedule": schedule, "model_params": {"host_router_mapping_timeout": 2500, "bundle_lifespan": 2500}})
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator(), "bundle_ids": IdAllocator(), "model_params": {"host_router_mapping_timeout": 2500, "bundle_lifespan": 2500}})
     cgr = Cgr(0, dummy_model)
     spy2(cgr.handle_bundle)
 
@@ -109,9 +110,9 @@ def test_send_stored_outgoing_payloads():
     router_handler.client_router_mapping_dict = {CLIENT_ID_1: {ROUTER_ID_1: sys.maxsize}}
 
     # create + store the three payloads in the router_handler.
-    known_payload = ClientPayload(DROP_ID_0, CLIENT_ID_0, CLIENT_ID_1, schedule.time, PAYLOAD_LIFESPAN)
-    unknown_payload = ClientPayload(DROP_ID_1, CLIENT_ID_1, CLIENT_ID_0, schedule.time, PAYLOAD_LIFESPAN)
-    expired_payload = ClientPayload(DROP_ID_2, CLIENT_ID_0, CLIENT_ID_1, schedule.time - PAYLOAD_LIFESPAN - 1, PAYLOAD_LIFESPAN)
+    known_payload = ClientPayload(DROP_ID_0, CLIENT_ID_0, CLIENT_ID_1, schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    unknown_payload = ClientPayload(DROP_ID_1, CLIENT_ID_1, CLIENT_ID_0, schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    expired_payload = ClientPayload(DROP_ID_2, CLIENT_ID_0, CLIENT_ID_1, schedule.time - PAYLOAD_LIFESPAN - 1, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
 
     router_handler.handshake_6([known_payload, unknown_payload, expired_payload])
 
@@ -119,6 +120,7 @@ def test_send_stored_outgoing_payloads():
     assert known_payload in router_handler.outgoing_payloads_to_send
     assert unknown_payload in router_handler.outgoing_payloads_to_send
     assert expired_payload in router_handler.outgoing_payloads_to_send
+    assert router_handler.get_num_outgoing_payloads() == 3
 
     # refresh the router_handler, triggering an attempt to send out the stored outgoing payloads.
     router_handler.refresh()
@@ -138,6 +140,37 @@ def test_send_stored_outgoing_payloads():
 
     # assert that expired_payload was deleted.
     assert expired_payload not in router_handler.outgoing_payloads_to_send
+    assert router_handler.get_num_outgoing_payloads() == 1
+
+"""
+Tests that outgoing payloads for a client whose router mappings all expired are kept (not dropped), and are sent
+once a new mapping for the client is received.
+"""
+def test_outgoing_payloads_wait_for_new_mapping():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator(), "bundle_ids": IdAllocator(), "model_params": {"host_router_mapping_timeout": 10, "bundle_lifespan": 2500}})
+    cgr = Cgr(0, dummy_model)
+    spy2(cgr.handle_bundle)
+    router_handler = RouterClientPayloadHandler(ROUTER_ID_0, dummy_model, cgr)
+
+    # learn of a mapping for CLIENT_ID_1 + let it expire.
+    router_handler.handle_mapping_dict(ClientMappingDictPayload({CLIENT_ID_1: {ROUTER_ID_1: 5}}))
+    for i in range(0, 5):
+        schedule.step()
+    payload = ClientPayload(DROP_ID_0, CLIENT_ID_0, CLIENT_ID_1, schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    router_handler.handshake_6([payload])
+    router_handler.refresh()
+
+    # the payload is kept, since there is no router to send it to.
+    assert CLIENT_ID_1 not in router_handler.client_router_mapping_dict
+    assert payload in router_handler.outgoing_payloads_to_send
+    verify(cgr, times=0).handle_bundle(...)
+
+    # a new mapping for the client gets the payload sent out.
+    router_handler.handle_mapping_dict(ClientMappingDictPayload({CLIENT_ID_1: {ROUTER_ID_1: schedule.time + 10}}))
+    router_handler.refresh()
+    verify(cgr, times=1).handle_bundle(arg_that(lambda bundle: bundle.dest_id == ROUTER_ID_1 and bundle.payload == payload))
+    assert payload not in router_handler.outgoing_payloads_to_send
 
 """
 Tests that handle_mapping_dict successfully merges in ClientMappingDictPayloads as expected.
@@ -177,4 +210,85 @@ def test_handle_mapping_dict():
     expected_mapping_dict_payload_dict = {CLIENT_ID_0: {ROUTER_ID_0: 0},
                                           CLIENT_ID_1: {ROUTER_ID_0: 1,
                                                         ROUTER_ID_1: 1}}
-    assert expected_mapping_dict_payload_dict == router_handler.client_router_mapping_dict
\ No newline at end of file
+    assert expected_mapping_dict_payload_dict == router_handler.client_router_mapping_dict
+"""
+Tests that get_mapping_updates only returns the client mappings which changed since the last sync with each router.
+"""
+def test_get_mapping_updates():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule, "model_params": {"host_router_mapping_timeout": 2500}})
+    router_handler = RouterClientPayloadHandler(ROUTER_ID_0, dummy_model, mock())
+
+    # nothing to send before any mappings are known.
+    assert router_handler.get_mapping_updates(ROUTER_ID_1) is None
+
+    # the first sync with a router sends every mapping.
+    router_handler.update_client_mapping(ClientBeaconPayload(CLIENT_ID_0))
+    router_handler.handle_mapping_dict(ClientMappingDictPayload({CLIENT_ID_1: {ROUTER_ID_1: 100}}))
+    updates = router_handler.get_mapping_updates(ROUTER_ID_1)
+    assert updates.client_mappings == {CLIENT_ID_0: {ROUTER_ID_0: 2500}, CLIENT_ID_1: {ROUTER_ID_1: 100}}
+
+    # the updates are sent again until the router has applied them.
+    assert router_handler.get_mapping_updates(ROUTER_ID_1).client_mappings == updates.client_mappings
+    router_handler.mark_mappings_synced(ROUTER_ID_1)
+
+    # nothing changed since, so there is nothing to send.
+    assert router_handler.get_mapping_updates(ROUTER_ID_1) is None
+
+    # only the changed mapping is sent.  merging in an older mapping doesn't count as a change.
+    schedule.step()
+    router_handler.update_client_mapping(ClientBeaconPayload(CLIENT_ID_0))
+    router_handler.handle_mapping_dict(ClientMappingDictPayload({CLIENT_ID_1: {ROUTER_ID_1: 50}}))
+    updates = router_handler.get_mapping_updates(ROUTER_ID_1)
+    assert updates.client_mappings == {CLIENT_ID_0: {ROUTER_ID_0: 2501}}
+    router_handler.mark_mappings_synced(ROUTER_ID_1)
+
+    # routers are tracked separately:  a router we've never synced with gets every mapping.
+    updates = router_handler.get_mapping_updates("r2")
+    assert updates.client_mappings == {CLIENT_ID_0: {ROUTER_ID_0: 2501}, CLIENT_ID_1: {ROUTER_ID_1: 100}}
+
+    # expired mappings aren't sent.
+    for i in range(0, 100):
+        schedule.step()
+    router_handler.refresh()
+    router_handler.handle_mapping_dict(ClientMappingDictPayload({CLIENT_ID_1: {"r3": 1000}}))
+    updates = router_handler.get_mapping_updates("r4")
+    assert updates.client_mappings == {CLIENT_ID_0: {ROUTER_ID_0: 2501}, CLIENT_ID_1: {"r3": 1000}}
+
+
+"""
+Tests that the routers we haven't synced client mappings with for a mapping timeout are forgotten.
+"""
+def test_refresh_forgets_peers_not_synced_for_mapping_timeout():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule, "model_params": {"host_router_mapping_timeout": 10}})
+    router_handler = RouterClientPayloadHandler(ROUTER_ID_0, dummy_model, mock())
+
+    router_handler.update_client_mapping(ClientBeaconPayload(CLIENT_ID_0))
+    router_handler.mark_mappings_synced(ROUTER_ID_1)
+    for i in range(0, 5):
+        schedule.step()
+    router_handler.mark_mappings_synced("r2")
+    assert list(router_handler.peer_sync_versions) == [ROUTER_ID_1, "r2"]
+
+    # syncing again moves the router to the end of the peers + renews it.
+    for i in range(0, 3):
+        schedule.step()
+    router_handler.mark_mappings_synced(ROUTER_ID_1)
+    assert list(router_handler.peer_sync_versions) == ["r2", ROUTER_ID_1]
+
+    # r2 was last synced 10 steps ago, while the mapping it got has expired.
+    for i in range(0, 7):
+        schedule.step()
+    router_handler.refresh()
+    assert list(router_handler.peer_sync_versions) == [ROUTER_ID_1]
+    assert router_handler.client_router_mapping_dict == {}
+
+    # a forgotten router gets every mapping, like a router we've never synced with.
+    router_handler.update_client_mapping(ClientBeaconPayload(CLIENT_ID_1))
+    assert router_handler.get_mapping_updates("r2").client_mappings == {CLIENT_ID_1: {ROUTER_ID_0: 25}}
+
+    for i in range(0, 3):
+        schedule.step()
+    router_handler.refresh()
+    assert router_handler.peer_sync_versions == {}
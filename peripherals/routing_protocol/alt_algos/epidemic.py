@@ -1,8 +1,11 @@
 """
 Contains the Epidemic class, which implements the "Epidemic" algorithm with Bundle expiration.
+
+Connected nodes exchange summary vectors (the ids of the bundles they've seen) + only send each other the bundles
+which are missing.  A node only syncs with a neighbor again once it has stored new bundles since their last sync.
 """
 from agent.client_agent import ClientAgent
-from peripherals.routing_protocol.routing_protocol_common import Bundle, handle_payload
+from peripherals.routing_protocol.routing_protocol_common import Bundle, ExpiringIdSet, handle_payload
 
 
 class Epidemic:
@@ -11,9 +14,12 @@ class Epidemic:
         self.node_id = node_id
         self.model = model
         self.agent = agent
-        self.seen_bundle_ids = set()    # Contains bundle_id, used for deduping bundles
+        self.seen_bundle_ids = ExpiringIdSet()  # Contains bundle_id, used for deduping bundles.
+                                                # Bundles are forgotten once they have expired.
         self.curr_bundles = list()       # Bundles currently known by the Epidemic node + being sent out to other nodes.
                                         # Bundles can expire.
+        self.store_version = 0          # incremented whenever a Bundle is added to curr_bundles
+        self.peer_sync_versions = dict()  # key = neighbor id, value = store_version when we last synced with them
         self.num_bundle_sends = 0
         self.num_repeated_bundle_receives = 0
         self.num_bundle_reached_destination = 0
@@ -22,16 +28,27 @@ class Epidemic:
     Receives + stores bundles of data for future propagation.
     """
     def handle_bundle(self, bundle: Bundle):
+        if bundle.expiration_timestamp <= self.model.schedule.time:
+            # expired bundles are dropped (and may have been forgotten already)
+            return
         if bundle.bundle_id in self.seen_bundle_ids:
             self.num_repeated_bundle_receives += 1
         else:
-            self.seen_bundle_ids.add(bundle.bundle_id)
+            self.seen_bundle_ids.add(bundle.bundle_id, bundle.expiration_timestamp)
             # If this is for us, unpack the bundle and handle the payload accordingly
             if self.node_id == bundle.dest_id:
                 handle_payload(self.model, self.node_id, bundle.payload)
                 self.num_bundle_reached_destination += 1
             else: # else, store it so we can flood it to others
                 self.curr_bundles.append(bundle)
+                self.store_version += 1
+
+    """
+    Returns the summary vector of the node:  the ids of every unexpired bundle it has seen.
+    Neighbors use it to only send the bundles the node is missing.
+    """
+    def get_summary_vector(self):
+        return self.seen_bundle_ids
 
     """
     Refreshes the state of the Epidemic object.  Called by the simulation at each timestamp.
@@ -40,6 +57,11 @@ class Epidemic:
         # remove any expired Bundles from the list of curr_bundles which we wish to propagate.
         self.curr_bundles = [bundle for bundle in self.curr_bundles
                               if bundle.expiration_timestamp > self.model.schedule.time]
+        self.seen_bundle_ids.remove_expired(self.model.schedule.time)
+
+        # Nothing to flood, so there is no need to look at the neighbors
+        if len(self.curr_bundles) == 0:
+            return
 
         # find all nearby agents, spam them with your Bundles.
         for neighbor_data in self.model.get_neighbors(self.agent):
@@ -51,12 +73,34 @@ class Epidemic:
                 continue
 
             # if we've reached this point, the neighbor is a connected RouterAgent.
-            # send them all your Bundles.
+            # routers running another protocol have no summary vector, so send them all our Bundles.
+            neighbor_protocol = neighbor_agent.routing_protocol
+            if not isinstance(neighbor_protocol, Epidemic):
+                for bundle in self.curr_bundles:
+                    neighbor_protocol.handle_bundle(bundle)
+                    self.num_bundle_sends += 1
+                continue
+
+            # if we haven't stored any new Bundles since we last synced with them, they already have all of ours.
+            # (Bundles they've seen are only forgotten once they've expired, which is when we drop them too.)
+            if self.peer_sync_versions.get(neighbor_data["id"]) == self.store_version:
+                continue
+
+            # send them the Bundles missing from their summary vector.
+            summary_vector = neighbor_protocol.get_summary_vector()
             for bundle in self.curr_bundles:
-                neighbor_agent.routing_protocol.handle_bundle(bundle)
-                self.num_bundle_sends += 1
+                if bundle.bundle_id not in summary_vector:
+                    neighbor_protocol.handle_bundle(bundle)
+                    self.num_bundle_sends += 1
+            self.peer_sync_versions[neighbor_data["id"]] = self.store_version
 
 
+    """
+    Returns the number of bundles currently stored.  Cheaper than get_state(), for the agent's history.
+    """
+    def get_num_stored_bundles(self):
+        return len(self.curr_bundles)
+
     """
     Called by the agent and sent to the visualization for simulation history log.
     """
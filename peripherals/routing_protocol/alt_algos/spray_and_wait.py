@@ -5,45 +5,90 @@ This algorithm has two parts:
 - spray:  the node creates the bundle + sends it out to a random set of N nearby nodes.
 - wait:  the N nodes which receive the bundle store it.  they then wait to actually run into the recipient node.
          once they run into the intended recipient node, they pass it on.
+
+Two spray modes are supported (model param "spray_and_wait_mode"):
+- "source" (default):  the node which created the bundle sprays a copy to each of the first N nodes it meets.
+- "binary":  the node which created the bundle holds N copy tokens.  whenever a node holding n > 1 tokens meets a node
+             which hasn't seen the bundle, it hands over floor(n / 2) of its tokens.  nodes with 1 token wait.
 """
+import itertools
+
 import numpy as np
 
 from agent.client_agent import ClientAgent
-from peripherals.routing_protocol.routing_protocol_common import Bundle, handle_payload
+from peripherals.routing_protocol.routing_protocol_common import Bundle, ExpiringIdSet, handle_payload
 
 class SprayAndWait:
-    NUM_NODES_TO_SPRAY = 4  # To adjust how many nodes get "sprayed" with the message, modify this value.
+    NUM_NODES_TO_SPRAY = 4  # Default number of nodes which get "sprayed" with each message.
+                            # Can be overridden with the "spray_and_wait_copies" model param.
 
     def __init__(self, node_id, model, agent):
         self.node_id = node_id
         self.model = model
         self.agent = agent
-        self.bundle_sprays_map = {}  # key = bundle, val = list of nodes we already sprayed with the bundle.
-        self.waiting_bundles = []
+        self.mode = model.model_params.get("spray_and_wait_mode", "source")
+        if self.mode not in ("source", "binary"):
+            raise ValueError("Unknown spray_and_wait_mode {}".format(self.mode))
+        self.num_copies = model.model_params.get("spray_and_wait_copies", self.NUM_NODES_TO_SPRAY)
+        self.bundle_sprays_map = {}  # key = bundle, val = set of ids of the nodes we already sprayed with the bundle.
+                                     # ("source" mode)
+        self.bundle_copies_map = {}  # key = bundle, val = number of copy tokens we hold for the bundle (> 1).
+                                     # ("binary" mode)
+        self.waiting_bundles_by_dest = {}  # key = dest_id, val = list of the waiting bundles destined to it.
+                                           # implementation invariant: there are no empty lists.
+        self.next_expiration_timestamp = None  # earliest expiration of the stored bundles, None if there are none.
         self.num_bundle_sends = 0
         self.num_repeated_bundle_receives = 0
         self.num_bundle_reached_destination = 0
-        self.seen_bundle_ids = set() # used for deduping
+        self.seen_bundle_ids = ExpiringIdSet() # used for deduping.  bundles are forgotten once they have expired.
+
+    """
+    Returns a list of the bundles stored for the "wait" part of the algorithm.
+    """
+    @property
+    def waiting_bundles(self):
+        return [bundle for bundles in self.waiting_bundles_by_dest.values() for bundle in bundles]
 
     """
     Receives bundles of data + holds on to them for spraying during `refresh()`.
     """
     def handle_bundle(self, bundle: Bundle):
+        if bundle.expiration_timestamp <= self.model.schedule.time:
+            # expired bundles are dropped (and may have been forgotten already)
+            return
         if bundle.bundle_id in self.seen_bundle_ids:
             self.num_repeated_bundle_receives += 1
         else:
-            self.seen_bundle_ids.add(bundle.bundle_id)
-            self.bundle_sprays_map[bundle] = []
+            self.seen_bundle_ids.add(bundle.bundle_id, bundle.expiration_timestamp)
+            if self.mode == "binary":
+                self.__store_bundle_copies(bundle, self.num_copies)
+            else:
+                self.bundle_sprays_map[bundle] = set()
+                self.__track_expiration(bundle)
 
     """
     Receives bundles and stores them for the "wait" part of the algorithm.
     """
     def handle_bundle_wait(self, bundle: Bundle):
+        if bundle.expiration_timestamp <= self.model.schedule.time:
+            return
+        if bundle.bundle_id in self.seen_bundle_ids:
+            self.num_repeated_bundle_receives += 1
+        else:
+            self.seen_bundle_ids.add(bundle.bundle_id, bundle.expiration_timestamp)
+            self.__store_waiting_bundle(bundle)
+
+    """
+    Receives bundles along with `num_copies` copy tokens ("binary" mode).
+    """
+    def handle_bundle_copies(self, bundle: Bundle, num_copies):
+        if bundle.expiration_timestamp <= self.model.schedule.time:
+            return
         if bundle.bundle_id in self.seen_bundle_ids:
             self.num_repeated_bundle_receives += 1
         else:
-            self.seen_bundle_ids.add(bundle.bundle_id)
-            self.waiting_bundles.append(bundle)
+            self.seen_bundle_ids.add(bundle.bundle_id, bundle.expiration_timestamp)
+            self.__store_bundle_copies(bundle, num_copies)
 
     def handle_bundle_destination(self, bundle: Bundle):
         handle_payload(self.model, self.node_id, bundle.payload)
@@ -56,22 +101,19 @@ class SprayAndWait:
     - Checking to see if any "waiting" Bundles can be sent to their destination + sending them onto their dest if so.
     """
     def refresh(self):
-        # remove any expired Bundles from the map of Bundles which we wish to spray.
-        expired_spraying_list = []  # stores Bundles marked-for-spraying which have expired and need to delete after
-                                    # iteration completes.
-        for bundle in self.bundle_sprays_map.keys():
-            if bundle.expiration_timestamp <= self.model.schedule.time:
-                expired_spraying_list.append(bundle)
-        # delete the expired Bundles from the map of Bundles which we wish to spray.
-        for bundle in expired_spraying_list:
-            del(self.bundle_sprays_map[bundle])
-
-        # remove any expired Bundles from the list of waiting_bundles which we wish to propagate.
-        self.waiting_bundles = [bundle for bundle in self.waiting_bundles
-                                if bundle.expiration_timestamp > self.model.schedule.time]
+        # remove any expired Bundles.  only look through the Bundles once one of them has expired.
+        if self.next_expiration_timestamp is not None and self.next_expiration_timestamp <= self.model.schedule.time:
+            self.__remove_expired_bundles()
+        self.seen_bundle_ids.remove_expired(self.model.schedule.time)
+
+        # Nothing to spray or deliver, so there is no need to look at the neighbors
+        if len(self.bundle_sprays_map) == 0 and len(self.bundle_copies_map) == 0 \
+                and len(self.waiting_bundles_by_dest) == 0:
+            return
 
         # find all nearby agents, shuffle their ordering (to ensure randomized spraying) and iterate thru them...
-        neighbor_list = self.model.get_neighbors(self.agent)
+        # (shuffle a copy, the model shares the neighbor list with every other caller during this step)
+        neighbor_list = list(self.model.get_neighbors(self.agent))
         np.random.shuffle(neighbor_list)
         for neighbor_data in neighbor_list:
             # obtain the agent associated with the neighbor
@@ -84,40 +126,110 @@ class SprayAndWait:
             # if we've reached this point, the neighbor is a connected RouterAgent.
 
             # spray this neighbor with whatever Bundles we have on-hand to spray.
-            finished_spraying_list = []  # stores Bundles for which we have finished spraying and need to delete after
-                                         # iteration completes.
-            for bundle in self.bundle_sprays_map.keys():
-                # if we already sprayed this neighbor with this bundle, move on to the next neighbor.
-                if neighbor_agent in self.bundle_sprays_map[bundle]:
-                    continue
-
-                # otherwise, spray the neighbor w/ the bundle + record the spraying
-                # print("{} spraying bundle to {}".format(self.node_id, neighbor_agent.unique_id))
-                neighbor_agent.routing_protocol.handle_bundle_wait(bundle)
-                self.bundle_sprays_map[bundle].append(neighbor_agent)
+            if self.mode == "binary":
+                self.__spray_copies(neighbor_data["id"], neighbor_agent.routing_protocol)
+            else:
+                self.__spray(neighbor_data["id"], neighbor_agent.routing_protocol)
+
+            # send the connected neighbor any waiting bundles it's the intended recipient of.
+            for bundle in self.waiting_bundles_by_dest.pop(neighbor_data["id"], ()):
+                # print("{} spraying bundle to {}".format(self.node_id, neighbor_data["id"]))
+                neighbor_agent.routing_protocol.handle_bundle_destination(bundle)
                 self.num_bundle_sends += 1
 
-                # if we've sprayed the max number of neighbors, delete the bundle from the map.
-                if len(self.bundle_sprays_map[bundle]) == self.NUM_NODES_TO_SPRAY:
-                    finished_spraying_list.append(bundle)
-            # delete the Bundles we've finished spraying.
-            for bundle in finished_spraying_list:
-                del(self.bundle_sprays_map[bundle])
-
-            # iterate thru your waiting bundles and see if the connected neighbor is the intended recipient of any of
-            # them.
-            finished_waiting_list = []  # stores Bundles which we have successfully transmitted to the dest and need to
-                                        # delete from local storage after iteration completes.
-            for bundle in self.waiting_bundles:
-                if bundle.dest_id == neighbor_data["id"]:
-                    # print("{} spraying bundle to {}".format(self.node_id, neighbor_data["id"]))
-                    neighbor_agent.routing_protocol.handle_bundle_destination(bundle)
-                    finished_waiting_list.append(bundle)
-                    self.num_bundle_sends += 1
-            # delete the Bundles we've successfully transmitted from the waiting list.
-            for bundle in finished_waiting_list:
-                self.waiting_bundles.remove(bundle)
+    """
+    Sprays the neighbor with every bundle it hasn't been sprayed with yet ("source" mode).
+    """
+    def __spray(self, neighbor_id, neighbor_protocol):
+        finished_spraying_list = []  # stores Bundles for which we have finished spraying and need to delete after
+                                     # iteration completes.
+        for bundle, sprayed_node_ids in self.bundle_sprays_map.items():
+            # if we already sprayed this neighbor with this bundle, move on to the next bundle.
+            if neighbor_id in sprayed_node_ids:
+                continue
 
+            # otherwise, spray the neighbor w/ the bundle + record the spraying
+            neighbor_protocol.handle_bundle_wait(bundle)
+            sprayed_node_ids.add(neighbor_id)
+            self.num_bundle_sends += 1
+
+            # if we've sprayed the max number of neighbors, delete the bundle from the map.
+            if len(sprayed_node_ids) == self.num_copies:
+                finished_spraying_list.append(bundle)
+        # delete the Bundles we've finished spraying.
+        for bundle in finished_spraying_list:
+            del self.bundle_sprays_map[bundle]
+
+    """
+    Hands the neighbor half of our copy tokens for every bundle it hasn't seen ("binary" mode).
+    Bundles destined to the neighbor are delivered to it directly.
+    """
+    def __spray_copies(self, neighbor_id, neighbor_protocol):
+        finished_spraying_list = []  # stores Bundles we're down to 1 copy token for (or delivered)
+        for bundle, num_copies in self.bundle_copies_map.items():
+            if bundle.dest_id == neighbor_id:
+                neighbor_protocol.handle_bundle_destination(bundle)
+                self.num_bundle_sends += 1
+                finished_spraying_list.append(bundle)
+                continue
+            if bundle.bundle_id in neighbor_protocol.seen_bundle_ids:
+                continue
+
+            num_copies_to_send = num_copies // 2
+            neighbor_protocol.handle_bundle_copies(bundle, num_copies_to_send)
+            self.num_bundle_sends += 1
+            self.bundle_copies_map[bundle] = num_copies - num_copies_to_send
+            if self.bundle_copies_map[bundle] == 1:
+                finished_spraying_list.append(bundle)
+        # Bundles we're down to 1 copy token for wait for their destination.
+        for bundle in finished_spraying_list:
+            del self.bundle_copies_map[bundle]
+            if bundle.dest_id != neighbor_id:
+                self.__store_waiting_bundle(bundle)
+
+    def __store_bundle_copies(self, bundle, num_copies):
+        if num_copies > 1:
+            self.bundle_copies_map[bundle] = num_copies
+            self.__track_expiration(bundle)
+        else:
+            self.__store_waiting_bundle(bundle)
+
+    def __store_waiting_bundle(self, bundle):
+        if bundle.dest_id not in self.waiting_bundles_by_dest:
+            self.waiting_bundles_by_dest[bundle.dest_id] = []
+        self.waiting_bundles_by_dest[bundle.dest_id].append(bundle)
+        self.__track_expiration(bundle)
+
+    def __track_expiration(self, bundle):
+        if self.next_expiration_timestamp is None or bundle.expiration_timestamp < self.next_expiration_timestamp:
+            self.next_expiration_timestamp = bundle.expiration_timestamp
+
+    def __remove_expired_bundles(self):
+        curr_time = self.model.schedule.time
+        self.bundle_sprays_map = {bundle: sprayed_node_ids for bundle, sprayed_node_ids in self.bundle_sprays_map.items()
+                                  if bundle.expiration_timestamp > curr_time}
+        self.bundle_copies_map = {bundle: num_copies for bundle, num_copies in self.bundle_copies_map.items()
+                                  if bundle.expiration_timestamp > curr_time}
+        waiting_bundles_by_dest = {}
+        for dest_id, bundles in self.waiting_bundles_by_dest.items():
+            bundles = [bundle for bundle in bundles if bundle.expiration_timestamp > curr_time]
+            if bundles:
+                waiting_bundles_by_dest[dest_id] = bundles
+        self.waiting_bundles_by_dest = waiting_bundles_by_dest
+
+        # find the next bundle to expire.
+        self.next_expiration_timestamp = None
+        for bundle in itertools.chain(self.bundle_sprays_map, self.bundle_copies_map, self.waiting_bundles):
+            self.__track_expiration(bundle)
+
+    """
+    Returns the number of unique bundles currently held (waiting or to be sprayed).
+    Cheaper than get_state(), for the agent's history.
+    """
+    def get_num_stored_bundles(self):
+        bundle_ids = {bundle.bundle_id for bundle in self.waiting_bundles}
+        bundle_ids.update(bundle.bundle_id for bundle in itertools.chain(self.bundle_sprays_map, self.bundle_copies_map))
+        return len(bundle_ids)
 
     """
     Called by the agent and sent to the visualization for simulation history log.
@@ -132,7 +244,7 @@ class SprayAndWait:
             else:
                 seen_bundles.add(bundle.bundle_id)
                 curr_bundles.append(bundle.serialize())
-        for bundle in self.bundle_sprays_map.keys():
+        for bundle in itertools.chain(self.bundle_sprays_map, self.bundle_copies_map):
             if bundle.bundle_id in seen_bundles:
                 print("INVARIANT VIOLATION: spray-and-wait found dupe in bundles waiting to be sprayed")
             else:
@@ -19,7 +19,19 @@ class Cgr:
         self.storage = Storage(self.model)
 
         # if no filename is provided, "None" will be supplied to the Schrouter and an empty Schrouter will be created.
-        self.schrouter = Schrouter(contact_plan_json_filename)
+        self.schrouter = Schrouter(contact_plan_json_filename, self.model.model_params.get("cgr_time_horizon"))
+
+        # how many routes to keep per destination.  with more than one, bundles are sent along the best route whose
+        # next hop is currently connected, instead of waiting for the best route's next hop.
+        self.num_routes = self.model.model_params.get("cgr_num_routes", 1)
+
+        # with volume-aware forwarding, a contact carries at most `rate` of bundle volume per step (+ at most its
+        # volume in total), and routes avoid contacts with no residual volume left.
+        self.volume_aware = self.model.model_params.get("cgr_volume_aware", False)
+        # volume sent through each contact during the current step.
+        # key = (contact id, contact start time), value = volume sent.
+        self.step_volumes = dict()
+        self.step_volumes_time = None
 
         # metrics used for easy algo performance comparison
         self.num_bundle_sends = 0
@@ -37,6 +49,9 @@ class Cgr:
 
         # Ingress
         # Process received bundle.
+        # Ignore it if it has expired (the storage forgets about bundles once they have expired)
+        if bundle.expiration_timestamp <= self.model.schedule.time:
+            return
         # Ignore if we've already seen it
         if self.storage.seen_before(bundle):
             self.num_repeated_bundle_receives += 1
@@ -62,23 +77,43 @@ class Cgr:
     Refreshes the state of the CGR object.  Called by the simulation at each timestamp.
     """
     def refresh(self):
+        # 0. Forget about contacts which are over, so they don't slow down route computation.
+        self.schrouter.retire_expired_contacts(self.model.schedule.time)
+
         # 1. Get the destination ids for all bundles
         all_dest_ids = self.storage.get_all_bundle_dest_ids()        
         next_hop_to_dest = dict()
         # 2. Calculate the best next hop for all these destination IDs
         # Must do this on refresh because best route is dependent on current time
+        # (the first hops to every destination come from a single exploration of the contact plan)
+        # (with alternate routes, the next hop also depends on which neighbors are currently connected)
+        first_hops = dict()
+        connected_router_ids = set()
+        if len(all_dest_ids) > 0:
+            if self.num_routes > 1:
+                connected_router_ids = self.__get_connected_router_ids()
+            else:
+                first_hops = self.schrouter.get_best_first_hops(self.node_id, self.model.schedule.time, all_dest_ids)
         for dest_id in all_dest_ids:
-            route = self.schrouter.get_best_route_dijkstra(self.node_id, dest_id, self.model.schedule.time)
-            if route is None:
+            if self.num_routes > 1:
+                first_hop = self.__choose_first_hop(dest_id, connected_router_ids)
+                first_hops[dest_id] = first_hop
+            else:
+                first_hop = first_hops.get(dest_id)
+            if first_hop is None:
                 continue
-            next_hop_id = route.hops[0].to
+            next_hop_id = first_hop.to
             if next_hop_id not in next_hop_to_dest:
                 next_hop_to_dest[next_hop_id] = []
             next_hop_to_dest[next_hop_id].append(dest_id)
 
         # 3. Get rid of any expired bundles
         self.storage.refresh()  # refresh the storage so that any expired Bundles are deleted.
-        
+
+        # Nothing to forward, so there is no need to look at the neighbors
+        if len(next_hop_to_dest) == 0:
+            return
+
         # 4. Iterate over the currently connnected neighbors
         my_agent = self.model.agents[self.node_id]
         for neighbor_data in self.model.get_neighbors(my_agent):
@@ -95,9 +130,60 @@ class Cgr:
                 for dest_id in next_hop_to_dest[neighbor_id]:
                     if "debug" in self.model.model_params:
                         print("neighbor", neighbor_id, "is the next hop for bundles destined to", dest_id)
-                    bundles_to_send_thru_this_neighbor += self.storage.remove_all_bundles_for_dest(dest_id)
+                    if self.volume_aware:
+                        bundles_to_send_thru_this_neighbor += \
+                            self.__remove_bundles_within_contact_volume(dest_id, first_hops[dest_id])
+                    else:
+                        bundles_to_send_thru_this_neighbor += self.storage.remove_all_bundles_for_dest(dest_id)
                 self.__send_bundles_to_neighbor(neighbor_agent, bundles_to_send_thru_this_neighbor)
     
+    """
+    Returns the first hop (a Contact) for bundles to the destination:  the first hop of the best route in the
+    Schrouter's route list whose next hop is currently connected, or the best route's first hop if none of them are.
+    Returns `None` if there is no route to the destination.
+    """
+    def __choose_first_hop(self, dest_id, connected_router_ids):
+        routes = self.schrouter.get_best_routes(self.node_id, dest_id, self.model.schedule.time, self.num_routes)
+        if not routes:
+            return None
+        for route in routes:
+            if route.next_node in connected_router_ids:
+                return route.hops[0]
+        return routes[0].hops[0]
+
+    """
+    Removes the bundles to the destination which still fit through the contact during this step from storage,
+    consumes their volume on the contact + returns them.
+    """
+    def __remove_bundles_within_contact_volume(self, dest_id, contact):
+        curr_timestamp = self.model.schedule.time
+        if self.step_volumes_time != curr_timestamp:
+            self.step_volumes.clear()
+            self.step_volumes_time = curr_timestamp
+
+        step_key = (contact.id, contact.start)
+        step_volume = self.step_volumes.get(step_key, 0)
+        available_volume = min(contact.rate - step_volume, self.schrouter.get_residual_volume(contact))
+        bundles = self.storage.remove_bundles_for_dest_within_volume(dest_id, available_volume)
+
+        sent_volume = sum(bundle.size for bundle in bundles)
+        if sent_volume > 0:
+            self.step_volumes[step_key] = step_volume + sent_volume
+            self.schrouter.consume_contact_volume(contact, sent_volume)
+        return bundles
+
+    """
+    Returns the ids of the RouterAgents we're currently connected to.
+    """
+    def __get_connected_router_ids(self):
+        my_agent = self.model.agents[self.node_id]
+        connected_router_ids = set()
+        for neighbor_data in self.model.get_neighbors(my_agent):
+            neighbor_agent = self.model.agents[neighbor_data["id"]]
+            if neighbor_data["connected"] and not isinstance(neighbor_agent, ClientAgent):
+                connected_router_ids.add(neighbor_data["id"])
+        return connected_router_ids
+
     """
     Given a node that we are currently connected to, sends a bunch of bundles to them
     Must make sure that you are actually "connected" to the next hop, before calling this
@@ -108,6 +194,12 @@ class Cgr:
             neighbor_agent.routing_protocol.handle_bundle(bundle)
             self.num_bundle_sends += 1
 
+    """
+    Returns the number of bundles currently stored.  Cheaper than get_state(), for the agent's history.
+    """
+    def get_num_stored_bundles(self):
+        return self.storage.get_num_bundles()
+
     """
     Called by the agent and sent to the visualization for simulation history log.
     """
@@ -115,7 +207,7 @@ class Cgr:
         curr_bundles = []
         for bundle in self.storage.get_all_bundles():
             curr_bundles.append(bundle.serialize())
-        num_bundles = len(curr_bundles)
+        num_bundles = self.storage.get_num_bundles()
 
         return {
             "total_repeated_bundle_recv": self.num_repeated_bundle_receives,
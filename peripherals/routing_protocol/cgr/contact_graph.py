@@ -0,0 +1,582 @@
+"""
+Contains the ContactGraph class, which stores + indexes a contact plan for fast queries and route computation in CGR.
+"""
+import bisect
+import heapq
+import math
+import sys
+
+import numpy as np
+
+from peripherals.routing_protocol.external_dependencies.py_cgr_lib import ContactPlan, Route, cgr_yen
+
+
+class ContactGraph:
+
+    """
+    contacts = the contact plan, as a py_cgr_lib ContactPlan or a list of py_cgr_lib Contact objects.
+
+    Contacts are stored in a structure-of-arrays ContactPlan + referred to by their row index in it.
+    Contact objects are only built for the hops of returned routes.
+
+    The contact plan order matters:  when two contacts can be reached at the same time, the contact which appears
+    first in the contact plan is explored first.  This matches py_cgr_lib's cgr_dijkstra.
+    Every contact has an "order key" (a tuple) which gives its position in the contact plan.
+    The pieces left over when a contact is split take the original contact's place in the contact plan order.
+
+    time_horizon = how far ahead of the query time route computation looks.  contacts which start more than
+    time_horizon after the query time are kept in the contact plan but left out of route computation until the
+    query time catches up with them.  if `None`, every contact is used (exact routing).
+    """
+    def __init__(self, contacts=None, time_horizon=None):
+        self.time_horizon = time_horizon
+        self.__clear()
+        if contacts is not None:
+            self.set_contacts(contacts)
+
+    def __clear(self):
+        # every contact which was ever part of the contact plan.  removed contacts keep their rows.
+        self.plan = ContactPlan()
+
+        # key = row index of a contact in the contact plan, value = its order key.
+        self.order_keys = dict()
+        self.next_order = 0
+
+        # row index -> (order key, row index, frm, to, start, end, owlt, volume) for the contacts in the contact plan,
+        # or None for removed contacts.  these are the values route computation needs, as plain Python objects.
+        self.entries = []
+
+        # indexes over the whole contact plan.
+        self.outgoing = dict()      # key = frm node id, value = set of row indexes
+        self.incoming = dict()      # key = to node id, value = set of row indexes
+        self.by_id = dict()         # key = contact id, value = list of row indexes
+                                    # (the pieces of a split contact keep the original's id, so this is rarely
+                                    # more than one row.  lists take much less memory than sets here.)
+        self.by_pair = dict()       # key = (frm, to), value = list of (start, order key, row index) sorted by start
+        self.pair_max_duration = dict()  # key = (frm, to), value = the longest (end - start) stored for the pair.
+                                         # bounds how long before a time window an overlapping contact can start.
+
+        # adjacency index used by dijkstra().
+        # key = frm node id, value = list of entries in contact plan order.
+        # contacts which ended at or before self.adjacency_time are left out, since no query at or after that time
+        # can use them.  rebuilt if a query is made at an earlier time.
+        self.adjacency = dict()
+        self.adjacency_time = -math.inf
+        self.ending_heap = []       # (end, row index) for the contacts in self.adjacency.
+        self.starting_heap = []     # (start, row index) for the contacts beyond the time horizon, which are added to
+                                    # self.adjacency once the query time gets within the time horizon of their start.
+                                    # entries of removed contacts are skipped lazily in both heaps.
+
+        # (end, row index) for every contact, used to retire contacts once they have ended for good.
+        self.retiring_heap = []
+        self.retired_before = -math.inf  # every contact which ended before this time was retired.
+
+        # sorted list of every distinct contact start + end time, used to compute how long routes stay valid.
+        # built lazily + thrown away whenever the contact plan changes.
+        self.event_times = None
+        self.has_owlt = False   # whether any contact has a non-zero owlt.  computed alongside self.event_times.
+
+        self.__clear_scratch()
+
+    """
+    Per-query working area of dijkstra(), indexed by row index + reused across queries.
+    A slot only holds a value for the current query if its stamp matches the query's stamp,
+    so nothing needs to be cleared between queries.
+    """
+    def __clear_scratch(self):
+        self.query_stamp = 0
+        self.scratch_reached = []       # stamp of the last query which reached the contact
+        self.scratch_visited = []       # stamp of the last query which visited the contact
+        self.scratch_arrival = []       # best known arrival time at the end of the contact
+        self.scratch_predecessor = []   # row index of the previous contact on the best path, or -1 for the root
+
+    """
+    Replaces the whole contact plan + rebuilds every index.
+    """
+    def set_contacts(self, contacts):
+        self.__clear()
+        if isinstance(contacts, ContactPlan):
+            self.plan = contacts
+            for index, row in enumerate(contacts.rows()):
+                self.__insert_contact(index, (self.next_order,), row)
+                self.next_order += 1
+        else:
+            for contact in contacts:
+                self.add_contact(contact)
+
+    """
+    Returns a copy of this ContactGraph which can be modified without affecting this one.
+    """
+    def copy(self):
+        contact_graph = ContactGraph(time_horizon=self.time_horizon)
+        contact_graph.plan = self.plan.copy()
+        contact_graph.order_keys = dict(self.order_keys)
+        contact_graph.next_order = self.next_order
+        contact_graph.entries = list(self.entries)
+        contact_graph.outgoing = {node_id: set(indexes) for node_id, indexes in self.outgoing.items()}
+        contact_graph.incoming = {node_id: set(indexes) for node_id, indexes in self.incoming.items()}
+        contact_graph.by_id = {contact_id: list(indexes) for contact_id, indexes in self.by_id.items()}
+        contact_graph.by_pair = {pair: list(pair_contacts) for pair, pair_contacts in self.by_pair.items()}
+        contact_graph.pair_max_duration = dict(self.pair_max_duration)
+        contact_graph.adjacency = {node_id: list(node_entries) for node_id, node_entries in self.adjacency.items()}
+        contact_graph.adjacency_time = self.adjacency_time
+        contact_graph.ending_heap = list(self.ending_heap)
+        contact_graph.starting_heap = list(self.starting_heap)
+        contact_graph.retiring_heap = list(self.retiring_heap)
+        contact_graph.retired_before = self.retired_before
+        contact_graph.event_times = self.event_times
+        contact_graph.has_owlt = self.has_owlt
+        return contact_graph
+
+    """
+    Returns the whole contact plan as a list of Contact objects, in contact plan order.
+    """
+    def get_contacts(self):
+        return [self.plan.contact(index) for index in sorted(self.order_keys, key=self.order_keys.get)]
+
+    """
+    Returns the row index of the contact in the contact plan, or `None` if the contact isn't part of it (anymore).
+    """
+    def find_row_index(self, contact):
+        for index in self.by_id.get(contact.id, ()):
+            _, _, frm, to, start, end, _, _ = self.entries[index]
+            if frm == contact.frm and to == contact.to and start == contact.start and end == contact.end:
+                return index
+        return None
+
+    """
+    Appends a contact to the end of the contact plan.
+    """
+    def add_contact(self, contact):
+        index = self.plan.append_contact(contact)
+        self.__insert_contact(index, (self.next_order,), self.plan.row(index))
+        self.next_order += 1
+
+    """
+    Returns if any contact to the specified node exists in the contact plan.
+    """
+    def has_contacts_to(self, node_id) -> bool:
+        return node_id in self.incoming
+
+    """
+    Returns if a contact between the two specified nodes exists in the contact plan.
+    """
+    def has_contacts_between(self, frm, to) -> bool:
+        return (frm, to) in self.by_pair
+
+    """
+    Returns if a contact between the two specified nodes at the _exact_ specified time window exists
+    in the contact plan.
+    """
+    def has_contact_in_exact_window(self, frm, to, start_time, end_time) -> bool:
+        pair_contacts = self.by_pair.get((frm, to), [])
+        # only the contacts which start at start_time need to be looked at.
+        position = bisect.bisect_left(pair_contacts, (start_time,))
+        while position < len(pair_contacts) and pair_contacts[position][0] == start_time:
+            if self.entries[pair_contacts[position][2]][5] == end_time:
+                return True
+            position += 1
+        return False
+
+    """
+    Removes all contacts to or from the specified node.
+    """
+    def remove_all_contacts_for_node(self, node_id):
+        for index in self.outgoing.get(node_id, set()) | self.incoming.get(node_id, set()):
+            self.__delete_contact(index)
+
+    """
+    Removes all contacts with the specified contact id.
+    """
+    def remove_contacts_by_id(self, contact_id):
+        for index in list(self.by_id.get(contact_id, ())):
+            self.__delete_contact(index)
+
+    """
+    Removes the time window [start_time, end_time] from every contact between the two nodes (in either direction).
+    - contacts which lie entirely within the window are removed.
+    - contacts which contain the window are split in two, around the window.
+    - contacts which overlap one side of the window are shortened so they end before / start after the window.
+    - contacts which don't overlap the window are left untouched.
+    """
+    def remove_contacts_in_time_window(self, node_1_id, node_2_id, start_time, end_time):
+        for pair in {(node_1_id, node_2_id), (node_2_id, node_1_id)}:
+            for index in self.__overlapping_contacts(pair, start_time, end_time):
+                order_key = self.order_keys[index]
+                frm, to, start, end, rate, contact_id, confidence, owlt, _ = self.plan.row(index)
+                self.__delete_contact(index)
+
+                # 0-5 exists.  We say "remove 4-8".  The 0-5 window is modified to be 0-3.
+                pieces = []
+                if start < start_time:
+                    pieces.append((start, start_time - 1))
+                if end_time < end:
+                    pieces.append((end_time + 1, end))
+                for piece_index, (piece_start, piece_end) in enumerate(pieces):
+                    piece = self.plan.append(frm, to, piece_start, piece_end, rate, contact_id, confidence, owlt)
+                    self.__insert_contact(piece, order_key + (piece_index,), self.plan.row(piece))
+
+    """
+    Returns the row indexes of the contacts of the (frm, to) pair which overlap [start_time, end_time].
+    """
+    def __overlapping_contacts(self, pair, start_time, end_time):
+        pair_contacts = self.by_pair.get(pair, [])
+        # an overlapping contact ends at or after start_time, so it can't start earlier than
+        # start_time - (the longest contact of the pair).
+        first_position = bisect.bisect_left(pair_contacts, (start_time - self.pair_max_duration.get(pair, 0),))
+        last_position = bisect.bisect_right(pair_contacts, (end_time, (math.inf,)))
+        return [index for _, _, index in pair_contacts[first_position:last_position]
+                if self.entries[index][5] >= start_time]
+
+    """
+    Permanently removes every contact which ended before curr_timestamp.
+    No route leaving at or after curr_timestamp can use these contacts, so routes computed at or after curr_timestamp
+    don't change.  Routes can no longer be computed for timestamps before curr_timestamp.
+
+    Does nothing if contacts were already retired up to curr_timestamp, so every Schrouter sharing this ContactGraph
+    can call it each step while the work is only done once.
+    """
+    def retire_contacts_ended_before(self, curr_timestamp):
+        if curr_timestamp <= self.retired_before:
+            return
+        self.retired_before = curr_timestamp
+        while self.retiring_heap and self.retiring_heap[0][0] < curr_timestamp:
+            _, index = heapq.heappop(self.retiring_heap)
+            if index in self.order_keys:
+                # the retired contacts' start + end times are all before curr_timestamp, so they never affect
+                # get_route_validity_end() for the timestamps that can still be queried.
+                self.__delete_contact(index, keep_event_times=True)
+
+    def __insert_contact(self, index, order_key, row):
+        frm, to, start, end, _, contact_id, _, owlt, volume = row
+        entry = (order_key, index, frm, to, start, end, owlt, volume)
+        if index == len(self.entries):
+            self.entries.append(entry)
+        else:
+            self.entries.extend([None] * (index + 1 - len(self.entries)))
+            self.entries[index] = entry
+
+        self.order_keys[index] = order_key
+        self.outgoing.setdefault(frm, set()).add(index)
+        self.incoming.setdefault(to, set()).add(index)
+        self.by_id.setdefault(contact_id, []).append(index)
+
+        pair = (frm, to)
+        bisect.insort(self.by_pair.setdefault(pair, []), (start, order_key, index))
+        self.pair_max_duration[pair] = max(self.pair_max_duration.get(pair, 0), end - start)
+
+        heapq.heappush(self.retiring_heap, (end, index))
+        self.__index_for_search(entry)
+
+        self.event_times = None
+
+    def __delete_contact(self, index, keep_event_times=False):
+        entry = self.entries[index]
+        order_key, _, frm, to, start, _, _, _ = entry
+        contact_id = self.plan.row(index)[5]
+
+        del self.order_keys[index]
+        self.entries[index] = None
+        self.__discard_from_index(self.outgoing, frm, index)
+        self.__discard_from_index(self.incoming, to, index)
+        self.__discard_from_index(self.by_id, contact_id, index)
+
+        pair = (frm, to)
+        pair_contacts = self.by_pair[pair]
+        del pair_contacts[bisect.bisect_left(pair_contacts, (start, order_key, index))]
+        if not pair_contacts:
+            del self.by_pair[pair]
+
+        self.__remove_from_adjacency(entry)
+
+        if not keep_event_times:
+            self.event_times = None
+
+    @staticmethod
+    def __discard_from_index(index, index_key, row_index):
+        row_indexes = index[index_key]
+        row_indexes.remove(row_index)
+        if not row_indexes:
+            del index[index_key]
+
+    """
+    Adds the contact to the adjacency index, or holds it back until the query time gets within the time horizon
+    of its start.  Contacts which already ended at self.adjacency_time are left out.
+    """
+    def __index_for_search(self, entry):
+        _, index, _, _, start, end, _, _ = entry
+        if end <= self.adjacency_time:
+            return
+        if self.time_horizon is not None and start > self.adjacency_time + self.time_horizon:
+            heapq.heappush(self.starting_heap, (start, index))
+        else:
+            self.__add_to_adjacency(entry)
+
+    def __add_to_adjacency(self, entry):
+        bisect.insort(self.adjacency.setdefault(entry[2], []), entry)
+        heapq.heappush(self.ending_heap, (entry[5], entry[1]))
+
+    def __remove_from_adjacency(self, entry):
+        node_entries = self.adjacency.get(entry[2])
+        if node_entries is None:
+            return
+        position = bisect.bisect_left(node_entries, entry)
+        if position < len(node_entries) and node_entries[position] is entry:
+            del node_entries[position]
+            if not node_entries:
+                del self.adjacency[entry[2]]
+
+    """
+    Moves the adjacency index to curr_timestamp, adding the contacts which came within the time horizon and
+    dropping every contact which ended at or before curr_timestamp.
+    """
+    def __update_adjacency(self, curr_timestamp):
+        if curr_timestamp < self.adjacency_time:
+            # a query back in time:  contacts which were dropped may be needed again, and contacts which were
+            # added may be beyond the time horizon again.
+            self.adjacency = dict()
+            self.ending_heap = []
+            self.starting_heap = []
+            self.adjacency_time = curr_timestamp
+            for index in sorted(self.order_keys, key=self.order_keys.get):
+                self.__index_for_search(self.entries[index])
+
+        self.adjacency_time = curr_timestamp
+        if self.time_horizon is not None:
+            while self.starting_heap and self.starting_heap[0][0] <= curr_timestamp + self.time_horizon:
+                _, index = heapq.heappop(self.starting_heap)
+                entry = self.entries[index]
+                if entry is not None and entry[5] > curr_timestamp:
+                    self.__add_to_adjacency(entry)
+        while self.ending_heap and self.ending_heap[0][0] <= curr_timestamp:
+            _, index = heapq.heappop(self.ending_heap)
+            entry = self.entries[index]
+            if entry is not None:
+                self.__remove_from_adjacency(entry)
+
+    """
+    Returns the time until which every route computed at curr_timestamp stays the same.
+    Any query made at a time in [curr_timestamp, returned time) returns the same route as a query at curr_timestamp,
+    as long as the contact plan doesn't change.
+
+    When every contact has an owlt of 0, arrival times only depend on which contacts have started + ended,
+    so routes can only change at the next contact start or end time after curr_timestamp, or when the next contact
+    comes within the time horizon.
+    Otherwise, routes are only guaranteed to stay the same at curr_timestamp itself.
+    """
+    def get_route_validity_end(self, curr_timestamp):
+        if self.event_times is None:
+            indexes = np.fromiter(self.order_keys, dtype=np.int64, count=len(self.order_keys))
+            starts = self.plan.start[indexes]
+            event_times = [starts, self.plan.end[indexes]]
+            if self.time_horizon is not None:
+                event_times.append(starts - self.time_horizon)
+            self.event_times = np.unique(np.concatenate(event_times)).tolist()
+            self.has_owlt = bool(np.any(self.plan.owlt[indexes] != 0))
+
+        if self.has_owlt:
+            return math.nextafter(curr_timestamp, math.inf)
+
+        next_event_position = bisect.bisect_right(self.event_times, curr_timestamp)
+        if next_event_position == len(self.event_times):
+            return math.inf
+        return self.event_times[next_event_position]
+
+    """
+    Returns the best route from the root node to the destination node, leaving no earlier than curr_timestamp.
+    Returns `None` if no route exists.
+
+    This computes the same routes as py_cgr_lib's cgr_dijkstra, but:
+    - the adjacency index is reused across calls instead of being rebuilt on every call, and skips contacts
+      which already ended at curr_timestamp (+ contacts beyond the time horizon).
+    - the next contact to explore comes from a binary heap keyed on (arrival time, order key) instead of a
+      scan over the whole contact plan, so a query costs O(C log C) instead of O(C^2).
+    - the per-query working area lives in reusable scratch lists indexed by row index instead of on the
+      Contact objects.
+
+    Contacts whose row index is in depleted_indexes are treated as having no residual volume left.
+    """
+    def dijkstra(self, root_node_id, destination_node_id, curr_timestamp, depleted_indexes=()) -> Route:
+        final_indexes = self.__explore(root_node_id, curr_timestamp, {destination_node_id}, depleted_indexes)
+
+        # Done contact graph exploration, check and store new route
+        final_index = final_indexes.get(destination_node_id)
+        if final_index is None:
+            return None
+
+        hops = []
+        index = final_index
+        while index != -1:
+            hops.insert(0, self.plan.contact(index))
+            index = self.scratch_predecessor[index]
+
+        route = Route(hops[0])
+        for hop in hops[1:]:
+            route.append(hop)
+        return route
+
+    """
+    Returns the first hop (a Contact) of the best route from the root node to each of the destination nodes
+    (or to every node reachable from the root, if destination_node_ids is `None`), leaving no earlier than
+    curr_timestamp, as a dict keyed by destination node id.  Unreachable destinations are left out.
+
+    This is a single exploration of the contact graph, which gives every destination the same route as
+    dijkstra() would:  dijkstra() explores contacts in the same order, and only stops once every contact left
+    arrives strictly later than its destination.  Contacts explored after that point can't change the arrival time,
+    final contact or predecessors of that route, since arrival times never decrease along a route.
+    So the exploration stops once that's true for every destination, and costs no more than the most expensive
+    dijkstra() query among the destinations.
+    """
+    def first_hops(self, root_node_id, curr_timestamp, destination_node_ids=None, depleted_indexes=()) -> dict:
+        final_indexes = self.__explore(root_node_id, curr_timestamp, destination_node_ids, depleted_indexes)
+
+        predecessor = self.scratch_predecessor
+        first_hop_indexes = dict()  # key = row index of a contact on a best route, value = row index of its first hop
+        first_hops = dict()
+        for destination_node_id, final_index in final_indexes.items():
+            # walk back along the route until reaching the root or a contact whose first hop is already known.
+            path = []
+            index = final_index
+            while index != -1 and index not in first_hop_indexes:
+                path.append(index)
+                index = predecessor[index]
+            first_hop_index = path[-1] if index == -1 else first_hop_indexes[index]
+            for path_index in path:
+                first_hop_indexes[path_index] = first_hop_index
+            first_hops[destination_node_id] = self.plan.contact(first_hop_index)
+        return first_hops
+
+    """
+    Returns up to num_routes of the best routes from the root node to the destination node, leaving no earlier than
+    curr_timestamp, best route first.  Returns an empty list if no route exists.
+
+    The routes are computed by py_cgr_lib's cgr_yen (Yen's k-shortest paths), so the first route is the same as
+    dijkstra()'s.  Only the contacts in the adjacency index are handed to it, so contacts which already ended
+    at curr_timestamp (+ contacts beyond the time horizon) are left out.
+    Contacts whose row index is in depleted_indexes are left out too.
+    This is far more expensive than dijkstra():  every spur path is a full cgr_dijkstra run over those contacts.
+    """
+    def k_best_routes(self, root_node_id, destination_node_id, curr_timestamp, num_routes,
+                      depleted_indexes=()) -> list:
+        self.__update_adjacency(curr_timestamp)
+        entries = sorted(entry for node_entries in self.adjacency.values() for entry in node_entries
+                         if entry[1] not in depleted_indexes)
+        contacts = [self.plan.contact(entry[1]) for entry in entries]
+        return cgr_yen(root_node_id, destination_node_id, curr_timestamp, contacts, num_routes)
+
+    """
+    Explores the contact graph from the root node, leaving no earlier than curr_timestamp.
+    Returns a dict mapping each reached node id to the row index of the final contact of the best route to it.
+    The routes themselves can be read back from self.scratch_predecessor until the next exploration.
+
+    If destination_node_ids (a set) is given, only routes to those nodes are tracked + the exploration stops as soon
+    as no better route to any of them can be found.
+    """
+    def __explore(self, root_node_id, curr_timestamp, destination_node_ids=None, depleted_indexes=()) -> dict:
+        self.__update_adjacency(curr_timestamp)
+
+        # make room in the scratch lists for every row of the contact plan.
+        missing = len(self.entries) - len(self.scratch_reached)
+        if missing > 0:
+            self.scratch_reached.extend([0] * missing)
+            self.scratch_visited.extend([0] * missing)
+            self.scratch_arrival.extend([sys.maxsize] * missing)
+            self.scratch_predecessor.extend([-1] * missing)
+        self.query_stamp += 1
+        stamp = self.query_stamp
+        reached = self.scratch_reached
+        visited = self.scratch_visited
+        arrival_time = self.scratch_arrival
+        predecessor = self.scratch_predecessor
+
+        track_all_nodes = destination_node_ids is None
+        final_indexes = dict()          # key = node id, value = row index of the final contact of the best route
+        earliest_fin_arr_t = dict()     # key = node id, value = arrival time of the best route
+        # contacts arriving later than this can't improve the route to any destination.
+        # stays sys.maxsize until every destination has been reached, then is the latest of their arrival times.
+        exploration_limit = sys.maxsize
+
+        # the root is a virtual contact from the root node to itself, with a row index of -1.
+        current_index = -1
+        current_node = root_node_id
+        current_frm = root_node_id
+        current_arrival_time = curr_timestamp
+
+        heap = []
+        while True:
+            # Calculate cost of all proximate contacts
+            for order_key, index, frm, to, start, end, owlt, volume in self.adjacency.get(current_node, ()):
+                if visited[index] == stamp:
+                    continue
+                if self.__on_path(to, current_index, current_node):
+                    continue
+                if end <= current_arrival_time:  # <= important!
+                    continue
+                if volume <= 0 or index in depleted_indexes:
+                    # no residual volume
+                    continue
+                if current_frm == to and current_node == frm:
+                    # return to previous node
+                    continue
+
+                # Calculate arrival time (cost)
+                if start < current_arrival_time:
+                    arrvl_time = current_arrival_time + owlt
+                else:
+                    arrvl_time = start + owlt
+
+                # Update cost if better or equal
+                if arrvl_time <= (arrival_time[index] if reached[index] == stamp else sys.maxsize):
+                    reached[index] = stamp
+                    arrival_time[index] = arrvl_time
+                    predecessor[index] = current_index
+                    heapq.heappush(heap, (arrvl_time, order_key, index))
+
+                    # Mark if destination reached
+                    if (track_all_nodes or to in destination_node_ids) \
+                            and arrvl_time < earliest_fin_arr_t.get(to, sys.maxsize):
+                        earliest_fin_arr_t[to] = arrvl_time
+                        final_indexes[to] = index
+                        if not track_all_nodes and len(final_indexes) == len(destination_node_ids):
+                            exploration_limit = max(earliest_fin_arr_t.values())
+
+            if current_index != -1:
+                visited[current_index] = stamp
+
+            # Determine best next contact.  Stale heap entries (visited contacts) are skipped lazily.
+            next_index = -1
+            while heap:
+                arrvl_time, _, index = heap[0]
+                if visited[index] == stamp:
+                    heapq.heappop(heap)
+                    continue
+                # contacts which were never reached (arrival time of sys.maxsize) are never explored,
+                # and neither are contacts which can't beat the best known arrival at any destination.
+                if arrvl_time < sys.maxsize and arrvl_time <= exploration_limit:
+                    next_index = index
+                break
+
+            if next_index == -1:
+                break
+
+            heapq.heappop(heap)
+            current_index = next_index
+            current_frm = self.entries[current_index][2]
+            current_node = self.entries[current_index][3]
+            current_arrival_time = arrival_time[current_index]
+
+        return final_indexes
+
+    """
+    Returns if the node was already visited along the path ending at current_index.
+    Walks the predecessor chain instead of copying a list of visited nodes on every relaxation.
+    """
+    def __on_path(self, node, current_index, current_node):
+        if node == current_node:
+            return True
+        index = current_index
+        while index != -1:
+            if self.entries[index][2] == node:
+                return True
+            index = self.scratch_predecessor[index]
+        return False
@@ -1,63 +1,145 @@
 """
 Contains the Schrouter class, which handles all contact plan-related content for CGR.
 """
+import math
+import os
 import string
-import sys
 
-from peripherals.routing_protocol.external_dependencies.cp_file_tools import read_contact_plan_from_json
-from peripherals.routing_protocol.external_dependencies.py_cgr_lib import Contact, cgr_dijkstra, Route
+import numpy as np
+
+from peripherals.routing_protocol.external_dependencies.cp_file_tools import read_contact_plan_from_json, \
+    read_contact_plan_from_npy
+from peripherals.routing_protocol.external_dependencies.py_cgr_lib import Contact, ContactPlan, Route
+from peripherals.routing_protocol.cgr.contact_graph import ContactGraph
+
+# ContactGraphs loaded from contact plan files, shared by every Schrouter in the process which loads the same file.
+# key = (absolute contact plan filename, time horizon)
+# value = (modification time of the file when it was loaded, ContactGraph)
+# a Schrouter makes its own copy of a shared ContactGraph before modifying its contact plan.  the only change made to
+# a shared ContactGraph is retiring expired contacts (see Schrouter.retire_expired_contacts()).
+shared_contact_graphs = dict()
+
+
+"""
+Returns the shared ContactGraph for the contact plan file.  The file is only loaded the first time it's requested,
+or again if it was modified since, or if a simulation already retired contacts from it (a new simulation starts from
+time 0, so it needs every contact).
+
+Loading this before forking (e.g. before starting batch processes) lets every process use the same copy.
+"""
+def load_shared_contact_graph(contact_plan_filename, time_horizon=None):
+    key = (os.path.abspath(contact_plan_filename), time_horizon)
+    modification_time = os.stat(contact_plan_filename).st_mtime_ns
+    cached = shared_contact_graphs.get(key)
+    if cached is None or cached[0] != modification_time or cached[1].retired_before > -math.inf:
+        contact_graph = ContactGraph(load_contact_plan(contact_plan_filename), time_horizon)
+        shared_contact_graphs[key] = (modification_time, contact_graph)
+    return shared_contact_graphs[key][1]
+
+
+"""
+Loads a contact plan file into a ContactPlan.
+Files ending in .npy (see cp_file_tools --j2n) are memory-mapped instead of parsed.  Any other file is read as JSON.
+
+Contacts get the IDs 0, 1, 2, ... in file order, just like contacts added through Schrouter.add_contact().
+"""
+def load_contact_plan(contact_plan_filename) -> ContactPlan:
+    if os.path.splitext(contact_plan_filename)[1] == ".npy":
+        contacts = read_contact_plan_from_npy(contact_plan_filename)
+        return ContactPlan.from_arrays(
+            frm=contacts["source"],
+            to=contacts["dest"],
+            start=contacts["startTime"],
+            end=contacts["endTime"],
+            rate=contacts["rate"],
+            id=np.arange(len(contacts)),
+            confidence=contacts["confidence"],
+            owlt=contacts["owlt"])
+
+    # read in the contact plan JSON data from the JSON file + convert it into one column per contact field.
+    contact_jsons = read_contact_plan_from_json(contact_plan_filename)
+    return ContactPlan.from_columns(
+        frm=[contact["source"] for contact in contact_jsons],
+        to=[contact["dest"] for contact in contact_jsons],
+        start=[contact["startTime"] for contact in contact_jsons],
+        end=[contact["endTime"] for contact in contact_jsons],
+        rate=[contact["rate"] for contact in contact_jsons],
+        id=range(len(contact_jsons)),
+        confidence=[contact["confidence"] for contact in contact_jsons],
+        owlt=[contact["owlt"] for contact in contact_jsons])
 
 
 class Schrouter:
 
     """
-    Declare contact_plan_json_filename when loading a precreated contact plan from a JSON.
+    Declare contact_plan_json_filename when loading a precreated contact plan from a JSON (or a .npy file made by
+    cp_file_tools).
+
+    Declare time_horizon to only consider contacts starting within time_horizon of the current time when computing
+    routes.  This keeps route computation cheap on long contact plans, at the cost of missing routes through
+    contacts further in the future.
     """
-    def __init__(self, contact_plan_json_filename: string = None):
-        self.contact_plan = []
+    def __init__(self, contact_plan_json_filename: string = None, time_horizon=None):
+        self.contact_graph = ContactGraph(time_horizon=time_horizon)  # stores + indexes the contact plan.
+        self.owns_contact_graph = True  # False while self.contact_graph is shared with other Schrouters.
+
+        # caches the routes computed by get_best_route_dijkstra().
+        # key = (root node id, destination node id)
+        # value = (route, valid_from, valid_until), where the route is the best route for any timestamp in
+        #         [valid_from, valid_until).
+        # must be cleared whenever the contact plan changes.
+        self.route_cache = dict()
+        # caches the first hops computed by get_best_first_hops(), the same way.
+        # key = root node id
+        # value = (first hops, valid_from, valid_until, set of destination node ids the first hops were computed for
+        #          or `None` for every node)
+        self.first_hop_cache = dict()
+        # stores the route lists computed by get_best_routes().
+        # key = (root node id, destination node id)
+        # value = (routes, num_routes, built_at, rebuild_at), where the routes were computed at built_at + are kept
+        #         until rebuild_at:  the time the best route expires, or the time routes can next change if there
+        #         was no route.
+        # must be cleared whenever the contact plan changes.
+        self.route_tables = dict()
+        # volume sent through each contact via consume_contact_volume().
+        # key = row index of a contact in the contact graph, value = volume consumed so far.
+        self.consumed_volumes = dict()
+        # row indexes of the contacts with no residual volume left.  routes are computed without them.
+        self.depleted_contact_indexes = set()
         self.next_contact_id = 0  # stores the next "connection ID" we should assign.  these IDs are used to
                                      # internally identify connections.
 
-        # if the contact_plan_json_filename is defined, load the file.
+        # if the contact_plan_json_filename is defined, use the (shared) contact plan loaded from the file.
         if contact_plan_json_filename is not None:
-            # read in the contact plan JSON data from the JSON file.
-            contact_jsons = read_contact_plan_from_json(contact_plan_json_filename)
+            self.contact_graph = load_shared_contact_graph(contact_plan_json_filename, time_horizon)
+            self.owns_contact_graph = False
+            self.next_contact_id = len(self.contact_graph.plan)
 
-            # convert the contact plan JSON data into Contact objects
-            for contact in contact_jsons:
-                self.add_contact(
-                        source=contact["source"],
-                        dest=contact["dest"],
-                        start_time=contact["startTime"],
-                        end_time=contact["endTime"],
-                        rate=contact["rate"],
-                        owlt=contact["owlt"],
-                        confidence=contact["confidence"])
+    """
+    Returns the contact plan as a list of Contact objects, in contact plan order.
+    """
+    @property
+    def contact_plan(self):
+        return self.contact_graph.get_contacts()
 
     """
     Returns if any path to the specified node exists in the contact plan. 
     """
     def check_any_availability(self, node_id) -> bool:
-        return len(list(filter(
-            lambda contact: contact.to == node_id,
-            self.contact_plan))) > 0
+        return self.contact_graph.has_contacts_to(node_id)
 
     """
     Returns if a contact between the two specified nodes exists in the contact plan. 
     """
     def check_contact_availability(self, source_id, dest_id) -> bool:
-        return len(list(filter(
-            lambda contact: contact.frm == source_id and contact.to == dest_id,
-            self.contact_plan))) > 0
+        return self.contact_graph.has_contacts_between(source_id, dest_id)
 
     """
     Returns if a contact between the two specified nodes at the _exact_ specified time window exists 
     in the contact plan. 
     """
     def check_contact_availability_specific_time_window(self, source_id, dest_id, start_time, end_time) -> bool:
-        return len(list(filter(
-            lambda contact: contact.frm == source_id and contact.to == dest_id and contact.start == start_time and contact.end == end_time,
-            self.contact_plan))) > 0
+        return self.contact_graph.has_contact_in_exact_window(source_id, dest_id, start_time, end_time)
 
     """
     Adds a contact to the contact plan.
@@ -85,98 +167,84 @@ class Schrouter:
                     owlt=owlt,
                     confidence=confidence,
                 )
-        self.contact_plan.append(new_contact)
+        self.__own_contact_graph()
+        self.contact_graph.add_contact(new_contact)
+        self.__clear_route_caches()
 
     """
-    Removes all contacts associated with the passed contact_id from the contact plan.
+    Removes all contacts to or from the passed node_id from the contact plan.
     """
     def remove_all_contacts_for_node(self, node_id):
-        self.contact_plan = [contact for contact in self.contact_plan if contact.to != node_id and contact.frm != node_id]
+        self.__own_contact_graph()
+        self.contact_graph.remove_all_contacts_for_node(node_id)
+        self.__clear_route_caches()
 
 
     """
     Removes all contacts associated with the passed contact_id from the contact plan.
     """
     def remove_contact_by_contact_id(self, contact_id):
-        self.contact_plan = [contact for contact in self.contact_plan if contact.id != contact_id]
+        self.__own_contact_graph()
+        self.contact_graph.remove_contacts_by_id(contact_id)
+        self.__clear_route_caches()
 
     """
     Removes all contacts associated with the passed node ids within the specified window from the contact plan.
+    Contacts which overlap the window are shortened or split so that none of them overlap the window anymore.
     """
     def remove_contacts_in_time_window(self, node_1_id, node_2_id, start_time, end_time):
-        # 0-5 exists.  We say "remove 4-8".  The 0-5 window is modified to be 0-3.
-        new_contact_plan = []
-        for contact in self.contact_plan:
-            if (contact.frm == node_1_id and contact.to == node_2_id) \
-                    or (contact.frm == node_2_id and contact.to == node_1_id):
-                # if we have found a contact for the contact_id, compute one which does not overlap with the window (if possible)
-
-                # check to see if the contact lies entirely within the time window.
-                if contact.start >= start_time and contact.end <= end_time:
-                    # skip to the next contact if so.  (this effectively throws out this contact)
-                    continue
-                elif contact.start < start_time and end_time < contact.end:
-                    # if the removal window is entirely within the contact, create + store two new contacts:
-                    # - one which is from contact.start -> start_time - 1
-                    # - one which is from end_time + 1 -> contact.end
-                    contact1 = Contact(
-                        contact.frm,
-                        contact.to,
-                        contact.start,
-                        start_time - 1,
-                        contact.rate,
-                        contact.id,
-                        contact.confidence,
-                        contact.owlt
-                    )
-                    contact2 = Contact(
-                        contact.frm,
-                        contact.to,
-                        end_time + 1,
-                        contact.end,
-                        contact.rate,
-                        contact.id,
-                        contact.confidence,
-                        contact.owlt
-                    )
-                    new_contact_plan.append(contact1)
-                    new_contact_plan.append(contact2)
-
-                elif contact.start < start_time <= end_time <= end_time:
-                    # if the end falls within the window, store an identical contact where the end is start_time - 1.
-                    contact = Contact(
-                        contact.frm,
-                        contact.to,
-                        contact.start,
-                        start_time - 1,
-                        contact.rate,
-                        contact.id,
-                        contact.confidence,
-                        contact.owlt
-                    )
-                    new_contact_plan.append(contact)
-
-                elif start_time <= contact.start <= contact.end < end_time:
-                    # if the end falls within the window, store an identical contact where the start is end_time + 1.
-                    contact = Contact(
-                        contact.frm,
-                        contact.to,
-                        end_time + 1,
-                        contact.end,
-                        contact.rate,
-                        contact.id,
-                        contact.confidence,
-                        contact.owlt
-                    )
-                    new_contact_plan.append(contact)
-
-            else:
-                # otherwise, just add the contact to the new contact plan.
-                new_contact_plan.append(contact)
-
-
-        # update the stored contact plan to be the newly-computed new_contact_plan
-        self.contact_plan = new_contact_plan
+        self.__own_contact_graph()
+        self.contact_graph.remove_contacts_in_time_window(node_1_id, node_2_id, start_time, end_time)
+        self.__clear_route_caches()
+
+    """
+    Removes all contacts which ended before curr_timestamp from the contact plan.  These contacts can't be used
+    by any route computed from now on, so this doesn't change any routes (+ cached routes stay valid).
+
+    Shared contact plans are retired too.  They are shared by the Schrouters of one simulation, which all move forward
+    in time together, and the contacts are only retired once per timestamp however many of them call this.
+    Simulations created afterwards load the contact plan again (see load_shared_contact_graph()).
+    """
+    def retire_expired_contacts(self, curr_timestamp):
+        self.contact_graph.retire_contacts_ended_before(curr_timestamp)
+
+    """
+    Returns the volume the contact can still carry:  its volume minus the volume consumed through it so far.
+    Returns 0 for contacts which aren't part of the contact plan.
+    """
+    def get_residual_volume(self, contact):
+        index = self.contact_graph.find_row_index(contact)
+        if index is None:
+            return 0
+        return contact.volume - self.consumed_volumes.get(index, 0)
+
+    """
+    Records that the specified volume was sent through the contact.
+    Once a contact has no residual volume left, it's left out of every route computed from then on
+    (like py_cgr_lib's cgr_depleted).
+    """
+    def consume_contact_volume(self, contact, volume):
+        index = self.contact_graph.find_row_index(contact)
+        if index is None:
+            return
+        consumed_volume = self.consumed_volumes.get(index, 0) + volume
+        self.consumed_volumes[index] = consumed_volume
+        if consumed_volume >= contact.volume and index not in self.depleted_contact_indexes:
+            self.depleted_contact_indexes.add(index)
+            self.__clear_route_caches()
+
+    def __clear_route_caches(self):
+        self.route_cache.clear()
+        self.first_hop_cache.clear()
+        self.route_tables.clear()
+
+    """
+    Makes sure self.contact_graph can be modified, by copying it if it's shared with other Schrouters.
+    """
+    def __own_contact_graph(self):
+        if not self.owns_contact_graph:
+            self.contact_graph = self.contact_graph.copy()
+            self.owns_contact_graph = True
 
     """
     Returns the best route for the specified contact_id in the stored contact plan as calculated via Dijkstra's.
@@ -184,21 +252,97 @@ class Schrouter:
     curr_timestamp = the timestamp at which we're computing the route.
     """
     def get_best_route_dijkstra(self, root_node_id, destination_node_id, curr_timestamp) -> Route:
-        # create root_contact object to use for dijkstra's.
-        root_contact = Contact(start=0,
-                    end=sys.maxsize,
-                    frm=root_node_id,
-                    to=root_node_id,
-                    rate=100,
-                    id=-1)
-        root_contact.arrival_time = curr_timestamp
-
-        # run dijkstra's, return the best route.  if any errors are generated, just return `None`
+        # reuse the cached route if it is still valid at curr_timestamp.
+        cache_key = (root_node_id, destination_node_id)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            route, valid_from, valid_until = cached
+            if valid_from <= curr_timestamp < valid_until:
+                return route
+
+        route = self.__compute_best_route_dijkstra(root_node_id, destination_node_id, curr_timestamp)
+        valid_until = self.contact_graph.get_route_validity_end(curr_timestamp)
+        self.route_cache[cache_key] = (route, curr_timestamp, valid_until)
+        return route
+
+    def __compute_best_route_dijkstra(self, root_node_id, destination_node_id, curr_timestamp) -> Route:
+        # run dijkstra's over the indexed contact graph, return the best route.  if any errors are generated,
+        # just return `None`
         try:
-            return cgr_dijkstra(root_contact, destination_node_id, self.contact_plan)
+            return self.contact_graph.dijkstra(root_node_id, destination_node_id, curr_timestamp,
+                                               self.depleted_contact_indexes)
         except:
             return None
 
+    """
+    Returns the first hop (a Contact) of the best route from the root node to each of the destination nodes
+    (or to every reachable node, if destination_node_ids is `None`), as calculated via a single exploration of the
+    contact plan.  The first hops are returned as a dict keyed by destination node id, and are the same as the first
+    hops of the routes returned by get_best_route_dijkstra().  Unreachable destinations are left out.
+
+    curr_timestamp = the timestamp at which we're computing the routes.
+    """
+    def get_best_first_hops(self, root_node_id, curr_timestamp, destination_node_ids=None) -> dict:
+        if destination_node_ids is not None:
+            destination_node_ids = set(destination_node_ids)
+
+        # reuse the cached first hops if they are still valid at curr_timestamp + cover every destination.
+        cached = self.first_hop_cache.get(root_node_id)
+        if cached is not None:
+            first_hops, valid_from, valid_until, cached_destination_node_ids = cached
+            if valid_from <= curr_timestamp < valid_until:
+                if cached_destination_node_ids is None or \
+                        (destination_node_ids is not None and destination_node_ids <= cached_destination_node_ids):
+                    return first_hops
+                if destination_node_ids is not None:
+                    # keep the cached destinations covered too, so alternating destination sets don't thrash.
+                    destination_node_ids |= cached_destination_node_ids
+
+        try:
+            first_hops = self.contact_graph.first_hops(root_node_id, curr_timestamp, destination_node_ids,
+                                                       self.depleted_contact_indexes)
+        except:
+            # same as get_best_route_dijkstra():  errors mean no routes.
+            first_hops = dict()
+        valid_until = self.contact_graph.get_route_validity_end(curr_timestamp)
+        self.first_hop_cache[root_node_id] = (first_hops, curr_timestamp, valid_until, destination_node_ids)
+        return first_hops
+
+    """
+    Returns up to num_routes of the best routes (the route list) from the root node to the destination node,
+    best route first, as calculated via Yen's algorithm.  Returns an empty list if no route exists.
+
+    Route lists are kept between calls + only rebuilt when the contact plan changes or the best route expires,
+    like ION does.  Until then, alternate routes which expired are dropped from the list, but no new ones are added.
+
+    curr_timestamp = the timestamp at which we're computing the routes.
+    """
+    def get_best_routes(self, root_node_id, destination_node_id, curr_timestamp, num_routes) -> list:
+        table_key = (root_node_id, destination_node_id)
+        route_table = self.route_tables.get(table_key)
+        if route_table is not None:
+            routes, table_num_routes, built_at, rebuild_at = route_table
+            if table_num_routes == num_routes and built_at <= curr_timestamp < rebuild_at:
+                # a route expires once one of its contacts has ended.
+                unexpired_routes = [route for route in routes if route.to_time > curr_timestamp]
+                if len(unexpired_routes) < len(routes):
+                    routes = unexpired_routes
+                    self.route_tables[table_key] = (routes, num_routes, built_at, rebuild_at)
+                return routes
+
+        try:
+            routes = self.contact_graph.k_best_routes(root_node_id, destination_node_id, curr_timestamp, num_routes,
+                                                      self.depleted_contact_indexes)
+        except:
+            # same as get_best_route_dijkstra():  errors mean no routes.
+            routes = []
+        if routes:
+            rebuild_at = routes[0].to_time
+        else:
+            rebuild_at = self.contact_graph.get_route_validity_end(curr_timestamp)
+        self.route_tables[table_key] = (routes, num_routes, curr_timestamp, rebuild_at)
+        return routes
+
     """
     Returns the best route for the specified contact_id in the stored contact plan as calculated via OCGR.
     """
@@ -1,7 +1,10 @@
 """
 Contains the Storage class, for holding bundles to be transmitted.
 """
+import heapq
+import itertools
 
+from peripherals.routing_protocol.routing_protocol_common import ExpiringIdSet
 
 class Storage:
 
@@ -9,13 +12,22 @@ class Storage:
         # initialize dictionary to store bundles.
         self.model = model
 
-        self.seen_bundle_ids = set() # for deduping
+        self.seen_bundle_ids = ExpiringIdSet() # for deduping.  forgets bundles once they have expired.
 
         # key = destination
-        # value = list containing bundles which need to be sent to that destination.
-        # implementation invariant: there are no empty lists. if there are no bundles, there should be no key
+        # value = dict of bundle id -> bundle for the bundles which need to be sent to that destination,
+        #         in the order they were stored.
+        # implementation invariant: there are no empty dicts. if there are no bundles, there should be no key
         self.stored_message_dict = dict()
 
+        # (expiration timestamp, insertion number, destination, bundle) for every stored bundle, as a min-heap.
+        # bundles which already left the storage are skipped when they reach the top of the heap.
+        self.expiration_heap = []
+        self.insertion_counter = itertools.count()  # breaks ties between bundles expiring at the same time
+
+        self.num_bundles = 0
+        self.all_bundles = None  # returned by get_all_bundles(), or None if it has to be rebuilt
+
     def seen_before(self, bundle):
         return bundle.bundle_id in self.seen_bundle_ids
 
@@ -27,10 +39,14 @@ class Storage:
         if self.seen_before(bundle):
             return True
         else:
-            self.seen_bundle_ids.add(bundle.bundle_id)
+            self.seen_bundle_ids.add(bundle.bundle_id, bundle.expiration_timestamp)
             if dest_id not in self.stored_message_dict:
-                self.stored_message_dict[dest_id] = []
-            self.stored_message_dict[dest_id].append(bundle)
+                self.stored_message_dict[dest_id] = dict()
+            self.stored_message_dict[dest_id][bundle.bundle_id] = bundle
+            heapq.heappush(self.expiration_heap,
+                           (bundle.expiration_timestamp, next(self.insertion_counter), dest_id, bundle))
+            self.num_bundles += 1
+            self.all_bundles = None
             return False
 
     """
@@ -42,15 +58,21 @@ class Storage:
 
     """
     Returns a list of all bundles in storage.
+    The list is only rebuilt after the storage changes, and must not be modified by callers.
 
     Returns an empty list if there are no bundles
     """
     def get_all_bundles(self):
-        all_bundles = []
-        for bundle_list in self.stored_message_dict.values():
-            all_bundles += bundle_list
-        return all_bundles
-    
+        if self.all_bundles is None:
+            self.all_bundles = [bundle for bundles in self.stored_message_dict.values() for bundle in bundles.values()]
+        return self.all_bundles
+
+    """
+    Returns the number of bundles in storage.
+    """
+    def get_num_bundles(self):
+        return self.num_bundles
+
     """
     Returns list of bundles destined to the given dest_id
 
@@ -59,61 +81,98 @@ class Storage:
     def get_all_bundles_for_dest(self, dest_id):
         if dest_id not in self.stored_message_dict:
             return None
-        return self.stored_message_dict[dest_id]
-    
+        return list(self.stored_message_dict[dest_id].values())
+
     """
     Returns list of bundles that we should send to the given next hop,
     and removes them from storage.
 
-    Returns None if no bundles are available
+    Returns an empty list if no bundles are available
     """
     def remove_all_bundles_for_dest(self, dest_id):
         if dest_id not in self.stored_message_dict:
-            return None
+            return []
+
+        bundles = list(self.stored_message_dict.pop(dest_id).values())
+        self.num_bundles -= len(bundles)
+        self.all_bundles = None
+        return bundles
+
+    """
+    Returns the oldest bundles destined to the given dest_id whose sizes add up to at most `volume`,
+    and removes them from storage.  Stops at the first bundle which doesn't fit, so bundles are still sent in order.
 
-        return self.stored_message_dict.pop(dest_id)
+    Returns an empty list if no bundles fit.
+    """
+    def remove_bundles_for_dest_within_volume(self, dest_id, volume):
+        if dest_id not in self.stored_message_dict:
+            return []
+
+        bundles = []
+        for bundle in self.stored_message_dict[dest_id].values():
+            if bundle.size > volume:
+                break
+            volume -= bundle.size
+            bundles.append(bundle)
+
+        for bundle in bundles:
+            self.__remove_bundle(dest_id, bundle.bundle_id)
+        return bundles
 
     """
     Retrieves a bundle for us to send from storage.
-    
+
     If `last_bundle` is provided + it matches the front of the stored list of bundles, we remove
     it from the list of bundles.  We want to provide this parameter once we've successfully sent
     out a bundle to ensure we don't retrieve + send that same bundle again.
-    
+
     If no bundle exists to send, we return `None`.
     """
     def get_next_bundle_for_id(self, dest_id, last_bundle=None):
 
-        # if we have no list of bundles on-hand for the specified ID, return "None".
+        # if we have no bundles on-hand for the specified ID, return "None".
         if dest_id not in self.stored_message_dict:
             return None
 
-        # if last_bundle was provided and last_bundle == front of the list,
-        # remove the front of the list.
-        if self.stored_message_dict[dest_id][0] == last_bundle:
-            self.stored_message_dict[dest_id].pop(0)
+        # if last_bundle was provided and last_bundle == front of the bundles,
+        # remove the front of the bundles.
+        first_bundle = next(iter(self.stored_message_dict[dest_id].values()))
+        if first_bundle == last_bundle:
+            self.__remove_bundle(dest_id, first_bundle.bundle_id)
 
-        # if no bundles exist in the list, return None.
-        if not self.stored_message_dict[dest_id]:
-            # Get rid of this key because it's empty
-            self.stored_message_dict.pop(dest_id)
-            return None
+            # if no bundles are left, return None.
+            if dest_id not in self.stored_message_dict:
+                return None
+            first_bundle = next(iter(self.stored_message_dict[dest_id].values()))
 
-        # return the bundle at the front of the list.
-        return self.stored_message_dict[dest_id][0]
+        # return the bundle at the front of the bundles.
+        return first_bundle
 
     """
-    Refreshes the storage to delete any expired Bundles.
+    Refreshes the storage to delete any expired Bundles (+ forget that they were seen).
+    Only looks at the bundles which expired, in order of expiration.
     """
     def refresh(self):
-        dest_ids_to_remove = []
-        for dest_id in self.stored_message_dict:
-            bundle_list = self.stored_message_dict[dest_id]
-            for bundle in bundle_list:
-                if bundle.expiration_timestamp <= self.model.schedule.time:
-                    bundle_list.remove(bundle)
-            if len(bundle_list) == 0:
-                dest_ids_to_remove.append(dest_id)
-        
-        for id in dest_ids_to_remove:
-            self.stored_message_dict.pop(id)
\ No newline at end of file
+        curr_timestamp = self.model.schedule.time
+        self.seen_bundle_ids.remove_expired(curr_timestamp)
+        while self.expiration_heap and self.expiration_heap[0][0] <= curr_timestamp:
+            _, _, dest_id, bundle = heapq.heappop(self.expiration_heap)
+            bundles = self.stored_message_dict.get(dest_id)
+            if bundles is not None and bundles.get(bundle.bundle_id) is bundle:
+                self.__remove_bundle(dest_id, bundle.bundle_id)
+
+        # the heap also holds bundles which were sent before they expired.
+        # rebuild it from the stored bundles once those make up most of it.
+        if len(self.expiration_heap) > 2 * self.num_bundles + 64:
+            self.expiration_heap = [entry for entry in self.expiration_heap
+                                    if self.stored_message_dict.get(entry[2], {}).get(entry[3].bundle_id) is entry[3]]
+            heapq.heapify(self.expiration_heap)
+
+    def __remove_bundle(self, dest_id, bundle_id):
+        bundles = self.stored_message_dict[dest_id]
+        del bundles[bundle_id]
+        if not bundles:
+            # Get rid of this key because it's empty
+            self.stored_message_dict.pop(dest_id)
+        self.num_bundles -= 1
+        self.all_bundles = None
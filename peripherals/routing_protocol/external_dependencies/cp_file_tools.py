@@ -2,15 +2,78 @@ import csv
 import json
 import os
 import argparse
+import textwrap
+
+import numpy as np
 
 DEFAULT_OUT_DIR = "./out/"
 
+# fields stored in .npy contact plans, and the value used when a JSON contact doesn't have the field
+NPY_FIELD_DEFAULTS = {
+    "contact": None,
+    "source": None,
+    "dest": None,
+    "startTime": None,
+    "endTime": None,
+    "rate": None,
+    "owlt": 0,
+    "confidence": 1.0,
+}
+
 def read_contact_plan_from_json(filename):
     with open(filename, "r") as read_file:
         data = json.load(read_file)
         contacts = data["contacts"]
         return contacts
     
+# returns a structured NumPy array with one field per entry of NPY_FIELD_DEFAULTS, memory-mapped from the file
+def read_contact_plan_from_npy(filename):
+    return np.load(filename, mmap_mode="r")
+
+def write_contact_plan_to_npy(contacts, filename):
+    columns = {}
+    for field, default in NPY_FIELD_DEFAULTS.items():
+        values = [contact[field] if default is None else contact.get(field, default) for contact in contacts]
+        if all(type(value) is int for value in values):
+            columns[field] = np.array(values, dtype=np.int64)
+        elif all(type(value) in (int, float) for value in values):
+            columns[field] = np.array(values, dtype=np.float64)
+        else:
+            raise ValueError("%s must be numeric to be stored in a .npy contact plan" % field)
+    array = np.zeros(len(contacts), dtype=[(field, column.dtype) for field, column in columns.items()])
+    for field, column in columns.items():
+        array[field] = column
+    np.save(filename, array)
+
+# writes a JSON contact plan one contact at a time, so contacts reach the disk as soon as they are known.
+# the finished file is the same as writing json.dumps({"contacts": contacts}, indent=4) all at once.
+# contacts are streamed to filename + ".part", which only replaces the file once close() is called.  nothing is
+# written before the first contact, so a writer which is never closed leaves any earlier file untouched.
+class ContactPlanJsonWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.partial_filename = filename + ".part"
+        self.file = None
+        self.num_contacts = 0
+
+    def write_contact(self, contact):
+        self.__open()
+        separator = ",\n" if self.num_contacts > 0 else "\n"
+        self.file.write(separator + textwrap.indent(json.dumps(contact, indent=4), " " * 8))
+        self.file.flush()
+        self.num_contacts += 1
+
+    def close(self):
+        self.__open()
+        self.file.write("\n    ]\n}" if self.num_contacts > 0 else "]\n}")
+        self.file.close()
+        os.replace(self.partial_filename, self.filename)
+
+    def __open(self):
+        if self.file is None:
+            self.file = open(self.partial_filename, "w")
+            self.file.write('{\n    "contacts": [')
+
 def read_contact_plan_from_csv(filename):
     with open(filename, newline='') as csvfile:
         reader = csv.DictReader(csvfile)
@@ -71,6 +134,15 @@ def json_to_csv(filename, out_dir):
             ])
     print("Finished generating csv file, located at %s" % csv_file_path)
 
+def json_to_npy(filename, out_dir):
+    contact_plan_name = os.path.splitext(os.path.split(filename)[1])[0]
+    contacts = read_contact_plan_from_json(filename)
+    if verify_contact_plan(contacts) is not None:
+        print("There are issues with this contact plan! Run with --verify to see issues")
+    npy_file_path = os.path.join(out_dir, contact_plan_name + ".npy")
+    write_contact_plan_to_npy(contacts, npy_file_path)
+    print("Finished generating npy file, located at %s" % npy_file_path)
+
 def verify_contact_plan(contact_plan_object, verbose=False):
     if verbose: print("Verifying contact plan...")
     counter = {"num_errors": 0, "num_warnings": 0}
@@ -126,6 +198,7 @@ def main():
     argParser.add_argument("file", help="File path of the contact plan")
     argParser.add_argument("--c2j", help="Convert csv contact plan file to json contact plan file", action='store_true')
     argParser.add_argument("--j2c", help="Convert csv contact plan file to json contact plan file", action='store_true')
+    argParser.add_argument("--j2n", help="Convert json contact plan file to a memory-mappable npy contact plan file", action='store_true')
     argParser.add_argument("--verify", help="Verify semantics of a given contact plan file (csv or json)", action='store_true')
     argParser.add_argument("--outdir", help="Directory that any new files should be sent to (ignored for --verify)")
     args = argParser.parse_args()
@@ -135,10 +208,12 @@ def main():
         arg_counter += 1
     if (args.j2c):
         arg_counter += 1
+    if (args.j2n):
+        arg_counter += 1
     if (args.verify):
         arg_counter += 1
     if (arg_counter != 1):
-        print("Must provide only one argument out of {--c2j, --j2c, --verify}")
+        print("Must provide only one argument out of {--c2j, --j2c, --j2n, --verify}")
 
     if not os.access(args.file, os.R_OK):
         print("Couldn't open file: %s" % args.file)
@@ -156,6 +231,12 @@ def main():
             os.makedirs(outdir)
         json_to_csv(args.file, outdir)
 
+    if (args.j2n):
+        outdir = args.outdir if (args.outdir is not None) else DEFAULT_OUT_DIR
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        json_to_npy(args.file, outdir)
+
     if (args.verify):
         file_ext = os.path.splitext(args.file)[1]
         cp = None
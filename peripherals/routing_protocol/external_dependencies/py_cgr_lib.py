@@ -2,6 +2,8 @@ import sys
 import copy
 from random import randint
 
+import numpy as np  # dtn-contact-plan-tools: MODIFIED TO ADD THIS IMPORT (used by ContactPlan)
+
 # SOURCE: https://bitbucket.org/juanfraire/pycgr/src/master/
 # This library contains prototype classes and methods to evaluate
 # Contact Graph Routing (CGR) routines as follows.
@@ -12,6 +14,11 @@ from random import randint
 
 
 class Contact:
+    # dtn-contact-plan-tools: MODIFIED TO USE __slots__ (Contacts are created for every route search)
+    __slots__ = ("frm", "to", "start", "end", "rate", "owlt", "volume", "confidence", "id", "mav",
+                 "arrival_time", "visited", "visited_nodes", "predecessor", "suppressed", "suppressed_next_hop",
+                 "first_byte_tx_time", "last_byte_tx_time", "last_byte_arr_time", "effective_volume_limit")
+
     def __init__(self, frm, to, start, end, rate, id, confidence=1., owlt=0):
         # fixed parameters
         self.frm = frm
@@ -67,6 +74,142 @@ class Contact:
         return "%s->%s(%s-%s,d%s)[mav%d%%]" % (self.frm, self.to, self.start, end, self.owlt, volume)
 
 
+# dtn-contact-plan-tools: MODIFIED TO ADD THIS CLASS
+# Structure-of-arrays contact plan.  Every contact is a row index into NumPy columns instead of a Contact object,
+# so a plan takes a few dozen bytes per contact and can be shared between routers.
+# Contact objects are only built (and then cached) for the contacts which are actually needed, e.g. route hops.
+class ContactPlan:
+    COLUMNS = ("frm", "to", "start", "end", "rate", "id", "confidence", "owlt")
+
+    def __init__(self):
+        self.size = 0
+        for name in self.COLUMNS:
+            setattr(self, name, np.empty(0, dtype=np.float64 if name == "confidence" else np.int64))
+        self.volume = np.empty(0, dtype=np.float64)
+        self.contacts = {}  # row index -> materialized Contact
+
+    def __len__(self):
+        return self.size
+
+    # builds a plan from one sequence of values per column
+    @classmethod
+    def from_columns(cls, frm, to, start, end, rate, id, confidence, owlt):
+        plan = cls()
+        values = {"frm": frm, "to": to, "start": start, "end": end,
+                  "rate": rate, "id": id, "confidence": confidence, "owlt": owlt}
+        for name in cls.COLUMNS:
+            setattr(plan, name, cls.__make_column(list(values[name])))
+        plan.size = len(plan.frm)
+        plan.volume = cls.__compute_volume(plan.rate, plan.start, plan.end)
+        return plan
+
+    # builds a plan on top of one NumPy array per column, without copying them (e.g. memory-mapped arrays).
+    # the arrays are never written to:  appending to the plan moves the columns into new arrays first.
+    @classmethod
+    def from_arrays(cls, frm, to, start, end, rate, id, confidence, owlt):
+        plan = cls()
+        values = {"frm": frm, "to": to, "start": start, "end": end,
+                  "rate": rate, "id": id, "confidence": confidence, "owlt": owlt}
+        for name in cls.COLUMNS:
+            setattr(plan, name, values[name])
+        plan.size = len(plan.frm)
+        plan.volume = cls.__compute_volume(plan.rate, plan.start, plan.end)
+        return plan
+
+    # appends a contact + returns its row index
+    def append(self, frm, to, start, end, rate, id, confidence=1., owlt=0):
+        index = self.size
+        if index == len(self.frm):
+            # grow every column geometrically, so appending is amortized O(1)
+            capacity = max(8, 2 * index)
+            for name in self.COLUMNS + ("volume",):
+                column = getattr(self, name)
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:index] = column[:index]
+                setattr(self, name, grown)
+
+        values = {"frm": frm, "to": to, "start": start, "end": end,
+                  "rate": rate, "id": id, "confidence": confidence, "owlt": owlt}
+        for name in self.COLUMNS:
+            self.__store(name, index, values[name])
+        # same as Contact.volume, including for non-numeric rates
+        volume = rate * (end - start)
+        self.__store("volume", index, float(volume) if type(volume) in (int, float) else volume)
+        self.size += 1
+        return index
+
+    # appends an existing Contact object, which is then returned by contact() for its row
+    def append_contact(self, contact):
+        index = self.append(contact.frm, contact.to, contact.start, contact.end, contact.rate, contact.id,
+                            contact.confidence, contact.owlt)
+        self.contacts[index] = contact
+        return index
+
+    # returns the (frm, to, start, end, rate, id, confidence, owlt, volume) values of every row, as Python objects
+    def rows(self):
+        columns = [getattr(self, name)[:self.size].tolist() for name in self.COLUMNS + ("volume",)]
+        return zip(*columns)
+
+    # returns the (frm, to, start, end, rate, id, confidence, owlt, volume) values of a row, as Python objects
+    def row(self, index):
+        return tuple(self.__value(getattr(self, name)[index]) for name in self.COLUMNS + ("volume",))
+
+    # returns the Contact object for a row
+    def contact(self, index):
+        contact = self.contacts.get(index)
+        if contact is None:
+            frm, to, start, end, rate, id, confidence, owlt, _ = self.row(index)
+            contact = Contact(frm, to, start, end, rate, id, confidence, owlt)
+            self.contacts[index] = contact
+        return contact
+
+    def copy(self):
+        plan = ContactPlan()
+        plan.size = self.size
+        for name in self.COLUMNS + ("volume",):
+            setattr(plan, name, getattr(self, name).copy())
+        plan.contacts = dict(self.contacts)
+        return plan
+
+    # int columns for ints, float columns for floats, object columns for anything else (e.g. string node ids)
+    @staticmethod
+    def __make_column(values):
+        if all(type(value) is int and -2**63 <= value < 2**63 for value in values):
+            return np.array(values, dtype=np.int64)
+        if all(type(value) is float for value in values):
+            return np.array(values, dtype=np.float64)
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+    def __store(self, name, index, value):
+        column = getattr(self, name)
+        if column.dtype == np.int64:
+            fits = type(value) is int and -2**63 <= value < 2**63
+        elif column.dtype == np.float64:
+            fits = type(value) is float
+        else:
+            fits = True
+        if not fits:
+            column = column.astype(object)
+            setattr(self, name, column)
+        column[index] = value
+
+    @staticmethod
+    def __compute_volume(rate, start, end):
+        if rate.dtype == object or start.dtype == object or end.dtype == object:
+            # same as Contact.volume, including for non-numeric rates
+            volume = np.empty(len(rate), dtype=object)
+            volume[:] = [r * (e - s) for r, s, e in zip(rate.tolist(), start.tolist(), end.tolist())]
+            return volume
+        # computed with floats so huge end times (e.g. sys.maxsize) don't overflow
+        return rate.astype(np.float64) * (end.astype(np.float64) - start.astype(np.float64))
+
+    @staticmethod
+    def __value(value):
+        return value.item() if isinstance(value, np.generic) else value
+
+
 class Route:
     def __init__(self, contact, parent=None):
         # dfs: carry on from where parent route left
@@ -471,7 +614,9 @@ def cgr_yen(source, destination, curr_time, contact_plan, num_routes):
     potential_routes = []
 
     # create Root Contact
-    root_contact = Contact(source, source, 0, sys.maxsize, 100, 1.0, 0)  # root contact
+    # dtn-contact-plan-tools: MODIFIED TO START THE ROOT CONTACT AT curr_time, so spur paths from the root
+    # (which leave at the root path's best_delivery_time) can't use contacts which ended before curr_time.
+    root_contact = Contact(source, source, curr_time, sys.maxsize, 100, 1.0, 0)  # root contact
     root_contact.arrival_time = curr_time
 
     # reset contacts
@@ -1,6 +1,9 @@
 """
 Contains content shared across the networking protocol classes.
 """
+import heapq
+import itertools
+
 from payload import Payload, ClientMappingDictPayload, ClientPayload, ClientBeaconPayload
 
 
@@ -20,23 +23,132 @@ def handle_payload(model, local_node_id, payload):
     # add more cases here if new payload types are added which need special router-level handling!
 
 
+"""
+A set of ids (of bundles or payloads) which forgets each id once its expiration timestamp has passed.
+
+Used for deduping:  an item which expired is dropped wherever it's received, so its id no longer needs to be
+remembered.  Ids are bucketed by expiration timestamp, so remove_expired() only touches the ids which expired,
+and memory stays proportional to the number of unexpired items seen.
+"""
+class ExpiringIdSet:
+    def __init__(self):
+        self.expirations = dict()   # key = id, value = expiration timestamp
+        self.buckets = dict()       # key = expiration timestamp, value = list of ids which expire then
+        self.bucket_heap = []       # expiration timestamps of the buckets, as a min-heap
+
+    def __contains__(self, item_id):
+        return item_id in self.expirations
+
+    def __len__(self):
+        return len(self.expirations)
+
+    """
+    Adds the id, which is remembered until curr_timestamp >= expiration_timestamp.
+    If the id is already in the set, the later of the two expiration timestamps is kept.
+    """
+    def add(self, item_id, expiration_timestamp):
+        current_expiration = self.expirations.get(item_id)
+        if current_expiration is not None and current_expiration >= expiration_timestamp:
+            return
+        self.expirations[item_id] = expiration_timestamp
+        bucket = self.buckets.get(expiration_timestamp)
+        if bucket is None:
+            bucket = self.buckets[expiration_timestamp] = []
+            heapq.heappush(self.bucket_heap, expiration_timestamp)
+        bucket.append(item_id)
+
+    """
+    Forgets every id whose expiration timestamp is at or before curr_timestamp.
+    """
+    def remove_expired(self, curr_timestamp):
+        for _ in self._pop_expired(curr_timestamp):
+            pass
+
+    """
+    Forgets every id whose expiration timestamp is at or before curr_timestamp, yielding each id it forgets.
+    """
+    def _pop_expired(self, curr_timestamp):
+        while self.bucket_heap and self.bucket_heap[0] <= curr_timestamp:
+            expiration_timestamp = heapq.heappop(self.bucket_heap)
+            for item_id in self.buckets.pop(expiration_timestamp):
+                # ids which were added again with a later expiration timestamp are still in a later bucket.
+                if self.expirations.get(item_id) == expiration_timestamp:
+                    del self.expirations[item_id]
+                    yield item_id
+
+
+"""
+Hands out small int ids for hashable keys (e.g. a tuple of a bundle's contents), so ids are cheap to hash + store.
+The same key gets the same id while it's remembered, so items with the same contents are deduped like before.
+
+Each LunarModel owns its allocators (model.payload_ids + model.bundle_ids), so a model's ids are 0, 1, 2, ...
+in the order its keys were first seen, whatever else ran in the same process.
+Like an ExpiringIdSet, keys are forgotten once the item they belong to has expired, so memory stays proportional to
+the number of unexpired items.  Expired items are dropped wherever they're received, so a forgotten key which comes
+back just gets a new id.
+"""
+class IdAllocator(ExpiringIdSet):
+    def __init__(self):
+        super().__init__()
+        self.ids = dict()  # key = key, value = its id
+        self.id_counter = itertools.count()
+
+    """
+    Returns the id of the key, which is remembered until curr_timestamp >= expiration_timestamp.
+    """
+    def get_id(self, key, expiration_timestamp):
+        item_id = self.ids.get(key)
+        if item_id is None:
+            item_id = next(self.id_counter)
+            self.ids[key] = item_id
+        self.add(key, expiration_timestamp)
+        return item_id
+
+    """
+    Forgets every key whose expiration timestamp is at or before curr_timestamp.
+    """
+    def remove_expired(self, curr_timestamp):
+        for key in self._pop_expired(curr_timestamp):
+            del self.ids[key]
+
+
 """
 Represents a Bundle on the network.
+Bundles are created in large numbers, so they declare __slots__ instead of having a __dict__.
 """
 class Bundle:
-    def __init__(self, bundle_id, dest_id, payload:  Payload, creation_timestamp, lifespan):
+    __slots__ = ("bundle_id", "dest_id", "payload", "expiration_timestamp", "creation_timestamp", "size", "_serialized")
+
+    def __init__(self, bundle_id, dest_id, payload:  Payload, creation_timestamp, lifespan, size=1):
         self.bundle_id = bundle_id  # the id of the bundle
         self.dest_id = dest_id  # the id of the destination node
         self.payload = payload
         self.expiration_timestamp = creation_timestamp + lifespan
         self.creation_timestamp = creation_timestamp
+        self.size = size  # the volume the bundle takes up on a contact (same units as the contact rates)
+        self._serialized = None  # cached output of serialize()
         #  add more params here + modify existing ones in the future as necessary.
 
+    """
+    Returns a human-readable string which can be used to identify this bundle.  Only built for serialization.
+    """
+    def get_readable_id(self):
+        if isinstance(self.payload, ClientPayload):
+            return "bundle(routerdst[{}]creationtime[{}],{})".format(self.dest_id, self.creation_timestamp,
+                                                                     self.payload.get_readable_identifier())
+        return self.bundle_id
+
+    """
+    Returns the bundle as a dict.  Bundles never change, so the dict is only built once + must not be modified.
+    """
     def serialize(self):
-        return {
-            "bundle_id": self.bundle_id,
-            "dest_id": self.dest_id,
-            "expiration_timestamp": self.expiration_timestamp,
-            "creation_timestamp": self.creation_timestamp,
-            "payload": self.payload.serialize()
-        }
\ No newline at end of file
+        if self._serialized is None:
+            self._serialized = {
+                "bundle_id": self.get_readable_id(),
+                "dest_id": self.dest_id,
+                "expiration_timestamp": self.expiration_timestamp,
+                "creation_timestamp": self.creation_timestamp,
+                "size": self.size,
+                "payload": self.payload.serialize()
+            }
+        return self._serialized
\ No newline at end of file
@@ -2,11 +2,12 @@
 Tests for the "epidemic" algorithm.
 """
 import mesa
-from mockito import mock, when
+from mockito import mock, when, verify
 
 from agent.router_agent import RouterAgent
 from payload import Payload
 from peripherals.routing_protocol.alt_algos.epidemic import Epidemic
+from peripherals.routing_protocol.alt_algos.spray_and_wait import SprayAndWait
 from peripherals.routing_protocol.routing_protocol_common import Bundle
 
 # Test constants.
@@ -97,3 +98,78 @@ def test_epidemic_propagation():
     assert bundle not in e0.curr_bundles
     assert bundle not in e1.curr_bundles
     assert bundle not in e2.curr_bundles
+
+
+def test_epidemic_only_sends_missing_bundles():
+    # create the mocked model object.
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    mocked_model = mock({"schedule": schedule, "agents": {}, "model_params": {"model_speed_limit": 10}})
+
+    # create two connected nodes + their routing agents.
+    r0 = mock(spec=RouterAgent)
+    r1 = mock(spec=RouterAgent)
+    e0 = Epidemic(ROUTER_ID_0, mocked_model, r0)
+    e1 = Epidemic(ROUTER_ID_1, mocked_model, r1)
+    r0.routing_protocol = e0
+    r1.routing_protocol = e1
+    mocked_model.agents = {ROUTER_ID_0: r0, ROUTER_ID_1: r1}
+    when(mocked_model).get_neighbors(r0).thenReturn([{"id": ROUTER_ID_1, "connected": True}])
+    when(mocked_model).get_neighbors(r1).thenReturn([{"id": ROUTER_ID_0, "connected": True}])
+
+    # both nodes know about bundle_0, only e0 knows about bundle_1.
+    bundle_0 = Bundle(0, NONEXISTENT_ROUTER_ID, Payload(), schedule.time, BUNDLE_LIFESPAN)
+    bundle_1 = Bundle(1, NONEXISTENT_ROUTER_ID, Payload(), schedule.time, BUNDLE_LIFESPAN)
+    e0.handle_bundle(bundle_0)
+    e0.handle_bundle(bundle_1)
+    e1.handle_bundle(bundle_0)
+
+    # only the missing bundle is sent.
+    e0.refresh()
+    e1.refresh()
+    assert bundle_1 in e1.curr_bundles
+    assert e0.num_bundle_sends == 1
+    assert e1.num_bundle_sends == 0
+    assert e0.num_repeated_bundle_receives == 0
+    assert e1.num_repeated_bundle_receives == 0
+
+    # while the contact lasts, nothing is sent until a node stores a new bundle.
+    for i in range(0, 10):
+        schedule.step()
+        e0.refresh()
+        e1.refresh()
+    assert e0.num_bundle_sends == 1
+    assert e1.num_bundle_sends == 0
+
+    bundle_2 = Bundle(2, NONEXISTENT_ROUTER_ID, Payload(), schedule.time, BUNDLE_LIFESPAN)
+    e1.handle_bundle(bundle_2)
+    e0.refresh()
+    e1.refresh()
+    assert bundle_2 in e0.curr_bundles
+    assert e0.num_bundle_sends == 1
+    assert e1.num_bundle_sends == 1
+
+
+def test_epidemic_sends_every_bundle_to_other_protocols():
+    # create the mocked model object.
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    mocked_model = mock({"schedule": schedule, "agents": {}, "model_params": {"model_speed_limit": 10}})
+
+    # e0 is connected to a router running another protocol, which has no summary vector.
+    r0 = mock(spec=RouterAgent)
+    r1 = mock(spec=RouterAgent)
+    e0 = Epidemic(ROUTER_ID_0, mocked_model, r0)
+    r0.routing_protocol = e0
+    r1.routing_protocol = mock(spec=SprayAndWait)
+    when(r1.routing_protocol).handle_bundle(...).thenReturn(None)
+    mocked_model.agents = {ROUTER_ID_0: r0, ROUTER_ID_1: r1}
+    when(mocked_model).get_neighbors(r0).thenReturn([{"id": ROUTER_ID_1, "connected": True}])
+
+    bundle = Bundle(0, NONEXISTENT_ROUTER_ID, Payload(), schedule.time, BUNDLE_LIFESPAN)
+    e0.handle_bundle(bundle)
+
+    # every Bundle is sent at every step, like before summary vectors.
+    e0.refresh()
+    schedule.step()
+    e0.refresh()
+    verify(r1.routing_protocol, times=2).handle_bundle(bundle)
+    assert e0.num_bundle_sends == 2
@@ -135,3 +135,59 @@ def test_spray_and_wait_expiration(setup):
     # assert that bundle_1 is not present in any s#'s waiting_bundles list (since it expired).
     for i in range(1, SprayAndWait.NUM_NODES_TO_SPRAY - 1):
         assert bundle_1 not in s_dict[i].waiting_bundles
+
+def test_binary_spray_and_wait():
+    # create the mocked model object, using binary spraying with 4 copy tokens per bundle.
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    mocked_model = mock({"schedule": schedule, "agents": {},
+                         "model_params": {"model_speed_limit": 10, "spray_and_wait_mode": "binary",
+                                          "spray_and_wait_copies": 4}})
+
+    # create four nodes + their routing agents.  node 3 is the destination.
+    s_dict = {}
+    r_dict = {}
+    for i in range(0, 4):
+        r = mock(spec=RouterAgent)
+        s = SprayAndWait(i, mocked_model, r)
+        r.routing_protocol = s
+        s_dict[i] = s
+        r_dict[i] = r
+    mocked_model.agents = r_dict
+    for i in range(0, 4):
+        when(mocked_model).get_neighbors(r_dict[i]).thenReturn([])
+
+    bundle = Bundle(0, 3, Payload(), schedule.time, 2500)
+    s_dict[0].handle_bundle(bundle)
+    assert s_dict[0].bundle_copies_map[bundle] == 4
+
+    # s0 meets s1 + hands over half of its copy tokens.
+    when(mocked_model).get_neighbors(r_dict[0]).thenReturn([{"id": 1, "connected": True}])
+    s_dict[0].refresh()
+    assert s_dict[0].bundle_copies_map[bundle] == 2
+    assert s_dict[1].bundle_copies_map[bundle] == 2
+
+    # s1 meeting s0 again doesn't hand anything over, since s0 has already seen the bundle.
+    when(mocked_model).get_neighbors(r_dict[1]).thenReturn([{"id": 0, "connected": True}])
+    s_dict[1].refresh()
+    assert s_dict[1].bundle_copies_map[bundle] == 2
+    assert s_dict[0].num_repeated_bundle_receives == 0
+
+    # s0 meets s2.  both end up with 1 copy token, so they wait for the destination.
+    when(mocked_model).get_neighbors(r_dict[0]).thenReturn([{"id": 2, "connected": True}])
+    s_dict[0].refresh()
+    assert bundle not in s_dict[0].bundle_copies_map
+    assert bundle in s_dict[0].waiting_bundles
+    assert bundle in s_dict[2].waiting_bundles
+
+    # s1 meets the destination, which gets the bundle directly.
+    when(mocked_model).get_neighbors(r_dict[1]).thenReturn([{"id": 3, "connected": True}])
+    s_dict[1].refresh()
+    assert bundle not in s_dict[1].bundle_copies_map
+    assert bundle not in s_dict[1].waiting_bundles
+    assert s_dict[3].num_bundle_reached_destination == 1
+
+    # s2 meets the destination too.
+    when(mocked_model).get_neighbors(r_dict[2]).thenReturn([{"id": 3, "connected": True}])
+    s_dict[2].refresh()
+    assert bundle not in s_dict[2].waiting_bundles
+    assert s_dict[3].num_bundle_reached_destination == 2
@@ -223,3 +223,74 @@ def test_construct_cgr_from_json():
     verify(cgr_dict[10], times=1).handle_bundle(...)
     verify(cgr_dict[1], times=1).handle_bundle(...)
     verify(cgr_dict[2], times=0).handle_bundle(...)
+
+
+"""
+Tests that with alternate routes enabled, a Bundle is sent along the best route whose next hop is connected.
+
+(@timestamp = 0, the best route is 0->2->1, but node 2 isn't connected so the bundle takes 0->1)
+"""
+def test_handle_bundle_falls_back_to_connected_route():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    agents_dict = dict()
+    dummy_model = mock({"schedule": schedule, "agents": agents_dict, "model_params": {"cgr_num_routes": 3}})
+
+    cgr_dict = {}
+    for node_id in range(3):
+        cgr_dict[node_id] = spy(Cgr(node_id, dummy_model))
+        agents_dict[node_id] = mock({"routing_protocol": cgr_dict[node_id]})
+        cgr_dict[node_id].add_contact(0, 1, 3, sys.maxsize, 100)
+        cgr_dict[node_id].add_contact(0, 2, 0, sys.maxsize, 100)
+        cgr_dict[node_id].add_contact(2, 1, 0, sys.maxsize, 100)
+
+    neighbors_for_0 = [{"id": 1, "connected": True}, {"id": 2, "connected": False}]
+    when(dummy_model).get_neighbors(agents_dict[0]).thenReturn(neighbors_for_0)
+
+    # have node 0 handle the Bundle.
+    bundle = Bundle(0, 1, Payload(), schedule.time, BUNDLE_LIFESPAN)
+    cgr_dict[0].handle_bundle(bundle)
+    cgr_dict[0].refresh() # forward to 1 directly
+
+    verify(cgr_dict[1], times=1).handle_bundle(...)
+    verify(cgr_dict[2], times=0).handle_bundle(...)
+
+
+"""
+Tests that with volume-aware forwarding, a contact only carries its rate of bundle volume per step,
+and bundles are rerouted once the contact's volume is used up.
+
+0 -> 1:  @0->2 at a rate of 3 (volume 6)
+0 -> 2 -> 1:  @1->inf
+"""
+def test_handle_bundle_volume_aware():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    agents_dict = dict()
+    dummy_model = mock({"schedule": schedule, "agents": agents_dict, "model_params": {"cgr_volume_aware": True}})
+
+    cgr_dict = {}
+    for node_id in range(3):
+        cgr_dict[node_id] = spy(Cgr(node_id, dummy_model))
+        agents_dict[node_id] = mock({"routing_protocol": cgr_dict[node_id]})
+        cgr_dict[node_id].add_contact(0, 1, 0, 2, 3)
+        cgr_dict[node_id].add_contact(0, 2, 1, sys.maxsize, 100)
+        cgr_dict[node_id].add_contact(2, 1, 1, sys.maxsize, 100)
+
+    neighbors_for_0 = [{"id": 1, "connected": True}, {"id": 2, "connected": True}]
+    when(dummy_model).get_neighbors(agents_dict[0]).thenReturn(neighbors_for_0)
+
+    for i in range(8):
+        cgr_dict[0].handle_bundle(Bundle(i, 1, Payload(), schedule.time, BUNDLE_LIFESPAN))
+
+    # 3 bundles per step go through the direct contact...
+    cgr_dict[0].refresh()
+    cgr_dict[0].refresh()
+    verify(cgr_dict[1], times=3).handle_bundle(...)
+    schedule.step()
+    cgr_dict[0].refresh()
+    verify(cgr_dict[1], times=6).handle_bundle(...)
+    verify(cgr_dict[2], times=0).handle_bundle(...)
+
+    # ...until its volume is used up + the rest go through node 2.
+    cgr_dict[0].refresh()
+    verify(cgr_dict[1], times=6).handle_bundle(...)
+    verify(cgr_dict[2], times=2).handle_bundle(...)
@@ -0,0 +1,224 @@
+import random
+import sys
+
+import pytest
+
+from peripherals.routing_protocol.cgr.contact_graph import ContactGraph
+from peripherals.routing_protocol.external_dependencies.cp_file_tools import read_contact_plan_from_json
+from peripherals.routing_protocol.external_dependencies.py_cgr_lib import Contact, ContactPlan, cgr_dijkstra
+
+
+"""
+Helper which computes a route with py_cgr_lib's reference cgr_dijkstra implementation.
+Returns the list of contact ids along the route, or None if no route was found.
+"""
+def reference_route_ids(contact_plan, root_node_id, destination_node_id, curr_timestamp):
+    root_contact = Contact(start=0, end=sys.maxsize, frm=root_node_id, to=root_node_id, rate=100, id=-1)
+    root_contact.arrival_time = curr_timestamp
+    try:
+        route = cgr_dijkstra(root_contact, destination_node_id, contact_plan)
+    except KeyError:
+        # cgr_dijkstra raises if the root node is not in the contact plan
+        return None
+    if route is None:
+        return None
+    return [hop.id for hop in route.hops]
+
+
+def route_ids(route):
+    if route is None:
+        return None
+    return [hop.id for hop in route.hops]
+
+
+def load_contacts(filename):
+    contacts = []
+    for contact in read_contact_plan_from_json(filename):
+        contacts.append(Contact(contact["source"], contact["dest"], contact["startTime"], contact["endTime"],
+                                contact["rate"], contact["contact"], contact["confidence"], contact["owlt"]))
+    return contacts
+
+
+"""
+Tests that the ContactGraph computes the same routes as cgr_dijkstra for every pair of nodes in the test contact plans.
+"""
+@pytest.mark.parametrize("filename", ["juanfraire_cgr_tutorial.json", "cprtlarge.json", "contactPlan_RoutingTest.json"])
+def test_same_routes_as_cgr_dijkstra_test_contact_plans(filename):
+    contacts = load_contacts("peripherals/routing_protocol/test/cgr/test_contact_plans/" + filename)
+    contact_graph = ContactGraph(contacts)
+
+    nodes = set([contact.frm for contact in contacts] + [contact.to for contact in contacts])
+    for source in nodes:
+        for dest in nodes:
+            for curr_timestamp in [0, 15, 50, 130]:
+                assert route_ids(contact_graph.dijkstra(source, dest, curr_timestamp)) \
+                       == reference_route_ids(contacts, source, dest, curr_timestamp)
+
+
+"""
+Tests that the ContactGraph computes the same routes as cgr_dijkstra on random contact plans,
+including ties in arrival time, zero-length contacts and non-zero one-way light times.
+"""
+def test_same_routes_as_cgr_dijkstra_random_contact_plans():
+    rand = random.Random(0)
+    for _ in range(300):
+        num_nodes = rand.randint(2, 6)
+        contacts = []
+        for contact_id in range(rand.randint(1, 30)):
+            frm, to = rand.sample(range(num_nodes), 2)
+            start = rand.randint(0, 50)
+            contacts.append(Contact(frm, to, start, start + rand.randint(0, 20), 100, contact_id,
+                                    owlt=rand.choice([0, 0, 1, 2])))
+        contact_graph = ContactGraph(contacts)
+
+        for _ in range(5):
+            source = rand.randrange(num_nodes)
+            dest = rand.randrange(num_nodes)
+            curr_timestamp = rand.randint(0, 60)
+            assert route_ids(contact_graph.dijkstra(source, dest, curr_timestamp)) \
+                   == reference_route_ids(contacts, source, dest, curr_timestamp)
+
+
+"""
+Tests that the adjacency index is kept up to date as contacts are added and replaced.
+"""
+def test_contact_graph_updates():
+    contact_graph = ContactGraph()
+    assert contact_graph.dijkstra(0, 1, 0) is None
+
+    contact_graph.add_contact(Contact(0, 1, 5, 10, 100, 0))
+    assert route_ids(contact_graph.dijkstra(0, 1, 0)) == [0]
+
+    contact_graph.set_contacts([Contact(0, 2, 0, 10, 100, 1), Contact(2, 1, 0, 10, 100, 2)])
+    assert route_ids(contact_graph.dijkstra(0, 1, 0)) == [1, 2]
+
+
+"""
+Tests that the ContactGraph still computes the same routes as cgr_dijkstra after contacts are removed and
+split, with queries made both forwards + backwards in time.
+"""
+def test_same_routes_as_cgr_dijkstra_after_removals():
+    rand = random.Random(1)
+    for _ in range(100):
+        num_nodes = rand.randint(2, 5)
+        contact_graph = ContactGraph()
+        for contact_id in range(rand.randint(1, 25)):
+            frm, to = rand.sample(range(num_nodes), 2)
+            start = rand.randint(0, 50)
+            contact_graph.add_contact(Contact(frm, to, start, start + rand.randint(0, 20), 100, contact_id))
+
+        for _ in range(5):
+            node_1, node_2 = rand.sample(range(num_nodes), 2)
+            start_time = rand.randint(0, 60)
+            end_time = start_time + rand.randint(0, 10)
+            contact_graph.remove_contacts_in_time_window(node_1, node_2, start_time, end_time)
+            if rand.random() < 0.2:
+                contact_graph.remove_contacts_by_id(rand.randrange(25))
+
+            # no contact between the nodes may overlap the removed window anymore.
+            for contact in contact_graph.get_contacts():
+                if {contact.frm, contact.to} == {node_1, node_2}:
+                    assert contact.end < start_time or contact.start > end_time
+
+            source = rand.randrange(num_nodes)
+            dest = rand.randrange(num_nodes)
+            curr_timestamp = rand.randint(0, 60)
+            assert route_ids(contact_graph.dijkstra(source, dest, curr_timestamp)) \
+                   == reference_route_ids(contact_graph.get_contacts(), source, dest, curr_timestamp)
+
+
+"""
+Tests that retiring expired contacts doesn't change any routes computed afterwards, and that a time horizon
+limits route computation to the contacts starting within the time horizon.
+"""
+@pytest.mark.parametrize("time_horizon", [None, 0, 10])
+def test_retired_contacts_and_time_horizon(time_horizon):
+    rand = random.Random(2)
+    for _ in range(100):
+        num_nodes = rand.randint(2, 5)
+        contacts = []
+        for contact_id in range(rand.randint(1, 25)):
+            frm, to = rand.sample(range(num_nodes), 2)
+            start = rand.randint(0, 50)
+            contacts.append(Contact(frm, to, start, start + rand.randint(0, 20), 100, contact_id))
+        contact_graph = ContactGraph(contacts, time_horizon)
+
+        for curr_timestamp in range(0, 60, 7):
+            contact_graph.retire_contacts_ended_before(curr_timestamp)
+            assert all(contact.end >= curr_timestamp for contact in contact_graph.get_contacts())
+
+            visible_contacts = contacts
+            if time_horizon is not None:
+                visible_contacts = [contact for contact in contacts if contact.start <= curr_timestamp + time_horizon]
+            source = rand.randrange(num_nodes)
+            dest = rand.randrange(num_nodes)
+            assert route_ids(contact_graph.dijkstra(source, dest, curr_timestamp)) \
+                   == reference_route_ids(visible_contacts, source, dest, curr_timestamp)
+
+
+"""
+Tests that a ContactGraph built from a structure-of-arrays ContactPlan computes the same routes as one built from
+Contact objects, and that route hops are Contact objects w/ the contact plan's values.
+"""
+@pytest.mark.parametrize("filename", ["juanfraire_cgr_tutorial.json", "cprtlarge.json", "contactPlan_RoutingTest.json"])
+def test_contact_plan_columns(filename):
+    contacts = load_contacts("peripherals/routing_protocol/test/cgr/test_contact_plans/" + filename)
+    contact_plan = ContactPlan.from_columns(
+        frm=[contact.frm for contact in contacts],
+        to=[contact.to for contact in contacts],
+        start=[contact.start for contact in contacts],
+        end=[contact.end for contact in contacts],
+        rate=[contact.rate for contact in contacts],
+        id=[contact.id for contact in contacts],
+        confidence=[contact.confidence for contact in contacts],
+        owlt=[contact.owlt for contact in contacts])
+    contact_graph = ContactGraph(contact_plan)
+
+    nodes = set([contact.frm for contact in contacts] + [contact.to for contact in contacts])
+    for source in nodes:
+        for dest in nodes:
+            for curr_timestamp in [0, 15, 50, 130]:
+                route = contact_graph.dijkstra(source, dest, curr_timestamp)
+                assert route_ids(route) == reference_route_ids(contacts, source, dest, curr_timestamp)
+                for hop in (route.hops if route is not None else []):
+                    assert (hop.frm, hop.to, hop.start, hop.end, hop.rate, hop.owlt) in \
+                           [(contact.frm, contact.to, contact.start, contact.end, contact.rate, contact.owlt)
+                            for contact in contacts if contact.id == hop.id]
+
+
+"""
+Tests that the single-exploration first_hops() gives every destination the same first hop as a separate dijkstra()
+query for that destination.
+"""
+def test_first_hops_match_dijkstra():
+    contact_plans = [load_contacts("peripherals/routing_protocol/test/cgr/test_contact_plans/" + filename)
+                     for filename in ["juanfraire_cgr_tutorial.json", "cprtlarge.json", "contactPlan_RoutingTest.json"]]
+    rand = random.Random(3)
+    for _ in range(200):
+        num_nodes = rand.randint(2, 7)
+        contacts = []
+        for contact_id in range(rand.randint(1, 40)):
+            frm, to = rand.sample(range(num_nodes), 2)
+            start = rand.randint(0, 50)
+            contacts.append(Contact(frm, to, start, start + rand.randint(0, 20), 100, contact_id,
+                                    owlt=rand.choice([0, 0, 1, 2])))
+        contact_plans.append(contacts)
+
+    for contacts in contact_plans:
+        contact_graph = ContactGraph(contacts)
+        nodes = set([contact.frm for contact in contacts] + [contact.to for contact in contacts])
+        for source in nodes:
+            for curr_timestamp in [0, 15, 30, 50]:
+                # every node, then a random subset of the nodes (which may stop the exploration early).
+                destinations = set(rand.sample(sorted(nodes, key=str), rand.randint(1, len(nodes))))
+                all_first_hops = contact_graph.first_hops(source, curr_timestamp)
+                some_first_hops = contact_graph.first_hops(source, curr_timestamp, destinations)
+                assert set(some_first_hops) <= destinations
+                for dest in nodes:
+                    route = contact_graph.dijkstra(source, dest, curr_timestamp)
+                    if route is None:
+                        assert dest not in all_first_hops and dest not in some_first_hops
+                    else:
+                        assert all_first_hops[dest] is route.hops[0]
+                        if dest in destinations:
+                            assert some_first_hops[dest] is route.hops[0]
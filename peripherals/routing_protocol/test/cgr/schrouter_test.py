@@ -1,6 +1,14 @@
+import json
+import os
+import random
 import sys
 
+import pytest
+
 from peripherals.routing_protocol.cgr.schrouter import Schrouter
+from peripherals.routing_protocol.external_dependencies.cp_file_tools import read_contact_plan_from_json, \
+    write_contact_plan_to_npy
+from peripherals.routing_protocol.external_dependencies.py_cgr_lib import cgr_yen
 
 
 """
@@ -134,6 +142,36 @@ def test_remove_contacts_in_time_window():
     assert schrouter.check_contact_availability_specific_time_window(0, 1, 5, 6)
 
 
+"""
+Tests that removing a time window shortens contacts which overlap one side of the window + leaves contacts
+which don't overlap the window untouched.
+"""
+def test_remove_contacts_in_time_window_partial_overlaps():
+    # construct a Schrouter.
+    schrouter = Schrouter()
+
+    # add four contacts between 0 and 1:
+    # - 0->1 from 0->4, which overlaps the start of the window.
+    # - 1->0 from 8->12, which overlaps the end of the window.
+    # - 0->1 from 5->7, which lies entirely within the window.
+    # - 0->1 from 20->30, which doesn't overlap the window at all.
+    schrouter.add_contact(source=0, dest=1, start_time=0, end_time=4, rate=100)
+    schrouter.add_contact(source=1, dest=0, start_time=8, end_time=12, rate=100)
+    schrouter.add_contact(source=0, dest=1, start_time=5, end_time=7, rate=100)
+    schrouter.add_contact(source=0, dest=1, start_time=20, end_time=30, rate=100)
+
+    # remove timestamps 3->9 between 0 and 1.
+    schrouter.remove_contacts_in_time_window(0, 1, 3, 9)
+
+    # verify that the overlapping contacts were shortened.
+    assert schrouter.check_contact_availability_specific_time_window(0, 1, 0, 2)
+    assert schrouter.check_contact_availability_specific_time_window(1, 0, 10, 12)
+
+    # verify that the contact within the window is gone + the contact outside of the window is untouched.
+    assert not schrouter.check_contact_availability_specific_time_window(0, 1, 5, 7)
+    assert schrouter.check_contact_availability_specific_time_window(0, 1, 20, 30)
+    assert len(schrouter.contact_plan) == 3
+
 """
 Tests that the router adjusts route computation based upon the provided starting timestamp.
 """
@@ -178,3 +216,277 @@ def test_routing_with_later_timestamp_use_faster_route():
     assert len(route_2.hops) == 1
     assert route_2.hops[0].frm == 0
     assert route_2.hops[0].to == 1
+
+
+"""
+Tests that cached routes are identical to freshly computed routes as time moves forward.
+"""
+def test_route_cache_matches_uncached_routes():
+    # construct two Schrouters from the same file.  only one of them keeps its cached routes.
+    filename = "peripherals/routing_protocol/test/cgr/test_contact_plans/cprtlarge.json"
+    cached_schrouter = Schrouter(filename)
+    uncached_schrouter = Schrouter(filename)
+
+    for curr_timestamp in range(0, 320):
+        for dest in [2, 3, 4]:
+            uncached_schrouter.route_cache.clear()
+            cached_route = cached_schrouter.get_best_route_dijkstra(1, dest, curr_timestamp)
+            uncached_route = uncached_schrouter.get_best_route_dijkstra(1, dest, curr_timestamp)
+            if uncached_route is None:
+                assert cached_route is None
+            else:
+                assert [hop.id for hop in cached_route.hops] == [hop.id for hop in uncached_route.hops]
+
+
+"""
+Tests that cached routes are identical to freshly computed routes on a contact plan w/ no owlt,
+where cached routes stay valid until the next contact starts or ends (or comes within the time horizon).
+"""
+@pytest.mark.parametrize("time_horizon", [None, 25])
+def test_route_cache_matches_uncached_routes_no_owlt(time_horizon):
+    rand = random.Random(0)
+    cached_schrouter = Schrouter(time_horizon=time_horizon)
+    uncached_schrouter = Schrouter(time_horizon=time_horizon)
+    for _ in range(60):
+        source, dest = rand.sample(range(6), 2)
+        start_time = rand.randint(0, 200)
+        end_time = start_time + rand.randint(0, 40)
+        cached_schrouter.add_contact(source, dest, start_time, end_time, 100)
+        uncached_schrouter.add_contact(source, dest, start_time, end_time, 100)
+
+    for curr_timestamp in range(0, 250):
+        # retiring expired contacts must not change any routes.
+        cached_schrouter.retire_expired_contacts(curr_timestamp)
+        for dest in range(1, 6):
+            uncached_schrouter.route_cache.clear()
+            cached_route = cached_schrouter.get_best_route_dijkstra(0, dest, curr_timestamp)
+            uncached_route = uncached_schrouter.get_best_route_dijkstra(0, dest, curr_timestamp)
+            if uncached_route is None:
+                assert cached_route is None
+            else:
+                assert [hop.id for hop in cached_route.hops] == [hop.id for hop in uncached_route.hops]
+
+
+"""
+Tests that cached first hops match the first hops of freshly computed routes as time moves forward.
+"""
+def test_first_hop_cache_matches_uncached_routes():
+    rand = random.Random(1)
+    schrouter = Schrouter()
+    uncached_schrouter = Schrouter()
+    for _ in range(60):
+        source, dest = rand.sample(range(6), 2)
+        start_time = rand.randint(0, 200)
+        end_time = start_time + rand.randint(0, 40)
+        schrouter.add_contact(source, dest, start_time, end_time, 100)
+        uncached_schrouter.add_contact(source, dest, start_time, end_time, 100)
+
+    for curr_timestamp in range(0, 250):
+        # ask for a different set of destinations each time.
+        destinations = rand.sample(range(1, 6), rand.randint(1, 5))
+        first_hops = schrouter.get_best_first_hops(0, curr_timestamp, destinations)
+        for dest in destinations:
+            uncached_schrouter.route_cache.clear()
+            route = uncached_schrouter.get_best_route_dijkstra(0, dest, curr_timestamp)
+            if route is None:
+                assert dest not in first_hops
+            else:
+                assert first_hops[dest].id == route.hops[0].id
+
+"""
+Tests that modifying the contact plan invalidates cached routes.
+"""
+def test_route_cache_invalidated_by_contact_plan_changes():
+    # construct a Schrouter w/ a direct contact 0->1.
+    schrouter = Schrouter()
+    schrouter.add_contact(source=0, dest=1, start_time=5, end_time=sys.maxsize, rate=100)
+
+    # the direct route is cached...
+    assert len(schrouter.get_best_route_dijkstra(0, 1, 0).hops) == 1
+
+    # ...until an earlier two-hop route is added.
+    schrouter.add_contact(source=0, dest=2, start_time=0, end_time=sys.maxsize, rate=100)
+    schrouter.add_contact(source=2, dest=1, start_time=0, end_time=sys.maxsize, rate=100)
+    assert len(schrouter.get_best_route_dijkstra(0, 1, 0).hops) == 2
+
+    # removing node 2 brings back the direct route.
+    schrouter.remove_all_contacts_for_node(2)
+    assert len(schrouter.get_best_route_dijkstra(0, 1, 0).hops) == 1
+
+    # removing the direct contact leaves no route at all.
+    schrouter.remove_contact_by_contact_id(0)
+    assert schrouter.get_best_route_dijkstra(0, 1, 0) is None
+
+
+"""
+Tests that route lists match py_cgr_lib's cgr_yen run over the whole contact plan, start with the dijkstra route,
+and are only rebuilt once the best route expires or the contact plan changes.
+"""
+def test_best_routes_match_cgr_yen():
+    rand = random.Random(2)
+    schrouter = Schrouter()
+    for _ in range(40):
+        source, dest = rand.sample(range(6), 2)
+        start_time = rand.randint(0, 100)
+        end_time = start_time + rand.randint(1, 40)
+        schrouter.add_contact(source, dest, start_time, end_time, 100)
+
+    for curr_timestamp in range(0, 120, 7):
+        for dest in range(1, 6):
+            schrouter.route_tables.clear()
+            routes = schrouter.get_best_routes(0, dest, curr_timestamp, 4)
+            expected_routes = cgr_yen(0, dest, curr_timestamp, schrouter.contact_plan, 4)
+            assert [[hop.id for hop in route.hops] for route in routes] == \
+                   [[hop.id for hop in route.hops] for route in expected_routes]
+            best_route = schrouter.get_best_route_dijkstra(0, dest, curr_timestamp)
+            if best_route is None:
+                assert routes == []
+            else:
+                assert [hop.id for hop in routes[0].hops] == [hop.id for hop in best_route.hops]
+
+
+def test_best_routes_rebuilt_lazily():
+    # construct a Schrouter w/ a two-hop route 0->2->1 which ends @10 + a later direct route 0->1.
+    schrouter = Schrouter()
+    schrouter.add_contact(source=0, dest=2, start_time=0, end_time=10, rate=100)
+    schrouter.add_contact(source=2, dest=1, start_time=0, end_time=20, rate=100)
+    schrouter.add_contact(source=0, dest=1, start_time=5, end_time=30, rate=100)
+
+    routes = schrouter.get_best_routes(0, 1, 0, 3)
+    assert [route.next_node for route in routes] == [2, 1]
+
+    # the same route list is used until the best route expires...
+    assert schrouter.get_best_routes(0, 1, 9, 3) is routes
+    routes = schrouter.get_best_routes(0, 1, 10, 3)
+    assert [route.next_node for route in routes] == [1]
+
+    # ...or the contact plan changes.
+    schrouter.add_contact(source=0, dest=3, start_time=0, end_time=30, rate=100)
+    schrouter.add_contact(source=3, dest=1, start_time=0, end_time=30, rate=100)
+    routes = schrouter.get_best_routes(0, 1, 10, 3)
+    assert sorted(route.next_node for route in routes) == [1, 3]
+
+
+"""
+Tests that routes avoid contacts once their volume has been consumed.
+"""
+def test_depleted_contacts_are_avoided():
+    # construct a Schrouter w/ a direct contact 0->1 of volume 10 + a later two-hop route 0->2->1.
+    schrouter = Schrouter()
+    schrouter.add_contact(source=0, dest=1, start_time=0, end_time=10, rate=1)
+    schrouter.add_contact(source=0, dest=2, start_time=5, end_time=20, rate=1)
+    schrouter.add_contact(source=2, dest=1, start_time=5, end_time=20, rate=1)
+
+    direct_contact = schrouter.get_best_first_hops(0, 0, [1])[1]
+    assert direct_contact.to == 1
+    assert schrouter.get_residual_volume(direct_contact) == 10
+
+    # consuming part of the volume doesn't change the route...
+    schrouter.consume_contact_volume(direct_contact, 6)
+    assert schrouter.get_residual_volume(direct_contact) == 4
+    assert schrouter.get_best_route_dijkstra(0, 1, 0).hops[0].to == 1
+
+    # ...but using it all up does.
+    schrouter.consume_contact_volume(direct_contact, 4)
+    assert schrouter.get_residual_volume(direct_contact) == 0
+    assert schrouter.get_best_route_dijkstra(0, 1, 0).hops[0].to == 2
+    assert schrouter.get_best_first_hops(0, 0, [1])[1].to == 2
+    assert [route.next_node for route in schrouter.get_best_routes(0, 1, 0, 3)] == [2]
+
+
+"""
+Tests that Schrouters loading the same contact plan file share it, and that modifying one Schrouter's contact plan
+doesn't affect the others.
+"""
+def test_shared_contact_plan_copy_on_write():
+    filename = "peripherals/routing_protocol/test/cgr/test_contact_plans/contactPlan.json"
+    schrouter_1 = Schrouter(filename)
+    schrouter_2 = Schrouter(filename)
+    assert schrouter_1.contact_graph is schrouter_2.contact_graph
+
+    # remove every contact to node 1 from the first Schrouter only.
+    schrouter_1.remove_all_contacts_for_node(1)
+    assert schrouter_1.contact_graph is not schrouter_2.contact_graph
+    assert not schrouter_1.check_any_availability(1)
+    assert schrouter_1.get_best_route_dijkstra(10, 1, 0) is None
+
+    # the second Schrouter + Schrouters created later still see the whole contact plan.
+    for schrouter in [schrouter_2, Schrouter(filename)]:
+        assert schrouter.check_any_availability(1)
+        assert schrouter.get_best_route_dijkstra(10, 1, 0).hops[0].to == 1
+
+
+"""
+Tests that a contact plan converted to a .npy file computes the same routes as the original JSON file.
+"""
+def test_npy_contact_plan_matches_json(tmp_path):
+    filename = "peripherals/routing_protocol/test/cgr/test_contact_plans/cprtlarge.json"
+    npy_filename = str(tmp_path / "cprtlarge.npy")
+    write_contact_plan_to_npy(read_contact_plan_from_json(filename), npy_filename)
+
+    json_schrouter = Schrouter(filename)
+    npy_schrouter = Schrouter(npy_filename)
+    assert len(npy_schrouter.contact_plan) == len(json_schrouter.contact_plan)
+    for curr_timestamp in range(0, 320, 10):
+        for dest in [2, 3, 4]:
+            json_route = json_schrouter.get_best_route_dijkstra(1, dest, curr_timestamp)
+            npy_route = npy_schrouter.get_best_route_dijkstra(1, dest, curr_timestamp)
+            if json_route is None:
+                assert npy_route is None
+            else:
+                assert [(hop.id, hop.frm, hop.to, hop.start, hop.end) for hop in npy_route.hops] \
+                       == [(hop.id, hop.frm, hop.to, hop.start, hop.end) for hop in json_route.hops]
+
+
+"""
+Tests that a contact plan file is loaded again once it's modified.
+"""
+def test_shared_contact_plan_reloaded_when_modified(tmp_path):
+    filename = str(tmp_path / "contactPlan.json")
+    contact = {"contact": 0, "source": 0, "dest": 1, "startTime": 0, "endTime": 10, "rate": 100,
+               "owlt": 0, "confidence": 1.0}
+    with open(filename, "w") as contact_plan_file:
+        json.dump({"contacts": [contact]}, contact_plan_file)
+    schrouter_1 = Schrouter(filename)
+    assert schrouter_1.check_any_availability(1)
+
+    # rewrite the file w/ a different contact + make sure its modification time changes.
+    with open(filename, "w") as contact_plan_file:
+        json.dump({"contacts": [dict(contact, dest=2)]}, contact_plan_file)
+    modification_time = os.stat(filename).st_mtime_ns + 1000000
+    os.utime(filename, ns=(modification_time, modification_time))
+
+    schrouter_2 = Schrouter(filename)
+    assert not schrouter_2.check_any_availability(1)
+    assert schrouter_2.check_any_availability(2)
+
+
+"""
+Tests that Schrouters sharing a contact plan retire its expired contacts once per timestamp, and that Schrouters
+created afterwards (for a new simulation) get the whole contact plan again.
+"""
+def test_shared_contact_plan_retires_expired_contacts():
+    filename = "peripherals/routing_protocol/test/cgr/test_contact_plans/contactPlan.json"
+    schrouter_1 = Schrouter(filename)
+    schrouter_2 = Schrouter(filename)
+    contact_graph = schrouter_1.contact_graph
+    assert contact_graph is schrouter_2.contact_graph
+    assert len(schrouter_1.contact_plan) == 2
+
+    # the contact from 10 to 20 has ended at 21.
+    schrouter_1.retire_expired_contacts(21)
+    assert [(contact.start, contact.end) for contact in schrouter_2.contact_plan] == [(25, 38)]
+    assert not schrouter_2.check_any_availability(1)
+    assert schrouter_2.contact_graph is contact_graph
+    assert contact_graph.retired_before == 21
+
+    # the other Schrouter retiring at the same timestamp has nothing left to do.
+    schrouter_2.retire_expired_contacts(21)
+    schrouter_2.retire_expired_contacts(20)
+    assert contact_graph.retired_before == 21
+    assert len(schrouter_2.contact_plan) == 1
+
+    schrouter_3 = Schrouter(filename)
+    assert schrouter_3.contact_graph is not contact_graph
+    assert len(schrouter_3.contact_plan) == 2
+    assert schrouter_3.get_best_route_dijkstra(10, 1, 0).hops[0].to == 1
@@ -57,4 +57,67 @@ def test_bundle_expiration():
 
     # verify that the expired_bundle is no longer in Storage.
     retrieved_bundle = storage.get_next_bundle_for_id(dest_id)
-    assert retrieved_bundle is None
\ No newline at end of file
+    assert retrieved_bundle is None
+
+def test_remove_bundles_for_dest_within_volume():
+    # setup a dummy model object used by the CGR objects.
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule})
+    storage = Storage(dummy_model)
+
+    # store three bundles of sizes 3, 4 and 1.
+    dest_id = 123
+    bundles = [Bundle(i, dest_id, Payload(), 0, BUNDLE_LIFESPAN, size) for i, size in enumerate([3, 4, 1])]
+    for bundle in bundles:
+        storage.store_bundle(dest_id, bundle)
+
+    # the second bundle doesn't fit, so the third one has to wait for it.
+    assert storage.remove_bundles_for_dest_within_volume(dest_id, 6) == bundles[:1]
+    assert storage.remove_bundles_for_dest_within_volume(dest_id, 3) == []
+    assert storage.remove_bundles_for_dest_within_volume(dest_id, 5) == bundles[1:]
+    assert storage.get_all_bundle_dest_ids() == []
+
+
+def test_bundle_expiration_in_any_order():
+    # setup a dummy model object used by the CGR objects.
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule})
+    storage = Storage(dummy_model)
+
+    # store bundles for two destinations which expire out of order, some of them at the same time.
+    lifespans = [3, 1, 2, 1, 5, 2]
+    bundles = [Bundle(i, i % 2, Payload(), 0, lifespan) for i, lifespan in enumerate(lifespans)]
+    for bundle in bundles:
+        storage.store_bundle(bundle.dest_id, bundle)
+    # a bundle which leaves storage before it expires isn't affected by its expiration.
+    assert storage.get_next_bundle_for_id(0, bundles[0]) == bundles[2]
+
+    for step in range(6):
+        storage.refresh()
+        expected_bundles = [bundle for bundle in bundles[1:] if bundle.expiration_timestamp > step]
+        assert sorted(bundle.bundle_id for bundle in storage.get_all_bundles()) == \
+               [bundle.bundle_id for bundle in expected_bundles]
+        assert storage.get_num_bundles() == len(expected_bundles)
+        schedule.step()
+
+    assert storage.get_all_bundle_dest_ids() == []
+    assert storage.remove_all_bundles_for_dest(0) == []
+
+def test_expired_bundle_ids_are_forgotten():
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule})
+    storage = Storage(dummy_model)
+
+    dest_id = 123
+    short_bundle = Bundle(1, dest_id, Payload(), 0, 2)
+    long_bundle = Bundle(2, dest_id, Payload(), 0, BUNDLE_LIFESPAN)
+    storage.store_bundle(dest_id, short_bundle)
+    storage.store_bundle(dest_id, long_bundle)
+    assert storage.store_bundle(dest_id, short_bundle)
+
+    # once a bundle has expired, the storage no longer remembers seeing it.
+    schedule.time = 2
+    storage.refresh()
+    assert not storage.seen_before(short_bundle)
+    assert storage.seen_before(long_bundle)
+    assert len(storage.seen_bundle_ids) == 1
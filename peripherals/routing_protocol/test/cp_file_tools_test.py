@@ -0,0 +1,55 @@
+"""
+Tests the contact plan file tools.
+"""
+import json
+
+import pytest
+
+from peripherals.routing_protocol.external_dependencies.cp_file_tools import ContactPlanJsonWriter
+
+
+def make_contact(contact_id):
+    return {
+        "contact": contact_id,
+        "source": contact_id % 3,
+        "dest": contact_id % 3 + 1,
+        "startTime": contact_id * 10,
+        "endTime": contact_id * 10 + 5,
+        "rate": 1000,
+        "owlt": 0,
+        "confidence": 1.,
+    }
+
+
+@pytest.mark.parametrize("num_contacts", [0, 1, 5])
+def test_contact_plan_json_writer_matches_json_dumps(tmp_path, num_contacts):
+    filename = str(tmp_path / "cp.json")
+    contacts = [make_contact(contact_id) for contact_id in range(num_contacts)]
+    writer = ContactPlanJsonWriter(filename)
+    for contact in contacts:
+        writer.write_contact(contact)
+    writer.close()
+
+    with open(filename, "r") as contact_plan_file:
+        assert contact_plan_file.read() == json.dumps({"contacts": contacts}, indent=4)
+    assert not (tmp_path / "cp.json.part").exists()
+
+
+def test_contact_plan_json_writer_only_replaces_file_when_closed(tmp_path):
+    filename = str(tmp_path / "cp.json")
+    old_contact_plan = json.dumps({"contacts": [make_contact(0)]}, indent=4)
+    with open(filename, "w") as contact_plan_file:
+        contact_plan_file.write(old_contact_plan)
+
+    # a writer which is never closed (e.g. an aborted simulation) leaves the old contact plan as it was.
+    unfinished_writer = ContactPlanJsonWriter(filename)
+    assert not (tmp_path / "cp.json.part").exists()
+    unfinished_writer.write_contact(make_contact(1))
+    with open(filename, "r") as contact_plan_file:
+        assert contact_plan_file.read() == old_contact_plan
+
+    writer = ContactPlanJsonWriter(filename)
+    writer.write_contact(make_contact(2))
+    writer.close()
+    with open(filename, "r") as contact_plan_file:
+        assert json.load(contact_plan_file) == {"contacts": [make_contact(2)]}
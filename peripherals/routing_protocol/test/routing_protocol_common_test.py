@@ -0,0 +1,74 @@
+"""
+Tests for the content shared across the networking protocol classes.
+"""
+from payload import ClientPayload
+from peripherals.routing_protocol.routing_protocol_common import ExpiringIdSet, IdAllocator
+
+
+def test_expiring_id_set():
+    seen_ids = ExpiringIdSet()
+    seen_ids.add("a", 10)
+    seen_ids.add("b", 20)
+    seen_ids.add("c", 10)
+    assert "a" in seen_ids and "b" in seen_ids and "c" in seen_ids
+    assert len(seen_ids) == 3
+
+    # ids are remembered until their expiration timestamp.
+    seen_ids.remove_expired(9)
+    assert len(seen_ids) == 3
+
+    seen_ids.remove_expired(10)
+    assert "a" not in seen_ids and "c" not in seen_ids
+    assert "b" in seen_ids
+    assert len(seen_ids) == 1
+
+    seen_ids.remove_expired(20)
+    assert len(seen_ids) == 0
+
+
+def test_expiring_id_set_keeps_later_expiration():
+    seen_ids = ExpiringIdSet()
+    seen_ids.add("a", 20)
+    seen_ids.add("a", 10)  # doesn't shorten how long "a" is remembered
+    seen_ids.add("b", 10)
+    seen_ids.add("b", 30)  # extends how long "b" is remembered
+
+    seen_ids.remove_expired(15)
+    assert "a" in seen_ids and "b" in seen_ids
+
+    seen_ids.remove_expired(25)
+    assert "a" not in seen_ids and "b" in seen_ids
+
+    seen_ids.remove_expired(30)
+    assert len(seen_ids) == 0
+
+
+def test_id_allocator():
+    ids = IdAllocator()
+    assert [ids.get_id(key, 10) for key in ["a", "b", "a", "c", "b"]] == [0, 1, 0, 2, 1]
+    assert ids.get_id("d", 20) == 3
+    assert len(ids) == 4
+
+    # every allocator hands out its own ids.
+    assert IdAllocator().get_id("c", 10) == 0
+
+    # keys are forgotten once they expire, while their ids are never handed out again.
+    ids.remove_expired(10)
+    assert len(ids) == 1 and "a" not in ids
+    assert ids.get_id("d", 20) == 3
+    assert ids.get_id("a", 30) == 4
+
+
+def test_client_payloads_with_same_contents_share_id():
+    payload_ids = IdAllocator()
+    payload = ClientPayload(0, "c0", "c1", 10, 100, payload_ids)
+    same_payload = ClientPayload(0, "c0", "c1", 10, 100, payload_ids)
+    # a different drop, source, destination or expiration makes a different payload.
+    other_payloads = [ClientPayload(1, "c0", "c1", 10, 100, payload_ids),
+                      ClientPayload(0, "c1", "c1", 10, 100, payload_ids),
+                      ClientPayload(0, "c0", "c2", 10, 100, payload_ids),
+                      ClientPayload(0, "c0", "c1", 11, 100, payload_ids)]
+
+    assert payload.get_identifier() == same_payload.get_identifier() == 0
+    assert sorted(other.get_identifier() for other in other_payloads) == [1, 2, 3, 4]
+    assert payload.serialize()["payload_id"] == same_payload.serialize()["payload_id"]
@@ -0,0 +1,45 @@
+"""
+Tests the payload handlers of the Epidemic + Spray and Wait agents.
+"""
+import mesa
+import pytest
+from mockito import mock
+
+from payload import ClientPayload
+from peripherals.epidemic_payload_handler import EpidemicPayloadHandler
+from peripherals.routing_protocol.routing_protocol_common import IdAllocator
+from peripherals.spray_and_wait_payload_handler import SprayAndWaitPayloadHandler
+
+# test constants.
+PAYLOAD_LIFESPAN = 10
+
+
+@pytest.mark.parametrize("handler_class", [EpidemicPayloadHandler, SprayAndWaitPayloadHandler])
+def test_seen_payload_ids_are_forgotten_once_expired(handler_class):
+    schedule = mesa.time.RandomActivation(mesa.Model())
+    dummy_model = mock({"schedule": schedule, "payload_ids": IdAllocator(), "bundle_ids": IdAllocator(),
+                        "model_params": {"bundle_lifespan": 100}})
+    handler = handler_class("r0", dummy_model, mock())
+
+    for drop_id in range(50):
+        payload = ClientPayload(drop_id, "c0", "c1", schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+        handler.store_payload(payload)
+        handler.handle_payload(payload)
+        # payloads which were already seen are ignored.
+        handler.handle_payload(payload)
+        schedule.step()
+        handler.refresh()
+        # only the unexpired payloads are remembered.
+        assert len(handler.seen_payload_ids) <= PAYLOAD_LIFESPAN
+    assert handler.num_drops_picked_up == 50
+    assert handler.num_payloads_received == 0
+
+    # expired payloads are ignored, even though they have been forgotten.
+    expired_payload = ClientPayload(0, "c0", "c1", 0, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    handler.handle_payload(expired_payload)
+    assert handler.num_payloads_received == 0
+
+    received_payload = ClientPayload(50, "c1", "c0", schedule.time, PAYLOAD_LIFESPAN, dummy_model.payload_ids)
+    handler.handle_payload(received_payload)
+    handler.handle_payload(received_payload)
+    assert handler.num_payloads_received == 1
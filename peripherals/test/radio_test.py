@@ -0,0 +1,35 @@
+"""
+Tests the helpers used to send the state of the agents' radios to the visualization server.
+"""
+from payload import ClientMappingDictPayload, ClientPayload
+from peripherals.radio import makeSerializeable
+from peripherals.routing_protocol.routing_protocol_common import Bundle, IdAllocator
+
+
+class DictBacked:
+    """Stands in for the classes as they were before they declared __slots__, when their state was in __dict__"""
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def test_slotted_objects_serialize_like_dict_backed_ones():
+    payload = ClientPayload(3, "c0", "c1", 10, 100, IdAllocator())
+    bundle = Bundle(7, 2, payload, 10, 50, size=4)
+    # the serialize() caches are private slots, which are left out.
+    bundle.serialize()
+
+    old_payload = DictBacked(payload_id=0, drop_id=3, source_client_id="c0", dest_client_id="c1",
+                             expiration_timestamp=110, creation_timestamp=10)
+    old_bundle = DictBacked(bundle_id=7, dest_id=2, payload=old_payload, expiration_timestamp=60,
+                            creation_timestamp=10, size=4)
+    serialized = makeSerializeable(bundle)
+    assert serialized == makeSerializeable(old_bundle)
+    assert serialized["payload"] == makeSerializeable(payload) == old_payload.__dict__
+    # keys keep the order of the old __dict__s.
+    assert list(serialized) == list(old_bundle.__dict__)
+    assert list(serialized["payload"]) == list(old_payload.__dict__)
+
+    # inside the containers the radio sends too.
+    mappings = ClientMappingDictPayload({"c0": {1: 20}})
+    assert makeSerializeable([{"bundles": (bundle,)}, mappings]) \
+           == [{"bundles": (makeSerializeable(old_bundle),)}, {"client_mappings": {"c0": {1: 20}}}]
@@ -0,0 +1,175 @@
+"""
+Predicts the contact plan between RouterAgents directly from their movement patterns, without running the simulation.
+
+RouterAgents move deterministically along their patterns, so their positions at every step can be computed up front.
+Positions are stepped for all routers at once with NumPy, and contacts are found for every pair of routers at every
+step at once, using the noise-free RSSI.  The result is the contact plan `--make-contact-plan 0` would record in a
+simulation run with an RSSI noise standard deviation of 0, in the same format.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from model import merge
+from peripherals.movement import generate_pattern
+from run_model_vis import SIM_WIDTH, SIM_HEIGHT
+
+# agent types which the LunarModel stores as RouterAgents (agents without a type are routers).
+ROUTER_TYPES = ("router", "epidemic", "spray")
+
+# the number of (step, pair) entries to compute contacts for at once.  bounds the memory used by predict_contacts().
+CHUNK_SIZE = 2 ** 22
+
+
+def get_router_options(initial_state):
+    """
+    Returns the options of every router in the initial state, with the agent defaults merged in
+    and ids assigned the same way as the LunarModel does.
+    """
+    router_options = []
+    next_id = 0
+    for agent_options in initial_state["agents"]:
+        options = agent_options.copy()
+        merge(initial_state["agent_defaults"], options)
+        if "id" not in options:
+            # mesa's Model.next_id()
+            next_id += 1
+            options["id"] = next_id
+        if "type" not in options or options["type"] in ROUTER_TYPES:
+            router_options.append(options)
+    return router_options
+
+
+def predict_positions(router_options, model_params, num_steps, size=(SIM_WIDTH, SIM_HEIGHT)):
+    """
+    Returns the position of every router at the start of every step, as a (num_steps, num routers, 2) array.
+
+    Follows Movement.step() + LunarModel.move_agent() / teleport_agent():  a router heads to the next waypoint of its
+    pattern once it's within 0.01 of its current one, at most at its speed, and moves that would break the model speed
+    limit or leave the space are ignored.
+    """
+    patterns = [generate_pattern(options["movement"]) for options in router_options]
+    max_speeds = np.array([options["movement"]["speed"] for options in router_options], dtype=float)
+    speed_limit = model_params["model_speed_limit"] + 0.0005
+
+    positions = np.empty((num_steps, len(router_options), 2))
+    pos = np.array([options.get("pos", pattern.starting_pos) for options, pattern in zip(router_options, patterns)],
+                   dtype=float).reshape(len(router_options), 2)
+    target = np.array([pattern.starting_pos for pattern in patterns], dtype=float).reshape(len(router_options), 2)
+    should_teleport = np.zeros(len(router_options), dtype=bool)
+
+    for step in range(num_steps):
+        positions[step] = pos
+
+        # pick the next waypoint for the routers which reached their current one.
+        delta = target - pos
+        for i in np.flatnonzero(delta[:, 0] ** 2 + delta[:, 1] ** 2 < 0.01 ** 2).tolist():
+            target[i] = patterns[i].next()
+            should_teleport[i] = patterns[i].should_teleport
+
+        if should_teleport.any():
+            pos = np.where((should_teleport & in_bounds(target, size))[:, np.newaxis], target, pos)
+
+        # move towards the target, at most at the router's speed.
+        delta = target - pos
+        magnitude = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+        too_fast = magnitude > max_speeds
+        delta[too_fast] = delta[too_fast] / magnitude[too_fast, np.newaxis] * max_speeds[too_fast, np.newaxis]
+        new_pos = pos + delta
+        allowed = (np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2) <= speed_limit) & in_bounds(new_pos, size)
+        pos = np.where(allowed[:, np.newaxis], new_pos, pos)
+
+    return positions
+
+
+def in_bounds(pos, size):
+    # mesa's ContinuousSpace.out_of_bounds(), negated
+    return (pos[:, 0] >= 0) & (pos[:, 0] < size[0]) & (pos[:, 1] >= 0) & (pos[:, 1] < size[1])
+
+
+def predict_contacts(router_options, positions):
+    """
+    Returns the contact windows between every pair of routers as a list of (router id, router id, start, end),
+    where start + end are the first and last step at which the pair is connected in either direction,
+    sorted by start step.
+    """
+    ids = [options["id"] for options in router_options]
+    detection_thresh = np.array([options["radio"]["detection_thresh"] for options in router_options], dtype=float)
+    connection_thresh = np.array([options["radio"]["connection_thresh"] for options in router_options], dtype=float)
+    # the RSSI an agent needs to see from another agent to be connected to it (see LinkState.update_links()).
+    required_rssi = np.maximum(detection_thresh, connection_thresh)
+
+    first, second = np.triu_indices(len(router_options), k=1)
+    num_steps = positions.shape[0]
+    pairs_per_chunk = max(1, CHUNK_SIZE // max(1, num_steps))
+
+    contacts = []
+    for chunk_start in range(0, len(first), pairs_per_chunk):
+        chunk_first = first[chunk_start:chunk_start + pairs_per_chunk]
+        chunk_second = second[chunk_start:chunk_start + pairs_per_chunk]
+
+        # noise-free RSSI of every pair at every step, computed like LinkState does.
+        delta = positions[:, chunk_second] - positions[:, chunk_first]
+        distance = np.hypot(delta[..., 0], delta[..., 1])
+        with np.errstate(divide="ignore"):
+            rssi = np.where(distance == 0, 0., -25 * np.log10(distance))
+        in_contact = (rssi >= required_rssi[chunk_first]) | (rssi >= required_rssi[chunk_second])
+
+        # contact windows start where in_contact turns True and end where it turns False.
+        padding = np.zeros((1, len(chunk_first)), dtype=bool)
+        changes = np.diff(np.concatenate((padding, in_contact, padding)).astype(np.int8), axis=0)
+        starts = np.argwhere(changes == 1)
+        ends = np.argwhere(changes == -1)
+        # argwhere() is ordered by step first, so sort by pair to line up each start with its end.
+        starts = starts[np.lexsort((starts[:, 0], starts[:, 1]))]
+        ends = ends[np.lexsort((ends[:, 0], ends[:, 1]))]
+        for (start, pair), (end, _) in zip(starts.tolist(), ends.tolist()):
+            contacts.append((ids[chunk_first[pair]], ids[chunk_second[pair]], start, end - 1))
+
+    contacts.sort(key=lambda contact: contact[2])
+    return contacts
+
+
+def make_contact_plan(contacts):
+    """Converts contact windows into a contact plan with a contact in each direction, like LunarModel does"""
+    contact_list = []
+    for node1, node2, start, end in contacts:
+        for source, dest in ((node1, node2), (node2, node1)):
+            contact_list.append({
+                "contact": len(contact_list),
+                "source": source,
+                "dest": dest,
+                "startTime": start,
+                "endTime": end,
+                "rate": 1000,
+                "owlt": 0,
+                "confidence": 1.,
+            })
+    return {"contacts": contact_list}
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("-a", default="experiments/demo/agents_d1.json", help="path to json file with agent parameters")
+    argParser.add_argument("-m", default="experiments/demo/model_d1.json", help="path to json file with model parameters")
+    argParser.add_argument("-o", default="./cp.json", help="path to write the contact plan to [default=./cp.json]")
+    argParser.add_argument("--steps", type=int, help="number of steps to predict [default=max_steps in model params]")
+    args = argParser.parse_args()
+
+    with open(args.a, "r") as agent_file:
+        initial_state = json.load(agent_file)
+    with open(args.m, "r") as model_file:
+        model_params = json.load(model_file)
+    num_steps = args.steps if args.steps is not None else model_params["max_steps"]
+
+    router_options = get_router_options(initial_state)
+    positions = predict_positions(router_options, model_params, num_steps)
+    contact_plan = make_contact_plan(predict_contacts(router_options, positions))
+    with open(args.o, "w") as outfile:
+        outfile.write(json.dumps(contact_plan, indent=4))
+    print("Wrote {} contacts to {}".format(len(contact_plan["contacts"]), args.o))
+
+
+if __name__ == "__main__":
+    main()
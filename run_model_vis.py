@@ -10,6 +10,7 @@ from statistics import mean, stdev
 
 from peripherals.movement import *
 from agent.router_agent import RoutingProtocol
+from peripherals.routing_protocol.cgr.schrouter import load_shared_contact_graph
 
 SIM_WIDTH = 1000  # 1 km
 SIM_HEIGHT = 650  # 650 m
@@ -28,9 +29,22 @@ class ObjectOption(mesa.visualization.UserParam):
     def value(self, value):
         self._value = value
 
+# Load the contact plans used by CGR routers once, so every trial process starts with them already loaded
+def preload_contact_plans(model_params, agent_state):
+    if model_params.get("sim_type") != 0 or RoutingProtocol(model_params["backbone_routing_protocol"]) != RoutingProtocol.CGR:
+        return
+    cp_files = set()
+    for agent_options in agent_state["agents"]:
+        cp_file = agent_options.get("cp_file", agent_state["agent_defaults"].get("cp_file"))
+        if cp_file is not None and agent_options.get("type", "router") == "router":
+            cp_files.add(cp_file)
+    for cp_file in cp_files:
+        load_shared_contact_graph(cp_file, model_params.get("cgr_time_horizon"))
+
 # Run in Batches
 def run_batches(num_trials, model_params, agent_state):
     #https://stackoverflow.com/questions/31711378/python-multiprocessing-how-to-know-to-use-pool-or-process
+    preload_contact_plans(model_params.value, agent_state.value)
     output_q = mp.Queue()
     num_processes = num_trials
     processes = [mp.Process(target=get_trial_results, args=(i, output_q, model_params.value, agent_state.value, model_params.value["max_steps"])) for i in range(num_processes)]
@@ -174,6 +188,12 @@ def main():
         new_json["log_metrics"] = True
         model_params.value = json.dumps(new_json)
 
+    if args.nv or int(args.b) > 0:
+        # nothing displays the history of the routers without the visualization.
+        new_json = model_params.value
+        new_json["record_history"] = False
+        model_params.value = json.dumps(new_json)
+
     if args.correctness:
         new_json = model_params.value
         new_json["correctness"] = True
@@ -0,0 +1,154 @@
+"""
+Spatial indexes used by LinkState to find the pairs of agents that are close enough to possibly detect each other.
+
+Both indexes answer the same two questions for a fixed search radius:
+    - pairs(): every ordered pair (i, j), i != j, of agent indices within the radius of each other
+    - neighbors_of(i): every agent index within the radius of agent i
+so neighbor discovery costs O(N*k) instead of O(N^2), where k is the average number of nearby agents.
+"""
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class GridIndex():
+    """
+    Uniform grid with cells as wide as the search radius.
+    Any agent within the radius of an agent is in the same cell or one of the 8 surrounding cells.
+    Kept in sync incrementally: moving an agent only touches the cells it leaves and enters.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.cell_size = radius
+        self.positions = None
+        self.cell_of = []
+        self.cells = {}
+
+    def rebuild(self, positions):
+        self.positions = positions
+        self.cell_of = [self.__cell(pos) for pos in positions]
+        self.cells = {}
+        for i, cell in enumerate(self.cell_of):
+            self.cells.setdefault(cell, set()).add(i)
+
+    def move(self, i, pos):
+        # self.positions is shared with the LinkState, so it already holds the new position
+        new_cell = self.__cell(pos)
+        old_cell = self.cell_of[i]
+        if new_cell == old_cell:
+            return
+        self.cells[old_cell].discard(i)
+        if not self.cells[old_cell]:
+            del self.cells[old_cell]
+        self.cells.setdefault(new_cell, set()).add(i)
+        self.cell_of[i] = new_cell
+
+    def pairs(self):
+        from_indices = []
+        to_indices = []
+        for (cx, cy), members in self.cells.items():
+            members = np.fromiter(members, dtype=int, count=len(members))
+            candidates = self.__members_around(cx, cy)
+            # all (member, candidate) combinations
+            from_indices.append(np.repeat(members, len(candidates)))
+            to_indices.append(np.tile(candidates, len(members)))
+        if not from_indices:
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        return self.__within_radius(np.concatenate(from_indices), np.concatenate(to_indices))
+
+    def neighbors_of(self, i):
+        cx, cy = self.cell_of[i]
+        candidates = self.__members_around(cx, cy)
+        _, to_indices = self.__within_radius(np.full(len(candidates), i), candidates)
+        return to_indices
+
+    def __cell(self, pos):
+        return (math.floor(pos[0] / self.cell_size), math.floor(pos[1] / self.cell_size))
+
+    def __members_around(self, cx, cy):
+        candidates = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                candidates.extend(self.cells.get((cx + dx, cy + dy), ()))
+        return np.array(candidates, dtype=int)
+
+    def __within_radius(self, from_indices, to_indices):
+        delta = self.positions[to_indices] - self.positions[from_indices]
+        keep = (np.hypot(delta[:, 0], delta[:, 1]) <= self.radius) & (from_indices != to_indices)
+        return from_indices[keep], to_indices[keep]
+
+
+class KdTreeIndex():
+    """
+    scipy cKDTree rebuilt from scratch every time pairs() is called (once per step).
+    A cKDTree can not be updated in place, so the agents that move during the step are kept in a small grid
+    (with cells as wide as the search radius) until the next rebuild, and left out of the tree's answers.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.cell_size = radius
+        self.positions = None
+        self.tree = None
+        self.moved_cell_of = {}  # key = index of an agent moved since the tree was built, value = its cell
+        self.moved_cells = {}  # key = cell, value = set of the moved agents in it
+
+    def rebuild(self, positions):
+        self.positions = positions
+        self.tree = None
+        self.moved_cell_of = {}
+        self.moved_cells = {}
+
+    def move(self, i, pos):
+        # self.positions is shared with the LinkState, so it already holds the new position
+        if self.tree is None:
+            # no tree to keep in sync:  the next pairs() call builds it from the new positions
+            return
+        new_cell = self.__cell(pos)
+        old_cell = self.moved_cell_of.get(i)
+        if new_cell == old_cell:
+            return
+        if old_cell is not None:
+            self.moved_cells[old_cell].discard(i)
+            if not self.moved_cells[old_cell]:
+                del self.moved_cells[old_cell]
+        self.moved_cells.setdefault(new_cell, set()).add(i)
+        self.moved_cell_of[i] = new_cell
+
+    def pairs(self):
+        self.tree = cKDTree(self.positions)
+        self.moved_cell_of = {}
+        self.moved_cells = {}
+        pairs = self.tree.query_pairs(self.radius, output_type="ndarray")
+        # query_pairs only returns each unordered pair once (i < j)
+        return np.concatenate((pairs[:, 0], pairs[:, 1])), np.concatenate((pairs[:, 1], pairs[:, 0]))
+
+    def neighbors_of(self, i):
+        pos = self.positions[i]
+        if self.tree is None:
+            candidates = np.arange(len(self.positions))
+        else:
+            # the tree holds the positions from when it was built, which are out of date for the moved agents.
+            candidates = [j for j in self.tree.query_ball_point(pos, self.radius) if j not in self.moved_cell_of]
+            cx, cy = self.__cell(pos)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    candidates.extend(self.moved_cells.get((cx + dx, cy + dy), ()))
+            candidates = np.array(candidates, dtype=int)
+        delta = self.positions[candidates] - pos
+        within_radius = (np.hypot(delta[:, 0], delta[:, 1]) <= self.radius) & (candidates != i)
+        return candidates[within_radius]
+
+    def __cell(self, pos):
+        return (math.floor(pos[0] / self.cell_size), math.floor(pos[1] / self.cell_size))
+
+
+def make_spatial_index(kind, radius):
+    """Creates the spatial index named by the "spatial_index" model parameter"""
+    if kind == "grid":
+        return GridIndex(radius)
+    elif kind == "kdtree":
+        return KdTreeIndex(radius)
+    raise ValueError("Unknown spatial index {}".format(kind))
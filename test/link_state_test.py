@@ -0,0 +1,160 @@
+"""
+Tests the LinkState RSSI matrix used by the LunarModel for neighbor discovery.
+"""
+import math
+import random
+
+import numpy as np
+import pytest
+
+from link_state import LinkState
+
+# test constants.
+NUM_AGENTS = 30
+SIZE = 1000
+SEED = 1234
+
+
+class FakeRadio:
+    def __init__(self, detection_thresh, connection_thresh):
+        self.detection_thresh = detection_thresh
+        self.connection_thresh = connection_thresh
+
+
+class FakeAgent:
+    def __init__(self, unique_id, pos, detection_thresh=-60, connection_thresh=-50):
+        self.unique_id = unique_id
+        self.pos = pos
+        self.radio = FakeRadio(detection_thresh, connection_thresh)
+
+
+def make_agents(num_agents=NUM_AGENTS, seed=SEED):
+    agent_random = random.Random(seed)
+    agents = []
+    for i in range(num_agents):
+        # ids don't have to match the indices of the agents.
+        agents.append(FakeAgent(i * 3 + 1,
+                                (agent_random.uniform(0, SIZE), agent_random.uniform(0, SIZE)),
+                                detection_thresh=agent_random.choice([-65, -60]),
+                                connection_thresh=agent_random.choice([-55, -50])))
+    # two agents at the same position always see each other with an RSSI of 0.
+    agents[1].pos = agents[0].pos
+    return agents
+
+
+def get_neighbors_per_pair(agent, agents):
+    """The per-pair neighbor computation LinkState replaced, at an RSSI noise of 0"""
+    neighbors = []
+    for other in agents:
+        if other is not agent:
+            distance = math.dist(agent.pos, other.pos)
+            rssi = 0 if distance == 0 else 10 * 2.5 * math.log10(1 / distance)
+            if rssi >= agent.radio.detection_thresh:
+                neighbors.append({
+                    "id": other.unique_id,
+                    "rssi": rssi,
+                    "connected": rssi >= agent.radio.connection_thresh,
+                })
+    return neighbors
+
+
+def assert_neighbors_match(link_state, agents):
+    for agent in agents:
+        expected = get_neighbors_per_pair(agent, agents)
+        actual = link_state.get_neighbors(agent)
+        assert [n["id"] for n in actual] == [n["id"] for n in expected]
+        assert [n["connected"] for n in actual] == [n["connected"] for n in expected]
+        assert [n["rssi"] for n in actual] == pytest.approx([n["rssi"] for n in expected])
+
+
+def test_neighbors_match_per_pair_computation():
+    agents = make_agents()
+    link_state = LinkState(agents, 0, random.Random(SEED))
+    assert_neighbors_match(link_state, agents)
+    assert any(len(link_state.get_neighbors(agent)) > 0 for agent in agents)
+
+    other = agents[5]
+    assert link_state.get_rssi(agents[0], agents[1]) == 0
+    assert link_state.get_rssi(agents[0], other) == pytest.approx(-25 * math.log10(math.dist(agents[0].pos, other.pos)))
+
+
+def test_update_position_patches_only_moved_agent():
+    agents = make_agents()
+    link_state = LinkState(agents, 2, random.Random(SEED))
+    link_state.get_neighbors(agents[0])
+    rssi_before = link_state.rssi.copy()
+
+    moved = 7
+    agents[moved].pos = (500, 500)
+    link_state.update_position(agents[moved], agents[moved].pos)
+
+    # every RSSI not involving the moved agent keeps its noise.
+    others = np.arange(NUM_AGENTS) != moved
+    assert np.array_equal(link_state.rssi[np.ix_(others, others)], rssi_before[np.ix_(others, others)])
+    assert link_state.rssi[moved, moved] == -np.inf
+    # while the RSSI to + from the moved agent is recomputed from its new position.
+    assert not np.array_equal(link_state.rssi[moved, others], rssi_before[moved, others])
+    assert not np.array_equal(link_state.rssi[others, moved], rssi_before[others, moved])
+
+    # at an RSSI noise of 0, the patched matrix matches the per-pair computation.
+    link_state = LinkState(agents, 0, random.Random(SEED))
+    link_state.get_neighbors(agents[0])
+    agents[moved].pos = (20, 20)
+    link_state.update_position(agents[moved], agents[moved].pos)
+    assert_neighbors_match(link_state, agents)
+
+
+def test_seeded_noise_is_repeatable():
+    agents = make_agents()
+
+    def run(seed):
+        link_state = LinkState(agents, 2, random.Random(seed))
+        matrices = []
+        for step in range(3):
+            link_state.invalidate()
+            link_state.update_links()
+            if step == 1:
+                link_state.update_position(agents[3], (step * 10, step * 10))
+            matrices.append(link_state.rssi.copy())
+        return matrices
+
+    first_run = run(SEED)
+    second_run = run(SEED)
+    for first, second in zip(first_run, second_run):
+        assert np.array_equal(first, second)
+    # each step draws fresh noise.
+    assert not np.array_equal(first_run[0], first_run[2])
+    # and a different seed draws different noise.
+    assert not np.array_equal(first_run[0], run(SEED + 1)[0])
+
+
+def test_update_links_publishes_changed_links():
+    # at an RSSI noise of 0, agent 2 sees agent 1 at -45 dBm (it is 10^1.8 ~= 63 units away).
+    # agent 1 needs a stronger signal to connect, so the link is only up as seen by agent 2.
+    agents = [FakeAgent(1, (0, 0), connection_thresh=-40), FakeAgent(2, (10 ** 1.8, 0)), FakeAgent(3, (900, 900))]
+    link_state = LinkState(agents, 0, random.Random(SEED))
+    events = []
+    other_events = []
+    link_state.add_link_listener(lambda a, b: events.append(("up", a, b)), lambda a, b: events.append(("down", a, b)))
+    link_state.add_link_listener(lambda a, b: other_events.append(("up", a, b)),
+                                 lambda a, b: other_events.append(("down", a, b)))
+
+    link_state.update_links()
+    assert events == [("up", 2, 1)]
+
+    # nothing changed, so nothing is published.
+    events.clear()
+    link_state.invalidate()
+    link_state.update_links()
+    assert events == []
+
+    # agent 3 moves next to agent 1, which is now connected in both directions.
+    # agent 2 is moved out of range.  link downs are published before link ups.
+    events.clear()
+    link_state.update_position(agents[2], (10, 0))
+    link_state.update_position(agents[1], (500, 500))
+    link_state.update_links()
+    assert events == [("down", 2, 1), ("up", 1, 3), ("up", 3, 1)]
+
+    # every listener gets every event.
+    assert other_events == [("up", 2, 1), ("down", 2, 1), ("up", 1, 3), ("up", 3, 1)]
@@ -0,0 +1,122 @@
+"""
+Tests the LunarModel's neighbor discovery + link events.
+"""
+from agent.agent_common import AgentHistory
+from model import LunarModel
+
+# test constants.
+SIZE = (1000, 1000)
+# RSSI thresholds.  at an RSSI noise of 0, agents detect each other within 10^(60/25) ~= 251 units
+# and connect within 10^(50/25) = 100 units.
+DETECTION_THRESH = -60
+CONNECTION_THRESH = -50
+
+
+def make_agent(agent_id, pos, agent_type="epidemic"):
+    return {
+        "name": "R{}".format(agent_id),
+        "type": agent_type,
+        "id": agent_id,
+        "movement": {"pattern": "fixed", "speed": 0, "options": {"pos": pos}},
+    }
+
+
+def make_model(agents, **model_params):
+    params = {"max_steps": None, "rssi_noise_stdev": 0, "model_speed_limit": 10}
+    params.update(model_params)
+    initial_state = {
+        "agent_defaults": {"radio": {"detection_thresh": DETECTION_THRESH, "connection_thresh": CONNECTION_THRESH}},
+        "agents": agents,
+    }
+    return LunarModel(size=SIZE, model_params=params, initial_state=initial_state)
+
+
+def get_neighbor_ids(model, agent_id):
+    return {n["id"] for n in model.get_neighbors(model.agents[agent_id])}
+
+
+def test_neighbors_follow_moves_within_step():
+    model = make_model([make_agent(1, [100, 100]), make_agent(2, [150, 100]), make_agent(3, [600, 600])])
+    model.step()
+    agent_1 = model.agents[1]
+    assert get_neighbor_ids(model, 1) == {2}
+    assert get_neighbor_ids(model, 3) == set()
+
+    # a teleport is seen right away, from both sides of the link.
+    model.teleport_agent(agent_1, (650, 600))
+    assert get_neighbor_ids(model, 1) == {3}
+    assert get_neighbor_ids(model, 2) == set()
+    assert get_neighbor_ids(model, 3) == {1}
+
+    # so is a move.
+    model.move_agent(agent_1, -5, 0)
+    neighbors = model.get_neighbors(agent_1)
+    assert [n["id"] for n in neighbors] == [3]
+    assert neighbors[0]["rssi"] == model.get_rssi(agent_1, model.agents[3])
+    assert neighbors[0]["connected"]
+
+    # moves which the model refuses don't change the neighbors.
+    model.move_agent(agent_1, 100, 0)
+    assert get_neighbor_ids(model, 1) == {3}
+    assert agent_1.pos == (645, 600)
+
+
+def test_unfinished_contact_plan_keeps_old_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("cp.json", "w") as contact_plan_file:
+        contact_plan_file.write('{"contacts": []}')
+
+    # a model which is built + stepped, but never finishes, leaves the old contact plan alone.
+    model = make_model([make_agent(1, [100, 100]), make_agent(2, [150, 100])], make_contact_plan=0)
+    for _ in range(3):
+        model.step()
+    with open("cp.json", "r") as contact_plan_file:
+        assert contact_plan_file.read() == '{"contacts": []}'
+
+
+def test_ids_are_allocated_per_model():
+    drop = {"drop_id": 0, "time": 0, "pos": [100, 100], "target_id": 9}
+    for _ in range(2):
+        # every model hands out its own ids, starting from 0, whatever ran before it.
+        model = make_model([make_agent(1, [100, 100]), make_agent(2, [150, 100])], data_drop_schedule=[drop],
+                           payload_lifespan=100, bundle_lifespan=100)
+        model.agents[1].name = "C1"  # only epidemic agents named C... pick up drops
+        model.step()
+        bundles = model.agents[2].routing_protocol.curr_bundles
+        assert [(bundle.bundle_id, bundle.payload.get_identifier()) for bundle in bundles] == [(0, 0)]
+        assert len(model.payload_ids) == 1 and len(model.bundle_ids) == 1
+
+
+def test_ids_are_forgotten_once_expired():
+    # a drop is picked up at every step.
+    drops = [{"drop_id": step, "time": step, "pos": [100, 100], "target_id": 9} for step in range(200)]
+    model = make_model([make_agent(1, [100, 100]), make_agent(2, [150, 100])],
+                       data_drop_schedule=drops, payload_lifespan=20, bundle_lifespan=10)
+    model.agents[1].name = "C1"
+    num_ids = []
+    for _ in range(200):
+        model.step()
+        num_ids.append((len(model.payload_ids), len(model.bundle_ids)))
+
+    # only the ids of the unexpired payloads + bundles are kept, so the number of ids stays flat.
+    assert num_ids[50:] == [(20, 10)] * 150
+    assert model.payload_ids.get_id((199, 1, 9, 219), 219) == 199
+
+
+def test_metrics_leave_out_history(monkeypatch):
+    num_calls = []
+    get_state = AgentHistory.get_state
+    monkeypatch.setattr(AgentHistory, "get_state", lambda history: num_calls.append(1) or get_state(history))
+
+    # logging the metrics gets the state of every agent at every step, without serializing their histories.
+    model = make_model([make_agent(1, [100, 100]), make_agent(2, [150, 100])], log_metrics=True, max_steps=3)
+    for _ in range(3):
+        model.step()
+    assert not model.running
+    assert num_calls == []
+
+    # while the visualization still gets the whole history.
+    agent = model.agents[1]
+    assert len(agent.get_state()["history"]) == 3
+    assert "history" not in agent.get_state(include_history=False)
+    assert len(num_calls) == 1
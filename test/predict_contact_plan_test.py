@@ -0,0 +1,64 @@
+"""
+Tests that the contact plan predicted from the routers' movement patterns matches the one a simulation records.
+"""
+import json
+
+from model import LunarModel
+from predict_contact_plan import get_router_options, make_contact_plan, predict_contacts, predict_positions
+from run_model_vis import SIM_WIDTH, SIM_HEIGHT
+
+# test constants.
+NUM_STEPS = 400
+MODEL_PARAMS = {"max_steps": NUM_STEPS, "rssi_noise_stdev": 0, "model_speed_limit": 10, "make_contact_plan": 0}
+INITIAL_STATE = {
+    "agent_defaults": {"radio": {"detection_thresh": -60, "connection_thresh": -50}},
+    "agents": [
+        {"name": "R1", "type": "epidemic", "id": 1,
+         "movement": {"pattern": "fixed", "speed": 0, "options": {"pos": [300, 300]}}},
+        # teleports back to its first waypoint every time it reaches its last one.
+        {"name": "R2", "type": "epidemic", "id": 2,
+         "movement": {"pattern": "waypoints", "speed": 5,
+                      "options": {"waypoints": [[100, 300], [500, 300]], "repeat": True, "bounce": False}}},
+        # faster than the model speed limit:  its moves are refused once its waypoints are too far apart.
+        {"name": "R3", "type": "epidemic", "id": 3,
+         "movement": {"pattern": "waypoints", "speed": 12,
+                      "options": {"waypoints": [[300, 230], [300, 239], [300, 400]], "repeat": True, "bounce": True}}},
+        {"name": "R4", "type": "epidemic", "id": 4,
+         "movement": {"pattern": "circle", "speed": 3.5, "options": {"center": [300, 300], "radius": 150}}},
+        {"name": "R5", "type": "epidemic", "id": 5,
+         "movement": {"pattern": "waypoints", "speed": 8,
+                      "options": {"waypoints": [[700, 300], [350, 300]], "repeat": True, "bounce": True}}},
+    ],
+}
+
+
+def to_windows(contact_plan):
+    return sorted((contact["source"], contact["dest"], contact["startTime"], contact["endTime"])
+                  for contact in contact_plan["contacts"])
+
+
+def test_predicted_contact_plan_matches_simulation(tmp_path, monkeypatch):
+    # the simulation writes its contact plan to ./cp.json
+    monkeypatch.chdir(tmp_path)
+    model = LunarModel(size=(SIM_WIDTH, SIM_HEIGHT), model_params=dict(MODEL_PARAMS), initial_state=INITIAL_STATE)
+    for _ in range(NUM_STEPS):
+        model.step()
+    assert not model.running
+    with open(tmp_path / "cp.json", "r") as contact_plan_file:
+        simulated_contact_plan = json.load(contact_plan_file)
+
+    router_options = get_router_options(INITIAL_STATE)
+    positions = predict_positions(router_options, MODEL_PARAMS, NUM_STEPS)
+    predicted_contact_plan = make_contact_plan(predict_contacts(router_options, positions))
+
+    # the simulation writes contacts as they end + the prediction in order of their start, so only compare windows.
+    assert to_windows(predicted_contact_plan) == to_windows(simulated_contact_plan)
+    assert [contact["contact"] for contact in predicted_contact_plan["contacts"]] \
+           == list(range(len(predicted_contact_plan["contacts"])))
+
+    # the scenario covers teleports + refused moves.
+    assert positions[:, 1, 0].min() == 100 and positions[:, 1, 0].max() > 490
+    assert any(positions[step + 1, 1, 0] < positions[step, 1, 0] for step in range(NUM_STEPS - 1))
+    assert positions[-1, 2].tolist() == [300, 239]
+    # every router was in contact with another at some point.
+    assert {contact[0] for contact in to_windows(simulated_contact_plan)} == {1, 2, 3, 4, 5}
@@ -0,0 +1,112 @@
+"""
+Tests that the spatial indexes find the same neighbors as computing the RSSI of every pair of agents.
+"""
+import random
+
+import pytest
+
+from model import LunarModel
+from spatial_index import GridIndex, KdTreeIndex, make_spatial_index
+
+# test constants.
+SIZE = (1000, 1000)
+# at an RSSI noise of 0, agents detect each other up to exactly these distances.
+CUTOFF_60 = 10 ** 2.4   # detection threshold of -60
+CUTOFF_65 = 10 ** 2.6   # detection threshold of -65
+
+
+def make_agent(agent_id, pos, detection_thresh=-60):
+    return {
+        "name": "R{}".format(agent_id),
+        "type": "epidemic",
+        "id": agent_id,
+        "radio": {"detection_thresh": detection_thresh},
+        "movement": {"pattern": "fixed", "speed": 0, "options": {"pos": pos}},
+    }
+
+
+def make_model(spatial_index):
+    agents = [
+        # pairs exactly at the cutoff distance of their detection threshold.
+        make_agent(1, [0, 500], detection_thresh=-65),
+        make_agent(2, [CUTOFF_65, 500]),
+        make_agent(3, [0, 900]),
+        make_agent(4, [CUTOFF_60, 900]),
+        # moved onto cell borders below.
+        make_agent(5, [10, 10]),
+        make_agent(6, [20, 20]),
+        make_agent(7, [30, 30]),
+        make_agent(8, [40, 40]),
+        make_agent(9, [50, 50], detection_thresh=-65),
+    ]
+    model_params = {"max_steps": None, "rssi_noise_stdev": 0, "model_speed_limit": 10, "spatial_index": spatial_index}
+    initial_state = {"agent_defaults": {"radio": {"detection_thresh": -60, "connection_thresh": -50}}, "agents": agents}
+    return LunarModel(size=SIZE, model_params=model_params, initial_state=initial_state)
+
+
+def get_all_neighbors(model):
+    return {agent_id: model.get_neighbors(agent) for agent_id, agent in model.agents.items()}
+
+
+@pytest.mark.parametrize("spatial_index", ["grid", "kdtree"])
+def test_spatial_index_matches_dense(spatial_index):
+    dense_model = make_model(None)
+    indexed_model = make_model(spatial_index)
+    assert dense_model.link_state.spatial_index is None
+    assert make_model("dense").link_state.spatial_index is None
+    radius = indexed_model.link_state.spatial_index.radius
+    assert radius >= CUTOFF_65
+
+    dense_neighbors = get_all_neighbors(dense_model)
+    assert dense_neighbors == get_all_neighbors(indexed_model)
+    assert [n["id"] for n in dense_neighbors[1]] == [2]
+    assert [n["id"] for n in dense_neighbors[3]] == [4]
+
+    # agents on the borders of the grid cells, moved during the step + then seen at the next step.
+    border_positions = {
+        5: (radius, radius),
+        6: (2 * radius, radius),
+        7: (radius, 2 * radius - 100),
+        8: (radius - 150, radius + 100),
+        9: (2 * radius, 2 * radius),
+    }
+    for model in (dense_model, indexed_model):
+        for agent_id, pos in border_positions.items():
+            model.teleport_agent(model.agents[agent_id], pos)
+    dense_neighbors = get_all_neighbors(dense_model)
+    assert dense_neighbors == get_all_neighbors(indexed_model)
+    assert {5, 7} <= {n["id"] for n in dense_neighbors[8]}
+
+    for model in (dense_model, indexed_model):
+        model.link_state.invalidate()
+    assert get_all_neighbors(dense_model) == get_all_neighbors(indexed_model)
+
+
+@pytest.mark.parametrize("spatial_index", ["grid", "kdtree"])
+def test_spatial_index_matches_dense_after_moves(spatial_index):
+    move_random = random.Random(1234)
+    dense_model = make_model(None)
+    indexed_model = make_model(spatial_index)
+    for step in range(5):
+        for model in (dense_model, indexed_model):
+            model.step()
+        assert get_all_neighbors(dense_model) == get_all_neighbors(indexed_model)
+        index = indexed_model.link_state.spatial_index
+        tree = getattr(index, "tree", None)
+        assert (tree is not None) == (spatial_index == "kdtree")
+
+        # every agent moves during the step, some of them more than once.
+        for agent_id in list(range(1, 10)) + [move_random.randint(1, 9) for _ in range(6)]:
+            pos = (move_random.uniform(0, 600), move_random.uniform(0, 600))
+            for model in (dense_model, indexed_model):
+                model.teleport_agent(model.agents[agent_id], pos)
+            assert get_all_neighbors(dense_model) == get_all_neighbors(indexed_model)
+        # moves are answered without rebuilding the KD-tree.
+        assert getattr(index, "tree", None) is tree
+
+
+def test_make_spatial_index():
+    assert isinstance(make_spatial_index("grid", 10), GridIndex)
+    assert isinstance(make_spatial_index("kdtree", 10), KdTreeIndex)
+    with pytest.raises(ValueError):
+        make_spatial_index("octree", 10)